@@ -0,0 +1,164 @@
+"""
+Global admission control for chat generations.
+
+Every generation holds a worker thread, a database connection and an upstream
+call while it streams. Past a point, more concurrent generations only make all
+of them slower and push the provider into rate-limit errors. At most
+ADMISSION_MAX_IN_FLIGHT generations run at once; up to ADMISSION_QUEUE_SIZE
+more wait (in arrival order) for ADMISSION_QUEUE_TIMEOUT seconds. A request
+that finds the queue full is refused at once with 429, and one that waits past
+the deadline gets 503; both carry a Retry-After estimated from recent
+generation times.
+"""
+
+import asyncio
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Callable, Iterator, Optional
+
+import metrics
+from env import ADMISSION_MAX_IN_FLIGHT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT
+
+
+class AdmissionRejected(Exception):
+    """No generation slot: status is 429 (queue full) or 503 (waited too long)"""
+
+    def __init__(self, status_code: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A generation slot; release() may be called more than once"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._released = False
+        self.admitted_at = time.perf_counter()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.perf_counter() - self.admitted_at)
+
+
+class _Waiter:
+    def __init__(self, loop, future):
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+class AdmissionController:
+    """Counting semaphore with a bounded FIFO queue and a deadline for async callers"""
+
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, max_queue: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight  # 0 disables admission control
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._avg_seconds = 5.0  # Moving average of how long a generation holds its slot
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new request"""
+        if self.max_in_flight <= 0:
+            return 1
+        ahead = self.queued + 1
+        return max(1, min(60, math.ceil(self._avg_seconds * ahead / self.max_in_flight)))
+
+    async def acquire(self) -> Ticket:
+        """Wait for a slot; raises AdmissionRejected when the queue is full or the deadline passes"""
+        start = time.perf_counter()
+        with self._lock:
+            if self.max_in_flight <= 0 or (self.in_flight < self.max_in_flight and not self._waiters):
+                self.in_flight += 1
+                metrics.observe("admission.wait_seconds", 0.0)
+                return Ticket(self)
+            if len(self._waiters) >= self.max_queue:
+                metrics.inc("admission.rejected_queue_full")
+                raise AdmissionRejected(429, self.retry_after(), "Server is busy, please try again shortly.")
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+            if not waiter.granted:
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                metrics.inc("admission.rejected_timeout")
+                raise AdmissionRejected(503, self.retry_after(), "Server is busy, please try again shortly.")
+            # The slot was handed over just as the deadline passed
+            if isinstance(e, asyncio.CancelledError):
+                Ticket(self).release()
+                raise
+        metrics.observe("admission.wait_seconds", time.perf_counter() - start)
+        return Ticket(self)
+
+    def _release(self, held_seconds: float):
+        with self._lock:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * held_seconds
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter; in_flight stays the same
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            else:
+                self.in_flight -= 1
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def release_when_done(stream: Iterator[str], ticket: Ticket,
+                      on_done: Optional[Callable[[], None]] = None) -> Iterator[str]:
+    """
+    Yield the stream and give the slot back when it ends, or when it is dropped unread
+    (client gone before the first read). on_done, e.g. settling the turn's rate-limit
+    reservation, runs once at the same point.
+    """
+    finished = threading.Lock()
+
+    def done():
+        if not finished.acquire(blocking=False):
+            return
+        try:
+            if on_done is not None:
+                on_done()
+        finally:
+            ticket.release()
+
+    def admitted():
+        try:
+            yield from stream
+        finally:
+            done()
+
+    wrapped = admitted()
+    # A generator that is never started does not run its finally block
+    weakref.finalize(wrapped, done)
+    return wrapped
+
+
+# Shared controller used by the chat endpoints
+admission = AdmissionController()
+
+metrics.set_gauge("admission.in_flight", lambda: admission.in_flight)
+metrics.set_gauge("admission.queued", lambda: admission.queued)
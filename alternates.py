@@ -0,0 +1,182 @@
+"""
+Pre-sampled alternate replies for an instant retry (opt-in).
+
+Retry deletes the last reply and normally waits for a whole new completion.
+With PRESAMPLE_RETRY=true, once a reply has streamed to the end a
+low-priority background job asks the model for one more reply to the same
+context and keeps it for PRESAMPLE_TTL seconds. A retry whose context matches
+streams that alternate at once instead of calling the model.
+
+Extra spend is capped:
+  * jobs run one at a time, and only while the server has spare capacity
+    (admission control at most half full, nobody waiting);
+  * contexts over PRESAMPLE_MAX_PROMPT_TOKENS are not pre-sampled;
+  * all jobs share a budget of PRESAMPLE_TOKENS_PER_HOUR tokens.
+
+A new message or edit in the session cancels a running job and drops a stored
+alternate, and so does a retry (which then pre-samples for its own reply).
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+import metrics
+from admission import admission
+from ratelimit import MemoryBuckets
+from response_cache import content_of
+from env import PRESAMPLE_RETRY, PRESAMPLE_TOKENS_PER_HOUR, PRESAMPLE_MAX_PROMPT_TOKENS, PRESAMPLE_TTL
+
+# Jobs waiting for the background thread before new ones are skipped
+MAX_PENDING_JOBS = 4
+
+
+class _Job:
+    """One alternate reply being generated (or done) for a session"""
+
+    def __init__(self, key: str):
+        self.key = key  # Context the alternate answers (response_cache.context_key)
+        self.cancelled = threading.Event()
+        self.chunks = None  # Streamed content, once the alternate is complete
+        self.finished_at = None
+
+
+class Presampler:
+    """At most one alternate reply per session, generated in the background"""
+
+    def __init__(self, enabled: bool = PRESAMPLE_RETRY, tokens_per_hour: int = PRESAMPLE_TOKENS_PER_HOUR,
+                 max_prompt_tokens: int = PRESAMPLE_MAX_PROMPT_TOKENS, ttl_seconds: int = PRESAMPLE_TTL):
+        self.enabled = enabled
+        self.tokens_per_hour = tokens_per_hour
+        self.max_prompt_tokens = max_prompt_tokens
+        self.ttl_seconds = ttl_seconds
+
+        self._jobs = {}  # session_id -> _Job
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pool = None
+        self._budget = MemoryBuckets()
+
+    @property
+    def stored(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.chunks is not None)
+
+    def schedule(self, session_id: str, key: str, prompt_tokens: int, reply: str,
+                 create: Callable[[], Iterator], count_tokens: Callable[[str], int]) -> bool:
+        """Pre-sample an alternate to `reply` for the context `key`; False when skipped"""
+        if not self.enabled:
+            return False
+        if prompt_tokens > self.max_prompt_tokens:
+            metrics.inc("presample.skipped_long")
+            return False
+        if self._busy():
+            metrics.inc("presample.skipped_busy")
+            return False
+        # The alternate is charged as long as the reply it replaces until its real size is known
+        estimate = prompt_tokens + count_tokens(reply)
+        if self._take_budget(estimate, estimate):
+            metrics.inc("presample.skipped_budget")
+            return False
+
+        job = _Job(key)
+        with self._lock:
+            previous = self._jobs.get(session_id)
+            if previous is not None:
+                previous.cancelled.set()
+            self._jobs[session_id] = job
+            self._pending += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="presample")
+        self._pool.submit(self._run, session_id, job, prompt_tokens, reply, estimate, create, count_tokens)
+        return True
+
+    def take(self, session_id: str, key: str) -> Optional[List[str]]:
+        """The stored alternate for this session and context, or None; either way it is used up"""
+        with self._lock:
+            job = self._jobs.pop(session_id, None)
+        if job is not None:
+            # A job still running is of no use to this retry
+            job.cancelled.set()
+        fresh = job is not None and job.chunks is not None and time.time() - job.finished_at <= self.ttl_seconds
+        if not fresh or job.key != key:
+            metrics.inc("presample.misses")
+            return None
+        metrics.inc("presample.hits")
+        return job.chunks
+
+    def discard(self, session_id: str):
+        """Cancel the session's job and drop its alternate (the conversation moved on)"""
+        with self._lock:
+            job = self._jobs.pop(session_id, None)
+        if job is not None:
+            job.cancelled.set()
+
+    def clear(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancelled.set()
+            self._jobs.clear()
+        self._budget.clear()
+
+    def _busy(self) -> bool:
+        if self._pending >= MAX_PENDING_JOBS:
+            return True
+        limit = admission.max_in_flight
+        return limit > 0 and (admission.queued > 0 or admission.in_flight > limit // 2)
+
+    def _take_budget(self, tokens: int, required: Optional[int]) -> float:
+        per_hour = self.tokens_per_hour
+        return self._budget.take("presample", tokens, per_hour, per_hour / 3600, required)
+
+    def _run(self, session_id: str, job: _Job, prompt_tokens: int, reply: str, estimate: int,
+             create: Callable[[], Iterator], count_tokens: Callable[[str], int]):
+        chunks = []
+        started = False
+        try:
+            # Cancelled, or the server got busy, while waiting for the thread: nothing is spent
+            if job.cancelled.is_set() or self._busy():
+                return
+            started = True
+            stream = create()
+            try:
+                for event in stream:
+                    if job.cancelled.is_set():
+                        metrics.inc("presample.cancelled")
+                        return
+                    content = content_of(event)
+                    if content:
+                        chunks.append(content)
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+
+            text = "".join(chunks)
+            if not text.strip() or text == reply:
+                # Nothing a retry could use
+                metrics.inc("presample.discarded")
+                return
+            with self._lock:
+                if self._jobs.get(session_id) is job and not job.cancelled.is_set():
+                    job.chunks, job.finished_at = chunks, time.time()
+                    metrics.inc("presample.stored")
+                    print(f"⚡ Pre-sampled an alternate reply for session {session_id[:8]}...")
+        except Exception as e:
+            metrics.inc("presample.failed")
+            print(f"⚠️ Pre-sampling an alternate reply failed: {e}")
+        finally:
+            used = prompt_tokens + count_tokens("".join(chunks)) if started else 0
+            self._take_budget(used - estimate, None)
+            metrics.inc("presample.tokens", used)
+            with self._lock:
+                self._pending -= 1
+                if job.chunks is None and self._jobs.get(session_id) is job:
+                    del self._jobs[session_id]
+
+
+# Shared pre-sampler used by the chat streams
+presampler = Presampler()
+
+metrics.set_gauge("presample.alternates", lambda: presampler.stored)
@@ -1,107 +1,345 @@
-from fastapi import FastAPI, Depends, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, Header, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
-from sqlalchemy.orm import Session
-from openai import OpenAI
-from env import OPENAI_API_KEY
-from database import ChatMessage, get_db, SessionLocal
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from env import (
+    OPENAI_API_KEY, DB_CREATE_TABLES, WARMUP_DB_CONNECTIONS, WARMUP_UPSTREAM,
+    MAX_AUDIO_UPLOAD_BYTES, MAX_AUDIO_DURATION_SECONDS, SPEECH_TRANSCRIBE_WORKERS,
+)
+from database import (
+    ChatMessage, RequestSession, edit_last_user_message, delete_last_assistant_message,
+    get_history_page, warm_pool, init_db,
+)
+from message_writer import message_writer
+from transcription_cache import transcription_cache, cache_key
+from live_transcription import LiveTranscription
+from idempotency import idempotency_store, IdempotencyConflict, request_fingerprint, run_flight
+from generations import generations, Generation, GenerationBusy
+from admission import admission, AdmissionRejected, release_when_done
+from ratelimit import rate_limiter
+from upstream import upstream
+from response_cache import response_cache, context_key
+from alternates import presampler
 
+import audio_preprocess
+import metrics
+import asyncio
+import time
 import uuid
 import json
 import threading
 import tempfile
 import os
-import tiktoken
 
 # Configuration
 MAX_HISTORY_TOKENS = 11000  # Keep recent 11000 tokens of history
 MAX_USER_MESSAGE_TOKENS = 1200  # Maximum tokens for user message
 MAX_MODEL_RESPONSE_TOKENS = 4096  # Maximum tokens for model response per message
 MODEL_NAME = "gpt-3.5-turbo"  # Model name for tiktoken encoding
+WHISPER_MODEL = "whisper-1"  # Speech-to-text model
+
+# tiktoken encoder for gpt-3.5-turbo, imported and loaded on first use
+# The BPE file is read from TIKTOKEN_CACHE_DIR (pre-populated in the Docker image),
+# so importing this module never touches the network
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def get_encoding():
+    """Return the tiktoken encoding, loading it on first call"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                import tiktoken
 
-# Initialize tiktoken encoder for gpt-3.5-turbo
-try:
-    encoding = tiktoken.encoding_for_model(MODEL_NAME)
-except:
-    # Fallback to cl100k_base encoding (used by gpt-3.5-turbo)
-    encoding = tiktoken.get_encoding("cl100k_base")
+                start = time.perf_counter()
+                try:
+                    encoding = tiktoken.encoding_for_model(MODEL_NAME)
+                except:
+                    # Fallback to cl100k_base encoding (used by gpt-3.5-turbo)
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                elapsed = time.perf_counter() - start
+                metrics.observe("tokenizer.load_seconds", elapsed)
+                print(f"🔤 Loaded tokenizer '{encoding.name}' in {elapsed * 1000:.0f} ms")
+                _encoding = encoding
+    return _encoding
 
 def count_tokens(text: str) -> int:
     """Count tokens accurately using tiktoken"""
     if not text:
         return 0
-    return len(encoding.encode(text))
+    return len(get_encoding().encode(text))
 
 def count_message_tokens(message: dict) -> int:
     """Count tokens for a message dict (role + content)"""
-    role_tokens = len(encoding.encode(message.get("role", "")))
+    role_tokens = len(get_encoding().encode(message.get("role", "")))
     content_tokens = count_tokens(message.get("content", ""))
     # Add overhead for message formatting (approximately 4 tokens per message)
     return role_tokens + content_tokens + 4
 
-# Global dictionary to track active streaming sessions and cancellation flags
-# Format: {session_id: threading.Event()}
-streaming_sessions = {}
-streaming_lock = threading.Lock()
+# OpenAI client, created on first use so importing this module stays cheap
+_client = None
+_client_lock = threading.Lock()
 
-# Create a client object for the OpenAI API
-client = OpenAI(api_key=OPENAI_API_KEY)
+def get_client():
+    """Return the shared OpenAI client, importing the SDK on first call"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
 
-# Initialize the FastAPI App
-app = FastAPI(title="LLM Chat Interface")
+                _client = OpenAI(api_key=OPENAI_API_KEY)
+    return _client
 
-# ADD CORS Middleware, allow frontend to access backend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins (for development)
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods (GET, POST, etc.)
-    allow_headers=["*"],  # Allows all headers
-)
+# Startup warm-up state, reported by GET /ready
+warmup_state = {"ready": False, "steps": {}, "errors": {}}
+
+def warm_up():
+    """Pay the cold-start costs (tokenizer, DB connections, upstream TLS) before serving traffic"""
+    warmup_state.update({"ready": False, "steps": {}, "errors": {}})
+    steps = [
+        ("tokenizer", lambda: count_tokens("warm up")),
+        ("database", lambda: warm_pool(WARMUP_DB_CONNECTIONS)),
+    ]
+    if WARMUP_UPSTREAM:
+        # Any cheap authenticated call opens a keep-alive connection in the client's pool
+        steps.append(("upstream", lambda: get_client().models.list()))
+    if transcription_cache.persist:
+        steps.append(("transcription_cache", transcription_cache.purge_expired))
+
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            warmup_state["errors"][name] = str(e)
+            print(f"⚠️ Warm-up step '{name}' failed: {str(e)}")
+        finally:
+            warmup_state["steps"][name] = round(time.perf_counter() - start, 3)
+
+    # The upstream keep-alive is best effort; tokenizer and database are required
+    warmup_state["ready"] = not any(name in warmup_state["errors"] for name in ("tokenizer", "database"))
+    print(f"🔥 Warm-up finished: {warmup_state['steps']} (ready: {warmup_state['ready']})")
 
-@app.get("/")
+def create_tables():
+    """Create missing tables before the first request (a fresh deploy has none)"""
+    for attempt in range(2):
+        try:
+            init_db()
+            return
+        except Exception as e:
+            # Another worker may have been creating the same tables; the second pass sees them
+            print(f"⚠️ Creating tables failed (attempt {attempt + 1}/2): {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    message_writer.open()
+    if DB_CREATE_TABLES:
+        await asyncio.to_thread(create_tables)
+    # Warm up in the background so liveness (GET /) answers immediately
+    warmup_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    await warmup_task
+    # Drain queued assistant messages before the worker exits
+    message_writer.close()
+
+# Routes are collected on a router and mounted by create_app()
+router = APIRouter()
+
+# Liveness: the process is up
+@router.get("/")
 def health():
     return {"status": "running"}
 
+# Readiness: warm-up finished and the database is reachable
+@router.get("/ready")
+def ready():
+    if warmup_state["ready"]:
+        status = "ready"
+    elif warmup_state["errors"]:
+        status = "degraded"
+    else:
+        status = "starting"
+    body = {"status": status, **warmup_state}
+    return JSONResponse(body, status_code=200 if warmup_state["ready"] else 503)
+
+@router.get("/metrics")
+def get_metrics():
+    """In-process metrics (write-behind queue depth, flush timings, ...)"""
+    return metrics.snapshot()
+
 # Request Schema
 class ChatRequest(BaseModel):
     session_id: str
     message: str
 
-def chat_stream(session_id: str, user_message: str, db: Session):
+def client_ip(connection) -> Optional[str]:
+    """Address of the HTTP or WebSocket client, for per-IP rate limiting"""
+    return connection.client.host if connection.client else None
+
+async def admit(generation: Generation, make_stream, ip: Optional[str], message: str):
+    """Charge the turn to its rate-limit buckets, wait for an admission slot and create its stream"""
+    def charge():
+        # Tokenizing a long message is CPU work too, so it runs off the event loop with the charge
+        return rate_limiter.charge(generation.session_id, ip, count_tokens(message))
+
+    reservation = await asyncio.to_thread(charge)
+    try:
+        ticket = await admission.acquire()
+    except BaseException:
+        # Refused or cancelled before reaching upstream: nothing was used
+        await asyncio.to_thread(reservation.cancel)
+        raise
+    # Settled with the upstream tokens really used when the stream ends or is dropped unread
+    return release_when_done(make_stream(generation), ticket,
+                             lambda: reservation.settle(generation.upstream_tokens))
+
+async def start_turn(endpoint: str, session_id: str, key: Optional[str], fingerprint: str, make_stream,
+                     ip: Optional[str] = None, message: str = ""):
+    """
+    Start a turn as a new generation: run make_stream(generation) once per idempotency key
+    and return (lines, generation id, error).
+
+    A duplicate of a turn that is still streaming attaches to it; a duplicate of a finished
+    turn replays its lines (both report the original generation id). Without a key the
+    stream runs as usual. New generations are charged to the session's and the client's
+    token buckets and then wait for a slot from the admission controller; either raises
+    AdmissionRejected (RateLimited for the buckets) when the turn may not run now.
+    """
+    generation = Generation(session_id)
+    if not key or not key.strip():
+        return await admit(generation, make_stream, ip, message), generation.id, None
+    scope = f"{endpoint}:{session_id}:{key.strip()}"
+    try:
+        flight, started = idempotency_store.begin(scope, fingerprint, generation.id)
+    except IdempotencyConflict:
+        return None, None, "Idempotency-Key was already used for a different request"
+    if not started:
+        print(f"🔁 Duplicate {endpoint} request for session {session_id[:8]}...: "
+              f"{'replaying finished' if flight.done else 'attaching to in-flight'} response")
+        return flight.replay(), flight.generation_id, None
+
+    try:
+        stream = await admit(generation, make_stream, ip, message)
+    except (AdmissionRejected, asyncio.CancelledError) as e:
+        # Requests attached to this flight get the refusal too; the key can be retried
+        flight.append(json.dumps({"error": str(e) or "Request cancelled"}) + "\n")
+        idempotency_store.complete(scope, flight)
+        raise
+    # An error after the turn changed stored rows is replayed: running it again would duplicate them
+    run_flight(idempotency_store, scope, flight, stream, lambda: not generation.committed)
+    return flight.replay(), generation.id, None
+
+def busy_response(rejection: AdmissionRejected) -> JSONResponse:
+    """429 (over the token budget or queue full) or 503 (waited too long) with Retry-After"""
+    print(f"🚦 Chat request refused ({rejection.status_code}, {rejection}): "
+          f"{admission.in_flight} in flight, {admission.queued} queued")
+    return JSONResponse({"error": str(rejection), "retry_after": rejection.retry_after},
+                        status_code=rejection.status_code, headers={"Retry-After": str(rejection.retry_after)})
+
+def completion_factory(chat_history: list):
+    """The model call for chat_history, made once per attempt"""
+    def create():
+        return get_client().chat.completions.create(
+            model=MODEL_NAME,
+            messages=chat_history,
+            stream=True,
+            max_tokens=MAX_MODEL_RESPONSE_TOKENS  # Limit response to 4096 tokens
+        )
+    return create
+
+def open_completion(chat_history: list, generation: Generation, session_id: str, retry: bool = False):
+    """
+    Stream the reply to chat_history: for a retry, the alternate pre-sampled for this context
+    (alternates.py); otherwise a cached reply when this exact context was answered before
+    (response_cache.py). Failing that, a model call, retried with jittered backoff (and
+    hedged, if enabled) until its first token
+    """
+    create = completion_factory(chat_history)
+    key = context_key(MODEL_NAME, chat_history, max_tokens=MAX_MODEL_RESPONSE_TOKENS)
+
+    if retry:
+        # A retry asks for a different answer, so it never uses the response cache
+        alternate = presampler.take(session_id, key) if presampler.enabled else None
+        if alternate is not None:
+            generation.cached = True
+            print("⚡ Retrying with a pre-sampled alternate reply")
+            return response_cache.replay(alternate, generation.stop_event)
+        return upstream.open_stream(create, generation.stop_event)
+
+    # A new message or edit makes an alternate for the previous context useless
+    presampler.discard(session_id)
+    if not response_cache.enabled:
+        return upstream.open_stream(create, generation.stop_event)
+
+    cached = response_cache.get(key)
+    if cached is not None:
+        chunks, tokens = cached
+        generation.cached = True
+        print(f"♻️ Replaying cached reply ({tokens} tokens saved)")
+        return response_cache.replay(chunks, generation.stop_event)
+    return response_cache.record(key, upstream.open_stream(create, generation.stop_event),
+                                 lambda: generation.prompt_tokens + generation.completion_tokens)
+
+def reply_key(message: str) -> str:
+    """Key a complete reply to this wording is kept under (with the id of the user message it answers)"""
+    return context_key(MODEL_NAME, [{"role": "user", "content": message}])
+
+def presample_alternate(session_id: str, chat_history: list, reply: str, prompt_tokens: int):
+    """Pre-sample another reply to this context for an instant retry (off unless PRESAMPLE_RETRY)"""
+    if presampler.enabled:
+        key = context_key(MODEL_NAME, chat_history, max_tokens=MAX_MODEL_RESPONSE_TOKENS)
+        presampler.schedule(session_id, key, prompt_tokens, reply, completion_factory(chat_history), count_tokens)
+
+def chat_stream(session_id: str, user_message: str, db: RequestSession, generation: Optional[Generation] = None):
     # Trim whitespace from session_id to ensure proper matching
     session_id = session_id.strip() if isinstance(session_id, str) else str(session_id).strip()
     
-    # Create cancellation event for this session
-    with streaming_lock:
-        stop_event = threading.Event()
-        streaming_sessions[session_id] = stop_event
-    
-    # Create a new database session for this generator to avoid session closure issues
-    local_db = SessionLocal()
+    # One generation at a time per session (GENERATION_POLICY in generations.py)
+    generation = generation or Generation(session_id)
+    try:
+        generations.acquire(generation)
+    except GenerationBusy as e:
+        db.close()
+        yield json.dumps({"error": str(e)}) + "\n"
+        return
+    stop_event = generation.stop_event
     
     try:
+        if not generation.started:
+            # Stopped while waiting for the previous response
+            yield json.dumps({"stopped": True, "partial_content": ""}) + "\n"
+            return
+        # This session's queued replies go in first, so the history below includes them
+        message_writer.write_session(session_id, db)
+        
         # Save user message first (so it can be edited later even if too long)
         user_msg = ChatMessage(
             session_id=session_id,
             role="user",
             content=user_message
         )
-        local_db.add(user_msg)
-        local_db.commit()
+        db.add(user_msg)
         
         # Check user message token count (max 1200 tokens)
         user_message_tokens = count_tokens(user_message)
         if user_message_tokens > MAX_USER_MESSAGE_TOKENS:
+            db.commit()
+            generation.committed = True
             error_msg = "The message you submitted was too long, please edit it and resubmit."
             yield json.dumps({"error": error_msg}) + "\n"
             return
 
+        # Insert the user message and load history in the same transaction (one connection checkout)
+        db.flush()
+
         # Load chat history - limit to recent 11000 tokens
         all_messages = (
-            local_db.query(ChatMessage)
+            db.query(ChatMessage)
             .filter(ChatMessage.session_id == session_id)
             .order_by(ChatMessage.created_at)
             .all()
@@ -112,6 +350,13 @@ def chat_stream(session_id: str, user_message: str, db: Session):
             {"role": m.role, "content": m.content}
             for m in all_messages
         ]
+        # A complete reply is kept for this wording of the message, for edits back to it
+        variant_key, reply_to = reply_key(user_message), user_msg.id
+        
+        # Commit and return the pooled connection before the long upstream call
+        db.commit()
+        generation.committed = True
+        db.release()
         
         # Truncate history to keep recent 11000 tokens
         # Start from the end and work backwards, keeping messages until limit reached
@@ -134,18 +379,14 @@ def chat_stream(session_id: str, user_message: str, db: Session):
         else:
             print(f"📊 Using full chat history: {len(chat_history)} messages (~{total_tokens} tokens)")
 
+        generation.prompt_tokens = total_tokens  # Settled against the rate limit when the turn ends
         assistant_text = ""
         response_token_count = 0  # Track token count for response
 
         try:
             # Call OpenAI's streaming chat API with error handling
             try:
-                stream = client.chat.completions.create(
-                    model=MODEL_NAME,
-                    messages=chat_history,
-                    stream=True,
-                    max_tokens=MAX_MODEL_RESPONSE_TOKENS  # Limit response to 4096 tokens
-                )
+                stream = open_completion(chat_history, generation, session_id)
             except Exception as api_error:
                 error_msg = str(api_error)
                 # Handle common OpenAI API errors
@@ -167,17 +408,12 @@ def chat_stream(session_id: str, user_message: str, db: Session):
                 for event in stream:
                     # Check if streaming was cancelled (check frequently)
                     if stop_event.is_set():
+                        # Queue content (even if blank) when stopped - frontend will handle blank display
+                        # Queued before the stop frame so it is kept even if the client disconnects on it
+                        message_writer.enqueue(session_id, "assistant", assistant_text)  # Can be empty string if stopped early
                         # Send stop signal immediately - this will be sent to frontend
                         # The frontend should detect this and stop reading
                         yield json.dumps({"stopped": True, "partial_content": assistant_text}) + "\n"
-                        # Save content (even if blank) when stopped - frontend will handle blank display
-                        assistant_msg = ChatMessage(
-                            session_id=session_id,
-                            role="assistant",
-                            content=assistant_text  # Can be empty string if stopped early
-                        )
-                        local_db.add(assistant_msg)
-                        local_db.commit()
                         # Break out of loop - this will end the generator and close the stream
                         break
                     
@@ -189,11 +425,13 @@ def chat_stream(session_id: str, user_message: str, db: Session):
                             
                             # Check token count - stop if exceeds 4096 tokens
                             response_token_count = count_tokens(assistant_text)
+                            generation.completion_tokens = response_token_count
                             if response_token_count >= MAX_MODEL_RESPONSE_TOKENS:
                                 # Stop streaming when limit reached
                                 yield json.dumps({"token": content}) + "\n"
                                 # Send final content and stop signal
                                 yield json.dumps({"stopped": True, "partial_content": assistant_text, "reason": "token_limit"}) + "\n"
+                                variant_key = None  # A cut-off reply is not kept for reuse
                                 break
                             
                             # Sends each token to the client immediately
@@ -201,16 +439,9 @@ def chat_stream(session_id: str, user_message: str, db: Session):
             except Exception as stream_error:
                 # If stream was interrupted (e.g., connection closed), handle gracefully
                 if stop_event.is_set():
-                    # Stop was requested, save content (even if blank)
+                    # Stop was requested, queue content (even if blank) - frontend will handle blank display
+                    message_writer.enqueue(session_id, "assistant", assistant_text)  # Can be empty string if stopped early
                     yield json.dumps({"stopped": True, "partial_content": assistant_text}) + "\n"
-                    # Save content (even if blank) when stopped - frontend will handle blank display
-                    assistant_msg = ChatMessage(
-                        session_id=session_id,
-                        role="assistant",
-                        content=assistant_text  # Can be empty string if stopped early
-                    )
-                    local_db.add(assistant_msg)
-                    local_db.commit()
                     return  # Exit generator - this closes the stream
                 raise  # Re-raise if not a stop request
 
@@ -224,14 +455,10 @@ def chat_stream(session_id: str, user_message: str, db: Session):
                     # This shouldn't happen due to the check above, but safety measure
                     print(f"⚠️ Response exceeded token limit ({final_token_count} > {MAX_MODEL_RESPONSE_TOKENS}), truncating")
                 
-                assistant_msg = ChatMessage(
-                    session_id=session_id,
-                    role="assistant",
-                    content=assistant_text
-                )
-                local_db.add(assistant_msg)
-                local_db.commit()
-                print(f"✅ Saved assistant response: {final_token_count} tokens")
+                # Handed to the write-behind queue so the stream can end without waiting on the DB
+                message_writer.enqueue(session_id, "assistant", assistant_text, variant_key=variant_key, reply_to=reply_to)
+                print(f"✅ Queued assistant response: {final_token_count} tokens")
+                presample_alternate(session_id, chat_history, assistant_text, total_tokens)
         except Exception as e:
             # Handle errors from the OpenAI API call or streaming
             yield json.dumps({"error": str(e)}) + "\n"
@@ -243,19 +470,22 @@ def chat_stream(session_id: str, user_message: str, db: Session):
     finally:
         # Clean up database session
         try:
-            local_db.close()
+            db.close()
         except:
             pass
         
-        # Clean up streaming session
-        with streaming_lock:
-            if session_id in streaming_sessions:
-                del streaming_sessions[session_id]
+        # Let the next generation for this session start
+        generations.release(generation)
 
 # Chat API Endpoint
-@app.post("/chat/")
-# Get database session
-async def chat(data: ChatRequest, db: Session = Depends(get_db)):
+@router.post("/chat/")
+async def chat(data: ChatRequest, request: Request, idempotency_key: Optional[str] = Header(None)):
+    """
+    Save the user message and stream the reply as NDJSON.
+
+    Send an Idempotency-Key header to make re-submits safe: a repeat of a turn that is still
+    streaming shares its stream, and a repeat of a recent finished turn replays the result.
+    """
     if not data.message.strip():
         return {"error": "Message cannot be empty."}
 
@@ -268,51 +498,71 @@ async def chat(data: ChatRequest, db: Session = Depends(get_db)):
     else:
         session_id = str(uuid.uuid4())
 
-    # Stream response token by token back to the client
-    return StreamingResponse(
-        chat_stream(session_id, data.message, db),
-        media_type="text/event-stream"
-    )
+    try:
+        stream, generation_id, error = await start_turn(
+            "chat", session_id, idempotency_key, request_fingerprint(data.message),
+            lambda generation: chat_stream(session_id, data.message, RequestSession(), generation),
+            client_ip(request), data.message)
+    except AdmissionRejected as rejection:
+        return busy_response(rejection)
+    if error:
+        return JSONResponse({"error": error}, status_code=422)
 
-def chat_edit_stream(session_id: str, edited_message: str, db: Session):
+    # Stream response token by token back to the client; stop requests may name the generation
+    return StreamingResponse(stream, media_type="text/event-stream", headers={"X-Generation-Id": generation_id})
+
+def chat_edit_stream(session_id: str, edited_message: str, db: RequestSession, generation: Optional[Generation] = None):
     """Edit the last user message and regenerate bot response - UPDATES existing records"""
     # Trim whitespace from session_id to ensure proper matching
     session_id = session_id.strip() if isinstance(session_id, str) else str(session_id).strip()
     
-    # Create cancellation event for this session
-    with streaming_lock:
-        stop_event = threading.Event()
-        streaming_sessions[session_id] = stop_event
-    
-    # Create a new database session for this generator to avoid session closure issues
-    local_db = SessionLocal()
+    # One generation at a time per session (GENERATION_POLICY in generations.py)
+    generation = generation or Generation(session_id)
+    try:
+        generations.acquire(generation)
+    except GenerationBusy as e:
+        db.close()
+        yield json.dumps({"error": str(e)}) + "\n"
+        return
+    stop_event = generation.stop_event
     
     try:
+        if not generation.started:
+            # Stopped while waiting for the previous response
+            yield json.dumps({"stopped": True, "partial_content": ""}) + "\n"
+            return
         # Validate session_id
         if not session_id or not isinstance(session_id, str) or len(session_id) == 0:
             yield json.dumps({"error": "Invalid session ID provided"}) + "\n"
             return
         
-        # Get the last user message from database
-        last_user = (
-            local_db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .filter(ChatMessage.role == "user")
-            .order_by(ChatMessage.created_at.desc())
-            .first()
-        )
+        # Check edited message token count before touching the database (max 1200 tokens)
+        edited_message_tokens = count_tokens(edited_message)
+        if edited_message_tokens > MAX_USER_MESSAGE_TOKENS:
+            error_msg = "The message you submitted was too long, please edit it and resubmit."
+            yield json.dumps({"error": error_msg}) + "\n"
+            return
         
-        if not last_user:
+        # This session's queued replies go in first, so the edit sees (and replaces) them
+        message_writer.write_session(session_id, db)
+        
+        # UPDATE the last user message (same record, new content), DELETE the last assistant
+        # message (will be regenerated) and load the remaining history in one transaction;
+        # the same statement reads the reply kept for this wording, if it was answered before
+        wanted_key = reply_key(edited_message)
+        edit = edit_last_user_message(db, session_id, edited_message, variant_key=wanted_key)
+        
+        if edit is None:
             # Check if session exists at all
             session_exists = (
-                local_db.query(ChatMessage)
+                db.query(ChatMessage)
                 .filter(ChatMessage.session_id == session_id)
                 .first()
             )
             if not session_exists:
                 # Log for debugging - check if there are any similar session IDs
                 similar_sessions = (
-                    local_db.query(ChatMessage.session_id)
+                    db.query(ChatMessage.session_id)
                     .distinct()
                     .limit(5)
                     .all()
@@ -324,50 +574,30 @@ def chat_edit_stream(session_id: str, edited_message: str, db: Session):
             else:
                 yield json.dumps({"error": "No user message found to edit in this session"}) + "\n"
             return
-        
-        # Check edited message token count before updating (max 1000 tokens)
-        edited_message_tokens = count_tokens(edited_message)
-        if edited_message_tokens > MAX_USER_MESSAGE_TOKENS:
-            error_msg = "The message you submitted was too long, please edit it and resubmit."
-            yield json.dumps({"error": error_msg}) + "\n"
+        if edit["unchanged"]:
+            # The exact wording of a message whose reply streamed to the end: nothing was
+            # rewritten and nothing is regenerated
+            generation.cached = True  # No upstream tokens used
+            print(f"✏️ Backend: edit leaves the message unchanged, returning the existing reply")
+            yield json.dumps({"token": edit["variant"]}) + "\n"
             return
+        generation.committed = True
         
-        # UPDATE the existing user message content (don't create new)
-        old_content = last_user.content
-        last_user.content = edited_message
-        local_db.commit()
-        print(f"✏️ Backend: UPDATED user message ID {last_user.id}")
-        print(f"   Old: '{old_content[:50]}...'")
+        print(f"✏️ Backend: UPDATED user message ID {edit['user_id']}")
         print(f"   New: '{edited_message[:50]}...'")
+        if edit["assistant_id"] is not None:
+            print(f"🗑️ Backend: DELETED assistant message ID {edit['assistant_id']}")
         
-        # DELETE the last assistant message (will be regenerated)
-        last_assistant = (
-            local_db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .filter(ChatMessage.role == "assistant")
-            .order_by(ChatMessage.created_at.desc())
-            .first()
-        )
+        # All remaining messages for context - limit to recent 11000 tokens
+        all_messages = edit["messages"]
+        chat_history = list(all_messages)
         
-        if last_assistant:
-            assistant_id = last_assistant.id
-            local_db.delete(last_assistant)
-            local_db.commit()
-            print(f"🗑️ Backend: DELETED assistant message ID {assistant_id}")
+        # A reply kept for this wording (read by the same statement) is reused; a new one is kept
+        variant = edit["variant"]
+        variant_key = None if variant is not None else wanted_key
         
-        # Get all remaining messages for context - limit to recent 11000 tokens
-        all_messages = (
-            local_db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .order_by(ChatMessage.created_at)
-            .all()
-        )
-        
-        # Convert to chat history format
-        chat_history = [
-            {"role": m.role, "content": m.content}
-            for m in all_messages
-        ]
+        # Return the pooled connection before the long upstream call
+        db.release()
         
         # Truncate history to keep recent 11000 tokens
         total_tokens = 0
@@ -395,18 +625,21 @@ def chat_edit_stream(session_id: str, edited_message: str, db: Session):
         
         print(f"📊 Backend: Generating new response with {len(chat_history)} messages in history")
         
+        generation.prompt_tokens = total_tokens  # Settled against the rate limit when the turn ends
         assistant_text = ""
         response_token_count = 0  # Track token count for response
         
         try:
             # Stream response from OpenAI with error handling
             try:
-                stream = client.chat.completions.create(
-                    model=MODEL_NAME,
-                    messages=chat_history,
-                    stream=True,
-                    max_tokens=MAX_MODEL_RESPONSE_TOKENS  # Limit response to 4096 tokens
-                )
+                if variant is not None:
+                    # Back to an earlier wording: its reply comes back without a model call
+                    generation.cached = True
+                    presampler.discard(session_id)
+                    print(f"♻️ Backend: reusing the reply to an earlier wording of this message")
+                    stream = response_cache.replay([variant], stop_event)
+                else:
+                    stream = open_completion(chat_history, generation, session_id)
             except Exception as api_error:
                 error_msg = str(api_error)
                 # Handle common OpenAI API errors
@@ -426,14 +659,8 @@ def chat_edit_stream(session_id: str, edited_message: str, db: Session):
             for chunk in stream:
                 # Check if streaming should be stopped
                 if stop_event.is_set():
-                    # Save content (even if blank) when stopped - frontend will handle blank display
-                    assistant_msg = ChatMessage(
-                        session_id=session_id,
-                        role="assistant",
-                        content=assistant_text  # Can be empty string if stopped early
-                    )
-                    local_db.add(assistant_msg)
-                    local_db.commit()
+                    # Queue content (even if blank) when stopped - frontend will handle blank display
+                    message_writer.enqueue(session_id, "assistant", assistant_text)  # Can be empty string if stopped early
                     yield json.dumps({"partial_content": assistant_text}) + "\n"
                     yield json.dumps({"stopped": True}) + "\n"
                     break
@@ -444,26 +671,24 @@ def chat_edit_stream(session_id: str, edited_message: str, db: Session):
                     
                     # Check token count - stop if exceeds 4096 tokens
                     response_token_count = count_tokens(assistant_text)
+                    generation.completion_tokens = response_token_count
                     if response_token_count >= MAX_MODEL_RESPONSE_TOKENS:
                         # Stop streaming when limit reached
                         yield json.dumps({"token": token}) + "\n"
                         yield json.dumps({"stopped": True, "partial_content": assistant_text, "reason": "token_limit"}) + "\n"
+                        variant_key = None  # A cut-off reply is not kept for reuse
                         break
                     
                     yield json.dumps({"token": token}) + "\n"
             
-            # If stream completed normally (not stopped), save the complete response
-            # If stopped, message was already saved above
+            # If stream completed normally (not stopped), queue the complete response
+            # If stopped, message was already queued above
             if not stop_event.is_set() and assistant_text:
-                assistant_msg = ChatMessage(
-                    session_id=session_id,
-                    role="assistant",
-                    content=assistant_text
-                )
-                local_db.add(assistant_msg)
-                local_db.commit()
-                print(f"✅ Backend: SAVED new assistant message ID {assistant_msg.id}")
+                message_writer.enqueue(session_id, "assistant", assistant_text, variant_key=variant_key,
+                                       reply_to=edit["user_id"])
+                print(f"✅ Backend: QUEUED new assistant message")
                 print(f"   Content: '{assistant_text[:50]}...'")
+                presample_alternate(session_id, chat_history, assistant_text, total_tokens)
                 
         except Exception as e:
             yield json.dumps({"error": f"Error during streaming: {str(e)}"}) + "\n"
@@ -473,19 +698,17 @@ def chat_edit_stream(session_id: str, edited_message: str, db: Session):
     finally:
         # Clean up database session
         try:
-            local_db.close()
+            db.close()
         except:
             pass
         
-        # Clean up streaming session
-        with streaming_lock:
-            if session_id in streaming_sessions:
-                del streaming_sessions[session_id]
+        # Let the next generation for this session start
+        generations.release(generation)
 
 # Edit API Endpoint
-@app.post("/chat/edit/")
-async def chat_edit(data: ChatRequest, db: Session = Depends(get_db)):
-    """Edit the last user message and regenerate bot response"""
+@router.post("/chat/edit/")
+async def chat_edit(data: ChatRequest, request: Request, idempotency_key: Optional[str] = Header(None)):
+    """Edit the last user message and regenerate bot response (Idempotency-Key as for /chat/)"""
     if not data.session_id:
         return {"error": "Session ID is required for edit"}
     
@@ -496,56 +719,57 @@ async def chat_edit(data: ChatRequest, db: Session = Depends(get_db)):
     session_id = data.session_id.strip() if isinstance(data.session_id, str) else str(data.session_id).strip()
     edited_message = data.message
     
-    # Stream response token by token back to the client
-    return StreamingResponse(
-        chat_edit_stream(session_id, edited_message, db),
-        media_type="text/event-stream"
-    )
+    try:
+        stream, generation_id, error = await start_turn(
+            "edit", session_id, idempotency_key, request_fingerprint(edited_message),
+            lambda generation: chat_edit_stream(session_id, edited_message, RequestSession(), generation),
+            client_ip(request), edited_message)
+    except AdmissionRejected as rejection:
+        return busy_response(rejection)
+    if error:
+        return JSONResponse({"error": error}, status_code=422)
+
+    # Stream response token by token back to the client; stop requests may name the generation
+    return StreamingResponse(stream, media_type="text/event-stream", headers={"X-Generation-Id": generation_id})
 
-def chat_retry_stream(session_id: str, db: Session):
+def chat_retry_stream(session_id: str, db: RequestSession, generation: Optional[Generation] = None):
     """Retry the last assistant message by deleting it and regenerating"""
     # Trim whitespace from session_id to ensure proper matching
     session_id = session_id.strip() if isinstance(session_id, str) else str(session_id).strip()
     
-    # Create cancellation event for this session (reuse same session_id)
-    with streaming_lock:
-        stop_event = threading.Event()
-        streaming_sessions[session_id] = stop_event
-    
-    # Create a new database session for this generator to avoid session closure issues
-    local_db = SessionLocal()
+    # One generation at a time per session (GENERATION_POLICY in generations.py)
+    generation = generation or Generation(session_id)
+    try:
+        generations.acquire(generation)
+    except GenerationBusy as e:
+        db.close()
+        yield json.dumps({"error": str(e)}) + "\n"
+        return
+    stop_event = generation.stop_event
     
     try:
-        # Get the last assistant message
-        last_assistant = (
-            local_db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .filter(ChatMessage.role == "assistant")
-            .order_by(ChatMessage.created_at.desc())
-            .first()
-        )
+        if not generation.started:
+            # Stopped while waiting for the previous response
+            yield json.dumps({"stopped": True, "partial_content": ""}) + "\n"
+            return
+        # Delete the last assistant message and load the remaining messages for context
+        # in one transaction - limit to recent 11000 tokens
+        message_writer.write_session(session_id, db)  # The reply to retry may still be queued
+        retry = delete_last_assistant_message(db, session_id)
         
-        if not last_assistant:
+        if retry is None:
             yield json.dumps({"error": "No assistant message to retry"}) + "\n"
             return
+        generation.committed = True
         
-        # Delete the last assistant message
-        local_db.delete(last_assistant)
-        local_db.commit()
+        all_messages = retry["messages"]
+        chat_history = list(all_messages)
+        # A complete reply is kept for the wording of the message it answers, for edits back to it
+        asked = next((m["content"] for m in reversed(all_messages) if m["role"] == "user"), None)
+        variant_key = reply_key(asked) if asked is not None else None
         
-        # Get all messages before the deleted one for context - limit to recent 11000 tokens
-        all_messages = (
-            local_db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .order_by(ChatMessage.created_at)
-            .all()
-        )
-        
-        # Convert to chat history format
-        chat_history = [
-            {"role": m.role, "content": m.content}
-            for m in all_messages
-        ]
+        # Return the pooled connection before the long upstream call
+        db.release()
         
         # Truncate history to keep recent 11000 tokens
         total_tokens = 0
@@ -569,18 +793,14 @@ def chat_retry_stream(session_id: str, db: Session):
         if len(truncated_history) < len(all_messages):
             print(f"📊 Chat history truncated: {len(all_messages)} → {len(truncated_history)} messages (~{total_tokens} tokens)")
         
+        generation.prompt_tokens = total_tokens  # Settled against the rate limit when the turn ends
         assistant_text = ""
         response_token_count = 0  # Track token count for response
         
         try:
             # Call OpenAI's streaming chat API with error handling
             try:
-                stream = client.chat.completions.create(
-                    model=MODEL_NAME,
-                    messages=chat_history,
-                    stream=True,
-                    max_tokens=MAX_MODEL_RESPONSE_TOKENS  # Limit response to 4096 tokens
-                )
+                stream = open_completion(chat_history, generation, session_id, retry=True)
             except Exception as api_error:
                 error_msg = str(api_error)
                 # Handle common OpenAI API errors
@@ -601,15 +821,9 @@ def chat_retry_stream(session_id: str, db: Session):
             for event in stream:
                 # Check if streaming was cancelled
                 if stop_event.is_set():
+                    # Queue content (even if blank) when stopped - frontend will handle blank display
+                    message_writer.enqueue(session_id, "assistant", assistant_text)  # Can be empty string if stopped early
                     yield json.dumps({"stopped": True, "partial_content": assistant_text}) + "\n"
-                    # Save content (even if blank) when stopped - frontend will handle blank display
-                    new_message = ChatMessage(
-                        session_id=session_id,
-                        role="assistant",
-                        content=assistant_text  # Can be empty string if stopped early
-                    )
-                    local_db.add(new_message)
-                    local_db.commit()
                     return
                 
                 if event.choices and event.choices[0].delta:
@@ -619,10 +833,12 @@ def chat_retry_stream(session_id: str, db: Session):
                         
                         # Check token count - stop if exceeds 4096 tokens
                         response_token_count = count_tokens(assistant_text)
+                        generation.completion_tokens = response_token_count
                         if response_token_count >= MAX_MODEL_RESPONSE_TOKENS:
                             # Stop streaming when limit reached
                             yield json.dumps({"token": content}) + "\n"
                             yield json.dumps({"stopped": True, "partial_content": assistant_text, "reason": "token_limit"}) + "\n"
+                            variant_key = None  # A cut-off reply is not kept for reuse
                             break
                         
                         # Sends each token to the client immediately
@@ -632,88 +848,496 @@ def chat_retry_stream(session_id: str, db: Session):
             yield json.dumps({"error": str(e)}) + "\n"
             return
         
-        # Save new assistant reply (only if not stopped)
-        # If stopped, message was already saved above
+        # Queue new assistant reply (only if not stopped)
+        # If stopped, message was already queued above
         if not stop_event.is_set() and assistant_text.strip():
-            new_message = ChatMessage(
-                session_id=session_id,
-                role="assistant",
-                content=assistant_text
-            )
-            local_db.add(new_message)
-            local_db.commit()
+            message_writer.enqueue(session_id, "assistant", assistant_text, variant_key=variant_key,
+                                   reply_to=retry["user_id"])
+            presample_alternate(session_id, chat_history, assistant_text, total_tokens)
     except Exception as e:
         print(f"❌ Error in chat_retry_stream: {str(e)}")
         yield json.dumps({"error": str(e)}) + "\n"
     finally:
         # Clean up database session
         try:
-            local_db.close()
+            db.close()
         except:
             pass
         
-        # Clean up streaming session
-        with streaming_lock:
-            if session_id in streaming_sessions:
-                del streaming_sessions[session_id]
+        # Let the next generation for this session start
+        generations.release(generation)
 
 # Retry API Endpoint
-@app.post("/chat/retry/")
-async def chat_retry(data: ChatRequest, db: Session = Depends(get_db)):
-    """Retry the last assistant message"""
+@router.post("/chat/retry/")
+async def chat_retry(data: ChatRequest, request: Request, idempotency_key: Optional[str] = Header(None)):
+    """Retry the last assistant message (Idempotency-Key as for /chat/)"""
     if not data.session_id:
         return {"error": "Session ID is required for retry"}
     
     # Trim whitespace from session_id to ensure proper matching
     session_id = data.session_id.strip() if isinstance(data.session_id, str) else str(data.session_id).strip()
     
-    # Stream response token by token back to the client
-    return StreamingResponse(
-        chat_retry_stream(session_id, db),
-        media_type="text/event-stream"
-    )
+    try:
+        stream, generation_id, error = await start_turn(
+            "retry", session_id, idempotency_key, request_fingerprint(),
+            lambda generation: chat_retry_stream(session_id, RequestSession(), generation),
+            client_ip(request))
+    except AdmissionRejected as rejection:
+        return busy_response(rejection)
+    if error:
+        return JSONResponse({"error": error}, status_code=422)
+
+    # Stream response token by token back to the client; stop requests may name the generation
+    return StreamingResponse(stream, media_type="text/event-stream", headers={"X-Generation-Id": generation_id})
+
+def request_stop(session_id: str, generation_id: Optional[str] = None) -> bool:
+    """Signal a generation's streaming loop to stop; False if there is no such generation"""
+    # The generation releases the session itself once its loop has exited
+    return generations.stop(session_id, generation_id)
 
 # Stop streaming endpoint
-@app.post("/chat/stop/{session_id}")
-async def stop_streaming(session_id: str):
-    """Stop streaming for a given session"""
-    with streaming_lock:
-        if session_id in streaming_sessions:
-            stop_event = streaming_sessions[session_id]
-            stop_event.set()
-            # Don't remove from dict yet - let the cleanup in finally block handle it
-            return {"success": True, "message": "Streaming stopped", "session_id": session_id}
-        else:
-            return {"success": False, "message": "No active streaming session found", "session_id": session_id}
+@router.post("/chat/stop/{session_id}")
+async def stop_streaming(session_id: str, generation_id: Optional[str] = None):
+    """
+    Stop streaming for a given session. With ?generation_id= (the X-Generation-Id of the
+    response) only that generation is stopped, even if it is still waiting for its turn.
+    """
+    if request_stop(session_id, generation_id):
+        return {"success": True, "message": "Streaming stopped", "session_id": session_id}
+    else:
+        return {"success": False, "message": "No active streaming session found", "session_id": session_id}
+
+async def socket_turn_stream(session_id: str, request: dict, ip: Optional[str] = None):
+    """Start a WebSocket send / edit / retry request: (stream, generation id, error)"""
+    kind = request.get("type")
+    message = request.get("message") or ""
+    key = request.get("idempotency_key")
+    if kind == "send":
+        if not message.strip():
+            return None, None, "Message cannot be empty."
+        return await start_turn("chat", session_id, key, request_fingerprint(message),
+                                 lambda generation: chat_stream(session_id, message, RequestSession(), generation),
+                                 ip, message)
+    if kind == "edit":
+        if not message:
+            return None, None, "Edited message is required"
+        return await start_turn("edit", session_id, key, request_fingerprint(message),
+                                 lambda generation: chat_edit_stream(session_id, message, RequestSession(), generation),
+                                 ip, message)
+    return await start_turn("retry", session_id, key, request_fingerprint(),
+                             lambda generation: chat_retry_stream(session_id, RequestSession(), generation),
+                             ip)
+
+async def stream_turn(send, turn, stream, finished: asyncio.Event):
+    """Forward the frames of one turn to the socket; the sync generator runs in a worker thread"""
+    loop = asyncio.get_running_loop()
+    frames = asyncio.Queue()
+
+    def pump():
+        try:
+            for line in stream:
+                loop.call_soon_threadsafe(frames.put_nowait, line)
+        finally:
+            loop.call_soon_threadsafe(frames.put_nowait, None)
+
+    worker = loop.run_in_executor(None, pump)
+    try:
+        while (line := await frames.get()) is not None:
+            await send({**json.loads(line), "turn": turn})
+    finally:
+        await worker
+        # The next turn may start as soon as the client sees "done"
+        finished.set()
+    await send({"turn": turn, "done": True})
+
+# WebSocket chat channel
+@router.websocket("/ws/chat/{session_id}")
+async def chat_socket(websocket: WebSocket, session_id: str):
+    """
+    One long-lived connection per session for send, edit, retry and stop.
+
+    Client messages (JSON): {"type": "send" | "edit", "message": ..., "turn": ...},
+    {"type": "retry", "turn": ...}, {"type": "stop", "turn": ...} and {"type": "ping"}.
+    The server answers with the same frames as the HTTP endpoints ({"token"}, {"stopped"},
+    {"error"}, ...) tagged with the request's "turn", then {"turn": ..., "done": true}.
+    Only one turn streams at a time. "stop" stops the socket's turn when it names it, else it
+    works like POST /chat/stop/{session_id} (with an optional "generation_id").
+    An "idempotency_key" in a send / edit / retry request works like the Idempotency-Key header.
+    """
+    session_id = session_id.strip()
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    turn_task = None
+    turn = turn_generation = None  # Turn streaming on this socket and its generation id
+    stop_on_disconnect = False
+    turn_finished = asyncio.Event()
+    turn_finished.set()
+
+    async def send(frame: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(frame))
+
+    try:
+        while True:
+            try:
+                request = json.loads(await websocket.receive_text())
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                await send({"error": "Messages must be JSON objects"})
+                continue
+            kind = request.get("type")
+
+            if kind == "stop":
+                if request.get("generation_id"):
+                    request_stop(session_id, request["generation_id"])
+                elif "turn" in request:
+                    # Only the turn streaming on this socket; a stale turn is ignored
+                    if request["turn"] == turn and not turn_finished.is_set():
+                        request_stop(session_id, turn_generation)
+                else:
+                    request_stop(session_id)
+            elif kind == "ping":
+                await send({"type": "pong"})
+            elif kind in ("send", "edit", "retry"):
+                if not turn_finished.is_set():
+                    await send({"turn": request.get("turn"), "error": "A response is already streaming", "done": True})
+                    continue
+                try:
+                    stream, generation_id, error = await socket_turn_stream(session_id, request, client_ip(websocket))
+                except AdmissionRejected as rejection:
+                    await send({"turn": request.get("turn"), "error": str(rejection),
+                                "retry_after": rejection.retry_after, "done": True})
+                    continue
+                if error:
+                    await send({"turn": request.get("turn"), "error": error, "done": True})
+                    continue
+                turn, turn_generation = request.get("turn"), generation_id
+                # A turn with an idempotency key may be shared with another request: let it finish
+                stop_on_disconnect = not request.get("idempotency_key")
+                turn_finished = asyncio.Event()
+                turn_task = asyncio.create_task(stream_turn(send, turn, stream, turn_finished))
+            else:
+                await send({"turn": request.get("turn"), "error": f"Unknown request type: {kind}", "done": True})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # A client that goes away mid-turn stops its generation (and no other)
+        if turn_task is not None and not turn_task.done():
+            if stop_on_disconnect:
+                request_stop(session_id, turn_generation)
+            try:
+                await turn_task
+            except Exception:
+                pass
+
+# Maximum page size for GET /chat/history/
+MAX_HISTORY_PAGE_SIZE = 200
+
+# Paged history for the virtualized chat view (older messages are loaded on scroll)
+@router.get("/chat/history/{session_id}")
+def chat_history_page(session_id: str, before_id: Optional[int] = None, limit: int = 50):
+    session_id = session_id.strip()
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    db = RequestSession()
+    try:
+        message_writer.write_session(session_id, db)
+        page = get_history_page(db, session_id, before_id=before_id, limit=limit)
+        db.commit()
+    except Exception as e:
+        print(f"❌ Error loading history page: {str(e)}")
+        return JSONResponse({"error": f"Failed to load history: {str(e)}"}, status_code=500)
+    finally:
+        db.close()
+    return {"session_id": session_id, **page}
+
+def validate_audio_upload(size: int, duration_ms: Optional[float]) -> Optional[str]:
+    """Return why an audio upload is rejected, or None if it may be transcribed"""
+    if size == 0:
+        return "Empty audio upload"
+    if size > MAX_AUDIO_UPLOAD_BYTES:
+        return f"Audio upload exceeds {MAX_AUDIO_UPLOAD_BYTES} bytes"
+    if duration_ms is not None and duration_ms < 0:
+        return "Invalid audio duration"
+    if duration_ms is not None and duration_ms > MAX_AUDIO_DURATION_SECONDS * 1000:
+        return f"Recording exceeds {MAX_AUDIO_DURATION_SECONDS:g} seconds"
+    return None
+
+# Whisper calls block, so they run in their own bounded pool; the pieces of a long
+# recording are transcribed concurrently
+_transcribe_pool = None
+_transcribe_pool_lock = threading.Lock()
+
+def get_transcribe_pool() -> ThreadPoolExecutor:
+    """Return the shared Whisper request pool, created on first use"""
+    global _transcribe_pool
+    if _transcribe_pool is None:
+        with _transcribe_pool_lock:
+            if _transcribe_pool is None:
+                _transcribe_pool = ThreadPoolExecutor(max_workers=SPEECH_TRANSCRIBE_WORKERS, thread_name_prefix="transcribe")
+    return _transcribe_pool
+
+def transcribe_clip(content: bytes, suffix: str) -> str:
+    """Send one clip to Whisper (blocking)"""
+    # Save the audio to a temporary file (Whisper detects the format from its name)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_audio:
+        temp_audio.write(content)
+        temp_audio_path = temp_audio.name
+    
+    try:
+        # Transcribe using OpenAI Whisper
+        start = time.perf_counter()
+        with open(temp_audio_path, "rb") as audio_file:
+            transcription = get_client().audio.transcriptions.create(
+                model=WHISPER_MODEL,
+                file=audio_file
+            )
+        metrics.observe("speech.transcribe_seconds", time.perf_counter() - start)
+        return transcription.text
+    finally:
+        # Clean up temporary file
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+
+def join_transcript(parts) -> str:
+    """Stitch the transcripts of consecutive segments"""
+    return " ".join(part.strip() for part in parts if part and part.strip())
+
+async def read_speech_upload(audio: UploadFile, duration_ms: Optional[float]):
+    """Validate and normalize an upload, returning (content, suffix, error)"""
+    # Read at most one byte past the limit, so oversized uploads are not buffered again
+    content = await audio.read(MAX_AUDIO_UPLOAD_BYTES + 1)
+    error = validate_audio_upload(len(content), duration_ms)
+    if error:
+        metrics.inc("speech.rejected_uploads")
+        print(f"🎤 Rejected audio upload: {error}")
+        return None, None, error
+    metrics.observe("speech.upload_bytes", len(content))
+    if duration_ms is not None:
+        metrics.observe("speech.duration_seconds", duration_ms / 1000)
+
+    # Transcode to 16 kHz mono Opus when ffmpeg is available (otherwise unchanged)
+    content, suffix = await audio_preprocess.normalize(content)
+    return content, suffix, None
+
+async def lookup_transcript(key: str, cache_control: Optional[str]):
+    """Return (cached transcript or None, X-Transcription-Cache header value or None)"""
+    if not transcription_cache.enabled:
+        return None, None
+    if "no-cache" in (cache_control or "").lower():
+        return None, "bypass"
+    cached = await asyncio.to_thread(transcription_cache.get, key)
+    return cached, "miss" if cached is None else "hit"
+
+async def store_transcript(key: str, text: str):
+    if transcription_cache.enabled:
+        await asyncio.to_thread(transcription_cache.put, key, text)
+
+async def transcribe_segments(content: bytes, suffix: str):
+    """Yield (index, count, text) for each piece of the recording as soon as Whisper returns it"""
+    segments = await audio_preprocess.split_on_silence(content, suffix)
+    loop = asyncio.get_running_loop()
+
+    async def transcribe(index, data, segment_suffix):
+        return index, await loop.run_in_executor(get_transcribe_pool(), transcribe_clip, data, segment_suffix)
+
+    tasks = [asyncio.ensure_future(transcribe(i, data, sfx)) for i, (data, sfx) in enumerate(segments)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, text = await next_done
+            yield index, len(segments), text
+    finally:
+        for task in tasks:
+            task.cancel()
 
 # Speech-to-text endpoint
-@app.post("/speech-to-text/")
-async def speech_to_text(audio: UploadFile = File(...)):
+@router.post("/speech-to-text/")
+async def speech_to_text(response: Response, audio: UploadFile = File(...),
+                         duration_ms: Optional[float] = Form(None),
+                         cache_control: Optional[str] = Header(None)):
     """
     Convert audio file to text using OpenAI Whisper API
+
+    duration_ms is the length of speech the recorder reports (silence is trimmed client-side).
+    Uploads over MAX_AUDIO_UPLOAD_BYTES or MAX_AUDIO_DURATION_SECONDS are rejected without
+    calling Whisper. Long recordings are cut at pauses and the pieces transcribed in parallel.
+
+    Transcripts are cached by audio hash; send "Cache-Control: no-cache" to force a fresh
+    transcription. The X-Transcription-Cache response header reports hit, miss or bypass.
     """
     try:
-        # Save uploaded audio to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_audio:
-            content = await audio.read()
-            temp_audio.write(content)
-            temp_audio_path = temp_audio.name
-        
-        try:
-            # Transcribe using OpenAI Whisper
-            with open(temp_audio_path, "rb") as audio_file:
-                transcription = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
-            
-            text = transcription.text
-            
-            return {"text": text, "status": "success"}
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
+        content, suffix, error = await read_speech_upload(audio, duration_ms)
+        if error:
+            return {"text": "", "status": "error", "error": error}
+
+        # Same clip as an earlier request: reuse its transcript
+        key = cache_key(content, WHISPER_MODEL)
+        cached, cache_status = await lookup_transcript(key, cache_control)
+        if cache_status:
+            response.headers["X-Transcription-Cache"] = cache_status
+        if cached is not None:
+            return {"text": cached, "status": "success"}
+
+        parts = {}
+        async for index, _, text in transcribe_segments(content, suffix):
+            parts[index] = text
+        text = join_transcript(parts[i] for i in sorted(parts))
+        await store_transcript(key, text)
+        return {"text": text, "status": "success"}
     
     except Exception as e:
-        return {"text": "", "status": "error", "error": str(e)}
\ No newline at end of file
+        return {"text": "", "status": "error", "error": str(e)}
+
+# Speech-to-text with partial results
+@router.post("/speech-to-text/stream")
+async def speech_to_text_stream(audio: UploadFile = File(...),
+                                duration_ms: Optional[float] = Form(None),
+                                cache_control: Optional[str] = Header(None)):
+    """
+    Same as /speech-to-text/, but streams NDJSON while a long recording is transcribed:
+    {"segment": i, "segments": n, "text": ...} for each piece as it completes (in any order),
+    then {"text": ..., "status": "success"} with the whole transcript, or an error line.
+    """
+    content = suffix = key = cached = None
+    headers = {}
+    try:
+        # Read the upload before the response starts
+        content, suffix, error = await read_speech_upload(audio, duration_ms)
+        if not error:
+            key = cache_key(content, WHISPER_MODEL)
+            cached, cache_status = await lookup_transcript(key, cache_control)
+            if cache_status:
+                headers["X-Transcription-Cache"] = cache_status
+    except Exception as e:
+        error = str(e)
+
+    async def generate():
+        if error:
+            yield json.dumps({"text": "", "status": "error", "error": error}) + "\n"
+            return
+        if cached is not None:
+            yield json.dumps({"text": cached, "status": "success"}) + "\n"
+            return
+        try:
+            parts = {}
+            async for index, count, text in transcribe_segments(content, suffix):
+                parts[index] = text
+                yield json.dumps({"segment": index, "segments": count, "text": text}) + "\n"
+            text = join_transcript(parts[i] for i in sorted(parts))
+            await store_transcript(key, text)
+            yield json.dumps({"text": text, "status": "success"}) + "\n"
+        except Exception as e:
+            yield json.dumps({"text": "", "status": "error", "error": str(e)}) + "\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+async def transcribe_live_segment(content: bytes) -> str:
+    """Normalize and transcribe one segment of a live recording (cached like uploads)"""
+    content, suffix = await audio_preprocess.normalize(content)
+    key = cache_key(content, WHISPER_MODEL)
+    cached, _ = await lookup_transcript(key, None)
+    if cached is not None:
+        return cached
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(get_transcribe_pool(), transcribe_clip, content, suffix)
+    await store_transcript(key, text)
+    return text
+
+# Live speech-to-text
+@router.websocket("/ws/speech")
+async def speech_socket(websocket: WebSocket):
+    """
+    Transcribe a recording while it is still being made (one connection per recording).
+
+    Client messages: binary frames with audio, appended to the open segment;
+    {"type": "segment", "duration_ms": ...} when the open segment is a complete clip (the
+    recorder restarts at each pause); {"type": "stop", "duration_ms": ...} after the last
+    audio; {"type": "cancel"} to discard the recording.
+    The server sends {"segment": i, "text": ...} as each segment is transcribed (in any
+    order), then {"text": ..., "status": "success"} or an error frame, and closes.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+
+    async def send(frame: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(frame))
+
+    async def on_segment(index: int, text: str):
+        try:
+            await send({"segment": index, "text": text})
+        except Exception:
+            pass  # The client left; the final frame is not needed either
+
+    live = LiveTranscription(transcribe_live_segment, on_segment, validate_audio_upload)
+    result = None
+    try:
+        while result is None:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            error = None
+            if message.get("bytes") is not None:
+                error = live.append(message["bytes"])
+            else:
+                try:
+                    request = json.loads(message.get("text") or "")
+                except ValueError:
+                    request = None
+                kind = request.get("type") if isinstance(request, dict) else None
+
+                if kind in ("segment", "stop"):
+                    error = live.end_segment(request.get("duration_ms"), last=kind == "stop")
+                    if not error and kind == "stop":
+                        text = await live.finish(join_transcript)
+                        result = {"text": text, "status": "success"}
+                elif kind == "cancel":
+                    break
+                else:
+                    await send({"error": f"Unknown request type: {kind}"})
+
+            if error:
+                metrics.inc("speech.rejected_uploads")
+                print(f"🎤 Rejected live recording: {error}")
+                result = {"text": "", "status": "error", "error": error}
+
+        if result is not None:
+            print(f"🎤 Live transcription finished: {live.segments} segments, {live.received_bytes} bytes")
+            await send(result)
+            await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        try:
+            await send({"text": "", "status": "error", "error": str(e)})
+            await websocket.close()
+        except Exception:
+            pass
+    finally:
+        live.cancel()
+
+def create_app() -> FastAPI:
+    """Build the FastAPI app (uvicorn api:create_app --factory, or the module-level app)"""
+    app = FastAPI(title="LLM Chat Interface", lifespan=lifespan)
+
+    # ADD CORS Middleware, allow frontend to access backend
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allows all origins (for development)
+        allow_credentials=True,
+        allow_methods=["*"],  # Allows all methods (GET, POST, etc.)
+        allow_headers=["*"],  # Allows all headers
+        expose_headers=["X-Generation-Id", "X-Transcription-Cache"],  # Readable by the browser scripts
+    )
+    app.include_router(router)
+    return app
+
+# Initialize the FastAPI App (cheap: no OpenAI, tokenizer or DB work happens here)
+app = create_app()
+
+def __getattr__(name):
+    # Backwards-compatible api.client, created lazily
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,208 @@
+"""
+Optional audio normalization before speech-to-text.
+
+Uploads are transcoded with a local ffmpeg binary to 16 kHz mono Opus (Whisper
+resamples to 16 kHz mono anyway) with leading/trailing and long interior
+silences removed. Transcoding runs in a small worker pool so ffmpeg processes
+are bounded and never block the event loop. If ffmpeg is missing or fails, the
+original upload is transcribed unchanged.
+
+Long recordings can also be cut at pauses (split_on_silence), so the pieces
+are transcribed in parallel.
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from env import (
+    AUDIO_NORMALIZE, FFMPEG_BINARY, AUDIO_NORMALIZE_WORKERS, AUDIO_NORMALIZE_TIMEOUT,
+    SPEECH_CHUNK_SECONDS,
+)
+
+# Silence below SILENCE_THRESHOLD is trimmed from the ends; interior pauses longer than
+# SILENCE_DURATION seconds are shortened to KEEP_SILENCE
+SILENCE_THRESHOLD = "-45dB"
+SILENCE_DURATION = 0.6
+SAMPLE_RATE = 16000
+OPUS_BITRATE = "24k"
+KEEP_SILENCE = 0.3  # Long pauses are shortened to this, not removed, so they still mark word boundaries
+OUTPUT_SUFFIX = ".ogg"  # Whisper detects the format from the file name
+
+# Long recordings are cut in the middle of pauses of at least SPLIT_SILENCE_DURATION seconds
+SPLIT_SILENCE_THRESHOLD = "-40dB"
+SPLIT_SILENCE_DURATION = 0.2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    """Normalization runs when AUDIO_NORMALIZE is "true", or "auto" and ffmpeg is installed"""
+    if AUDIO_NORMALIZE == "false":
+        return False
+    if AUDIO_NORMALIZE == "true":
+        return True
+    return shutil.which(FFMPEG_BINARY) is not None
+
+
+def ffmpeg_command() -> list:
+    """ffmpeg arguments that read any audio on stdin and write 16 kHz mono Opus to stdout"""
+    silence_filter = (
+        f"silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD}"
+        f":stop_periods=-1:stop_duration={SILENCE_DURATION}:stop_threshold={SILENCE_THRESHOLD}"
+        f":stop_silence={KEEP_SILENCE}"
+    )
+    return [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-af", silence_filter,
+        *OPUS_OUTPUT_ARGS,
+    ]
+
+
+# 16 kHz mono Opus in Ogg, written to stdout
+OPUS_OUTPUT_ARGS = [
+    "-ac", "1", "-ar", str(SAMPLE_RATE),
+    "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip",
+    # Same input, same bytes (Ogg picks a random stream serial otherwise), so the
+    # output can be used as a cache key
+    "-fflags", "+bitexact", "-flags:a", "+bitexact",
+    "-f", "ogg", "pipe:1",
+]
+
+
+def run_ffmpeg(args: list, data: bytes = None) -> subprocess.CompletedProcess:
+    """Run ffmpeg (blocking), raising with its error output if it fails"""
+    result = subprocess.run(args, input=data, capture_output=True, timeout=AUDIO_NORMALIZE_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip() or f"ffmpeg exited with {result.returncode}")
+    return result
+
+
+def transcode(data: bytes) -> bytes:
+    """Run ffmpeg on one upload (blocking)"""
+    result = run_ffmpeg(ffmpeg_command(), data)
+    if not result.stdout:
+        raise RuntimeError("ffmpeg produced no output")
+    return result.stdout
+
+
+def plan_segments(duration: float, silences: list, chunk_seconds: float = SPEECH_CHUNK_SECONDS) -> list:
+    """
+    Split [0, duration] into (start, end) pieces of at least chunk_seconds, cutting in the
+    middle of silences. Recordings shorter than 1.5 chunks, or without usable pauses,
+    stay in one piece.
+    """
+    if chunk_seconds <= 0 or duration < chunk_seconds * 1.5:
+        return [(0.0, duration)]
+    cuts = []
+    last_cut = 0.0
+    for start, end in silences:
+        middle = (start + end) / 2
+        # Don't leave a short tail for the last segment
+        if middle - last_cut >= chunk_seconds and duration - middle >= chunk_seconds / 2:
+            cuts.append(middle)
+            last_cut = middle
+    bounds = [0.0] + cuts + [duration]
+    return list(zip(bounds, bounds[1:]))
+
+
+def probe_silences(path: str):
+    """Return (duration, [(silence_start, silence_end), ...]) of an audio file"""
+    result = run_ffmpeg([
+        FFMPEG_BINARY, "-hide_banner", "-nostats", "-i", path,
+        "-af", f"silencedetect=noise={SPLIT_SILENCE_THRESHOLD}:d={SPLIT_SILENCE_DURATION}",
+        "-f", "null", "-",
+    ])
+    log = result.stderr.decode("utf-8", "replace")
+    # The container duration is not always known, so use the decoded length when it is printed
+    times = re.findall(r"time=(\d+):(\d+):([\d.]+)", log) or re.findall(r"Duration: (\d+):(\d+):([\d.]+)", log)
+    if not times:
+        raise RuntimeError("Could not determine the audio duration")
+    hours, minutes, seconds = times[-1]
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    starts = [float(v) for v in re.findall(r"silence_start: (-?[\d.]+)", log)]
+    ends = [float(v) for v in re.findall(r"silence_end: ([\d.]+)", log)]
+    return duration, list(zip(starts, ends))
+
+
+def split(data: bytes, suffix: str, chunk_seconds: float = SPEECH_CHUNK_SECONDS) -> list:
+    """Cut a recording at pauses into segments of about chunk_seconds (blocking); returns [bytes]"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_audio:
+        temp_audio.write(data)
+        path = temp_audio.name
+    try:
+        duration, silences = probe_silences(path)
+        segments = plan_segments(duration, silences, chunk_seconds)
+        if len(segments) == 1:
+            return [data]
+        return [
+            run_ffmpeg([
+                FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", path,
+                "-ss", f"{start:.3f}", "-to", f"{end:.3f}", *OPUS_OUTPUT_ARGS,
+            ]).stdout
+            for start, end in segments
+        ]
+    finally:
+        os.remove(path)
+
+
+def get_pool() -> ThreadPoolExecutor:
+    """Return the shared transcoding pool, created on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=AUDIO_NORMALIZE_WORKERS, thread_name_prefix="audio-normalize")
+    return _pool
+
+
+async def normalize(data: bytes, suffix: str = ".webm"):
+    """
+    Return (audio bytes, file suffix) to send to Whisper.
+    Falls back to the original upload when normalization is disabled or fails.
+    """
+    if not is_enabled():
+        return data, suffix
+
+    start = time.perf_counter()
+    try:
+        normalized = await asyncio.get_running_loop().run_in_executor(get_pool(), transcode, data)
+    except Exception as e:
+        metrics.inc("speech.normalize.failures")
+        print(f"⚠️ Audio normalization failed, sending original upload: {e}")
+        return data, suffix
+
+    elapsed = time.perf_counter() - start
+    metrics.observe("speech.normalize.seconds", elapsed)
+    metrics.observe("speech.normalize.input_bytes", len(data))
+    metrics.observe("speech.normalize.output_bytes", len(normalized))
+    print(f"🎧 Normalized audio {len(data)} -> {len(normalized)} bytes in {elapsed * 1000:.0f} ms")
+    return normalized, OUTPUT_SUFFIX
+
+
+async def split_on_silence(data: bytes, suffix: str):
+    """
+    Return [(segment bytes, suffix)] for transcribing a recording in parallel.
+    Short recordings, and any recording when ffmpeg is unavailable or fails, stay whole.
+    """
+    if not is_enabled() or SPEECH_CHUNK_SECONDS <= 0:
+        return [(data, suffix)]
+    try:
+        segments = await asyncio.get_running_loop().run_in_executor(get_pool(), split, data, suffix, SPEECH_CHUNK_SECONDS)
+    except Exception as e:
+        metrics.inc("speech.split.failures")
+        print(f"⚠️ Splitting audio failed, transcribing it whole: {e}")
+        return [(data, suffix)]
+    if len(segments) == 1:
+        return [(data, suffix)]
+    metrics.observe("speech.split.segments", len(segments))
+    return [(segment, OUTPUT_SUFFIX) for segment in segments]
@@ -1,13 +1,114 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import (
+    create_engine, event, select, update, delete, exists, case, literal, tuple_, or_,
+    Column, Integer, Float, String, Text, DateTime,
+)
 from sqlalchemy.orm import declarative_base, sessionmaker
-from datetime import datetime
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from datetime import datetime, timedelta
+from typing import Optional
 from zoneinfo import ZoneInfo
-from env import DATABASE_URL, DB_SCHEMA
+from env import (
+    DATABASE_URL, DB_SCHEMA, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_ASYNC, REPLY_VARIANT_TTL,
+)
+
+import time
+import metrics
+
+class TimedPoolMixin:
+    """Record how long callers wait for a pooled connection (under the prefix given to instrument_pool)"""
+    metric_prefix = "db.pool"
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.observe(f"{self.metric_prefix}.wait_seconds", time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting under the same name
+        pool = super().recreate()
+        pool.metric_prefix = self.metric_prefix
+        return pool
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(url: str, poolclass=TimedQueuePool) -> dict:
+    """Pool settings shared by the sync and async engines (configured via env)"""
+    options = {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.startswith("sqlite"):
+        # Streams run in worker threads, so the connection may move between threads
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+def instrument_pool(engine, prefix: str):
+    """Export checkout counts, connection wait and hold times and pool occupancy as metrics"""
+    pool = engine.pool
+    pool.metric_prefix = prefix
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.inc(f"{prefix}.connects")
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.inc(f"{prefix}.checkouts")
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            metrics.observe(f"{prefix}.held_seconds", time.perf_counter() - checked_out_at)
+
+    metrics.set_gauge(f"{prefix}.checked_out", pool.checkedout)
+    metrics.set_gauge(f"{prefix}.size", pool.size)
+    metrics.set_gauge(f"{prefix}.overflow", pool.overflow)
 
 # Create engine using PostgreSQL
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+instrument_pool(engine, "db.pool")
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto its async driver (asyncpg for Postgres, aiosqlite for SQLite)"""
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url[len("postgres://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+def create_async_session_factory(url: str, prefix: str = "db.async_pool"):
+    """Create an async engine with the same pool settings and return (engine, session factory)"""
+    # Imported here so asyncpg / aiosqlite stay optional unless DB_ASYNC is enabled
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_url = async_database_url(url)
+    options = engine_options(async_url, TimedAsyncQueuePool)
+    options.pop("connect_args", None)
+    async_engine = create_async_engine(async_url, **options)
+    instrument_pool(async_engine.sync_engine, prefix)
+    return async_engine, async_sessionmaker(bind=async_engine, autocommit=False, autoflush=False, expire_on_commit=False)
+
+# Optional async engine for async endpoints
+async_engine, AsyncSessionLocal = (
+    create_async_session_factory(DATABASE_URL) if DB_ASYNC else (None, None)
+)
+
 # Malaysia timezone
 MALAYSIA_TZ = ZoneInfo("Asia/Kuala_Lumpur")
 
@@ -29,8 +130,257 @@ class ChatMessage(Base):
     content = Column(Text) # Message text
     created_at = Column(DateTime(timezone=True), default=malaysia_now) # Timestamp
 
-# Create the table if it doesn't exist
-Base.metadata.create_all(bind=engine)
+# ORM model for cached speech-to-text results (see transcription_cache.py)
+class TranscriptionCacheEntry(Base):
+    __tablename__ = "transcription_cache"
+    __table_args__ = {"schema": DB_SCHEMA}
+
+    key = Column(String(80), primary_key=True) # "<model>:<sha256 of the audio sent to Whisper>"
+    text = Column(Text) # Transcript
+    created_at = Column(DateTime(timezone=True), default=malaysia_now, index=True) # Entries older than the TTL are ignored
+
+# ORM model for cached model replies (see response_cache.py)
+class ResponseCacheEntry(Base):
+    __tablename__ = "response_cache"
+    __table_args__ = {"schema": DB_SCHEMA}
+
+    key = Column(String(64), primary_key=True) # SHA-256 of the model, parameters and message list
+    chunks = Column(Text) # JSON list of the streamed content chunks
+    tokens = Column(Integer) # Prompt + completion tokens a replay saves
+    created_at = Column(DateTime(timezone=True), default=malaysia_now, index=True) # Entries older than the TTL are ignored
+
+# ORM model for token buckets shared between workers (see ratelimit.py, RATE_LIMIT_BACKEND=db)
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = {"schema": DB_SCHEMA}
+
+    key = Column(String(200), primary_key=True) # "session:<session_id>" or "ip:<address>"
+    tokens = Column(Float) # Tokens left at updated_at (negative while a long turn is paid off)
+    updated_at = Column(Float) # Unix time of the last charge; the bucket refills from here
+
+# ORM model for completed replies, so an edit back to an earlier wording can reuse its reply (see chat_edit_stream)
+class ReplyVariant(Base):
+    __tablename__ = "reply_variants"
+    __table_args__ = {"schema": DB_SCHEMA}
+
+    id = Column(Integer, primary_key=True) # Auto-increment ID
+    session_id = Column(String, index=True) # Chat session the reply belongs to
+    message_id = Column(Integer, index=True) # User message the reply answers (only the latest one can be edited, so this pins the history before it)
+    key = Column(String(64), index=True) # SHA-256 of the model and the wording of that user message
+    content = Column(Text) # Reply that streamed to the end (never a stopped or cut-off one)
+    created_at = Column(DateTime(timezone=True), default=malaysia_now, index=True) # Rows older than REPLY_VARIANT_TTL are ignored and purged
+
+def _last_message_id(session_id: str, role: str):
+    """Scalar subquery selecting the id of the latest message with the given role"""
+    # Aliased so it is never correlated with an UPDATE/DELETE on the same table
+    latest = ChatMessage.__table__.alias("latest")
+    return (
+        select(latest.c.id)
+        .where(latest.c.session_id == session_id, latest.c.role == role)
+        .order_by(latest.c.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+def _is_postgres(db) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def _history_rows(rows) -> list:
+    return [{"role": r.role, "content": r.content} for r in rows]
+
+def _last_user_id(rows) -> Optional[int]:
+    return next((r.id for r in reversed(rows) if r.role == "user"), None)
+
+def _variant_lookup(session_id: str, variant_key: Optional[str], message_id):
+    """Scalar subquery for the newest unexpired reply kept for message_id under variant_key"""
+    v = ReplyVariant.__table__
+    cutoff = malaysia_now() - timedelta(seconds=REPLY_VARIANT_TTL)
+    return (
+        select(v.c.content)
+        .where(v.c.session_id == session_id, v.c.message_id == message_id, v.c.key == variant_key,
+               v.c.created_at >= cutoff)
+        .order_by(v.c.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+def _current_reply(session_id: str):
+    """Scalar subquery for the latest assistant message, if it answers the latest user message"""
+    reply = ChatMessage.__table__.alias("reply")
+    asked = ChatMessage.__table__.alias("asked")
+    asked_at = select(asked.c.created_at).where(asked.c.id == _last_message_id(session_id, "user")).scalar_subquery()
+    return (
+        select(reply.c.content)
+        .where(reply.c.id == _last_message_id(session_id, "assistant"), reply.c.created_at >= asked_at)
+        .scalar_subquery()
+    )
+
+def edit_last_user_message(db, session_id: str, new_content: str, variant_key: Optional[str] = None):
+    """
+    UPDATE the latest user message, DELETE the latest assistant message and return
+    the remaining history, all in one transaction.
+
+    On Postgres this is a single statement (data-modifying CTEs with RETURNING);
+    other dialects run UPDATE ... RETURNING, DELETE ... RETURNING and the SELECT
+    as one batch with a single commit. Returns None (and changes nothing) when the
+    session has no user message, otherwise a dict with user_id, assistant_id
+    (None if there was no reply to delete), messages ({role, content} dicts),
+    variant (the reply kept for the message under variant_key, if any, read in the
+    same statement) and unchanged.
+
+    An edit that keeps the exact wording of a message whose reply streamed to the
+    end (the current reply is the one kept under variant_key) changes nothing:
+    unchanged is True, messages still end with that reply and variant is it.
+    """
+    t = ChatMessage.__table__
+    last_user = _last_message_id(session_id, "user")
+    kept = _variant_lookup(session_id, variant_key, last_user)
+    reply = _current_reply(session_id)
+    # Evaluated on the row being updated: a new wording, or no complete reply to keep
+    changed = or_(t.c.content != new_content, kept.is_(None), reply.is_(None), kept != reply)
+
+    if _is_postgres(db):
+        updated = (
+            update(t)
+            .where(t.c.id == last_user, changed)
+            .values(content=new_content)
+            .returning(t.c.id)
+            .cte("updated")
+        )
+        deleted = (
+            delete(t)
+            .where(t.c.id == _last_message_id(session_id, "assistant"))
+            .where(exists(select(updated.c.id)))
+            .returning(t.c.id)
+            .cte("deleted")
+        )
+        updated_id = select(updated.c.id).scalar_subquery()
+        rows = db.execute(
+            select(
+                t.c.role,
+                # CTEs share one snapshot, so the SELECT still sees the old content
+                case((t.c.id == updated_id, literal(new_content, Text)), else_=t.c.content).label("content"),
+                updated_id.label("user_id"),
+                last_user.label("last_user_id"),
+                select(deleted.c.id).scalar_subquery().label("assistant_id"),
+                kept.label("variant"),
+            )
+            .where(t.c.session_id == session_id, t.c.id.not_in(select(deleted.c.id)))
+            .order_by(t.c.created_at)
+        ).all()
+        db.commit()
+        if not rows or rows[0].last_user_id is None:
+            return None
+        return {"user_id": rows[0].last_user_id, "assistant_id": rows[0].assistant_id,
+                "messages": _history_rows(rows), "variant": rows[0].variant,
+                "unchanged": rows[0].user_id is None}
+
+    user_id = db.execute(
+        update(t)
+        .where(t.c.id == last_user, changed)
+        .values(content=new_content)
+        .returning(t.c.id)
+    ).scalar()
+    assistant_id = None
+    if user_id is not None:
+        assistant_id = db.execute(
+            delete(t)
+            .where(t.c.id == _last_message_id(session_id, "assistant"))
+            .returning(t.c.id)
+        ).scalar()
+    rows = db.execute(
+        select(t.c.role, t.c.content, last_user.label("last_user_id"), kept.label("variant"))
+        .where(t.c.session_id == session_id)
+        .order_by(t.c.created_at)
+    ).all()
+    if not rows or rows[0].last_user_id is None:
+        db.rollback()
+        return None
+    db.commit()
+    return {"user_id": rows[0].last_user_id, "assistant_id": assistant_id, "messages": _history_rows(rows),
+            "variant": rows[0].variant, "unchanged": user_id is None}
+
+def delete_last_assistant_message(db, session_id: str):
+    """
+    DELETE the latest assistant message and return the remaining history in one
+    transaction (a single statement on Postgres). Returns None (and changes nothing)
+    when there is no assistant message, otherwise a dict with assistant_id, messages and
+    user_id (the latest user message, which the new reply answers; None if there is none).
+    """
+    t = ChatMessage.__table__
+
+    if _is_postgres(db):
+        deleted = (
+            delete(t)
+            .where(t.c.id == _last_message_id(session_id, "assistant"))
+            .returning(t.c.id)
+            .cte("deleted")
+        )
+        rows = db.execute(
+            select(t.c.id, t.c.role, t.c.content, select(deleted.c.id).scalar_subquery().label("assistant_id"))
+            .where(t.c.session_id == session_id, t.c.id.not_in(select(deleted.c.id)))
+            .order_by(t.c.created_at)
+        ).all()
+        db.commit()
+        if not rows or rows[0].assistant_id is None:
+            return None
+        return {"assistant_id": rows[0].assistant_id, "messages": _history_rows(rows), "user_id": _last_user_id(rows)}
+
+    assistant_id = db.execute(
+        delete(t)
+        .where(t.c.id == _last_message_id(session_id, "assistant"))
+        .returning(t.c.id)
+    ).scalar()
+    if assistant_id is None:
+        db.rollback()
+        return None
+    rows = db.execute(
+        select(t.c.id, t.c.role, t.c.content).where(t.c.session_id == session_id).order_by(t.c.created_at)
+    ).all()
+    db.commit()
+    return {"assistant_id": assistant_id, "messages": _history_rows(rows), "user_id": _last_user_id(rows)}
+
+def purge_reply_variants(db) -> int:
+    """Delete kept replies older than REPLY_VARIANT_TTL, returning how many were removed"""
+    v = ReplyVariant.__table__
+    cutoff = malaysia_now() - timedelta(seconds=REPLY_VARIANT_TTL)
+    result = db.execute(delete(v).where(v.c.created_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+def get_history_page(db, session_id: str, before_id: int = None, limit: int = 50) -> dict:
+    """
+    Return up to `limit` messages of a session (oldest first) that come before the
+    message `before_id` (or the latest ones), plus whether older messages exist.
+    Keyset pagination on (created_at, id), so each page is one indexed query.
+    """
+    t = ChatMessage.__table__
+    query = select(t.c.id, t.c.role, t.c.content).where(t.c.session_id == session_id)
+    if before_id is not None:
+        cursor = select(t.c.created_at).where(t.c.id == before_id).scalar_subquery()
+        query = query.where(tuple_(t.c.created_at, t.c.id) < tuple_(cursor, before_id))
+    rows = db.execute(query.order_by(t.c.created_at.desc(), t.c.id.desc()).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    messages = [{"id": r.id, "role": r.role, "content": r.content} for r in reversed(rows[:limit])]
+    return {"messages": messages, "has_more": has_more}
+
+def init_db():
+    """Create the tables if they don't exist (python database.py, or at API startup with DB_CREATE_TABLES)"""
+    Base.metadata.create_all(bind=engine)
+
+def warm_pool(connections: int):
+    """Open up to `connections` pooled connections so the first requests don't pay for connect/TLS"""
+    opened = []
+    try:
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        # Returned to the pool, where they stay open for reuse
+        for conn in opened:
+            conn.close()
+    return len(opened)
 
 # Provide a database session to FastAPI endpoints
 def get_db():
@@ -38,4 +388,54 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+class RequestSession:
+    """
+    Request-scoped, lazily connected session for streaming endpoints.
+
+    The endpoint creates it and the stream generator owns it, so it stays valid
+    after the response has started (unlike a Depends(get_db) session, which is
+    closed before the stream runs). No Session or connection exists until the
+    first query, and release() returns the connection to the pool between DB
+    phases of a turn. Attribute access is forwarded to the underlying Session.
+    """
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory or SessionLocal
+        self._session = None
+        self.checkouts = 0  # Connections acquired by this request
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self._session_factory()
+            event.listen(self._session, "after_begin", self._on_begin)
+        return self._session
+
+    def _on_begin(self, session, transaction, connection):
+        self.checkouts += 1
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def release(self):
+        """Return the connection to the pool; the session can still be used afterwards"""
+        if self._session is not None:
+            self._session.close()
+
+    def close(self):
+        self.release()
+        self._session = None
+
+# Provide an async database session to async FastAPI endpoints (requires DB_ASYNC=true)
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database engine is disabled; set DB_ASYNC=true")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+if __name__ == "__main__":
+    # Explicit migration command, run once per deploy instead of on every worker import
+    init_db()
+    print("✅ Database schema is up to date")
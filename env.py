@@ -6,4 +6,82 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
-DB_SCHEMA = os.getenv("DB_SCHEMA")
\ No newline at end of file
+DB_SCHEMA = os.getenv("DB_SCHEMA")
+
+# Write-behind persistence of assistant replies
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "1000"))  # Pending rows before falling back to synchronous writes
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))  # Flush as soon as this many rows are pending
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05"))  # Seconds between time-based flushes
+
+# Database connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # Connections kept open in the pool
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # Extra connections allowed under load
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Reconnect connections older than this (seconds)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Test connections before use
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"  # Also create an async engine (asyncpg / aiosqlite)
+DB_CREATE_TABLES = os.getenv("DB_CREATE_TABLES", "true").lower() == "true"  # Create missing tables at startup (disable when `python database.py` runs on deploy)
+
+# Startup warm-up
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))  # Pool connections opened before reporting ready
+WARMUP_UPSTREAM = os.getenv("WARMUP_UPSTREAM", "false").lower() == "true"  # Open a keep-alive connection to OpenAI at startup
+
+# Speech-to-text uploads
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(5 * 1024 * 1024)))  # Larger uploads are rejected before reaching Whisper
+MAX_AUDIO_DURATION_SECONDS = float(os.getenv("MAX_AUDIO_DURATION_SECONDS", "300"))  # Longest recording (of speech) accepted
+
+# Speech-to-text audio normalization with ffmpeg
+AUDIO_NORMALIZE = os.getenv("AUDIO_NORMALIZE", "auto").lower()  # "auto" (when ffmpeg is installed), "true" or "false"
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")  # Path or name of the ffmpeg executable
+AUDIO_NORMALIZE_WORKERS = int(os.getenv("AUDIO_NORMALIZE_WORKERS", "2"))  # Concurrent ffmpeg processes
+AUDIO_NORMALIZE_TIMEOUT = float(os.getenv("AUDIO_NORMALIZE_TIMEOUT", "30"))  # Seconds before a transcode is abandoned
+
+# Speech-to-text transcription cache
+TRANSCRIPTION_CACHE_SIZE = int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "256"))  # Transcripts kept in memory (LRU, 0 disables)
+TRANSCRIPTION_CACHE_TTL = int(os.getenv("TRANSCRIPTION_CACHE_TTL", "86400"))  # Seconds a cached transcript is reused
+TRANSCRIPTION_CACHE_DB = os.getenv("TRANSCRIPTION_CACHE_DB", "false").lower() == "true"  # Also persist transcripts in the transcription_cache table
+
+# Long recordings are cut at pauses and the pieces transcribed in parallel
+SPEECH_CHUNK_SECONDS = float(os.getenv("SPEECH_CHUNK_SECONDS", "30"))  # Target segment length (0 disables splitting)
+SPEECH_TRANSCRIBE_WORKERS = int(os.getenv("SPEECH_TRANSCRIBE_WORKERS", "4"))  # Concurrent Whisper requests
+
+# Idempotency-Key handling for /chat/, /chat/edit/ and /chat/retry/
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "600"))  # Seconds a completed turn is replayed for a repeated key
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "1000"))  # Completed turns kept for replay
+
+# One generation at a time per chat session
+GENERATION_POLICY = os.getenv("GENERATION_POLICY", "queue").lower()  # "reject", "queue" or "preempt" when a session is already generating
+GENERATION_QUEUE_TIMEOUT = float(os.getenv("GENERATION_QUEUE_TIMEOUT", "30"))  # Seconds a queued or preempting request waits
+
+# Global admission control for chat generations
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16"))  # Generations streaming at once (0 disables)
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))  # Requests waiting for a slot before new ones get 429
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))  # Seconds a request waits before it gets 503
+
+# Token-bucket rate limiting of chat turns, charged in OpenAI tokens
+RATE_LIMIT_SESSION_TPM = int(os.getenv("RATE_LIMIT_SESSION_TPM", "20000"))  # Tokens per minute for one chat session (0 disables)
+RATE_LIMIT_IP_TPM = int(os.getenv("RATE_LIMIT_IP_TPM", "60000"))  # Tokens per minute for one client IP (0 disables)
+RATE_LIMIT_REPLY_ESTIMATE = int(os.getenv("RATE_LIMIT_REPLY_ESTIMATE", "500"))  # Completion tokens charged up front, settled when the reply ends
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()  # "memory" (per process) or "db" (rate_limit_buckets table, shared by workers)
+
+# Retries and hedging of chat completion requests, before the first token
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3"))  # Tries per turn for retryable errors (1 disables retries)
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.25"))  # Retry n waits a random time up to base * 2**n seconds
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "4"))  # Longest single wait between tries (seconds)
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "false").lower() == "true"  # Send a second request when the first token is slow
+UPSTREAM_HEDGE_DELAY = float(os.getenv("UPSTREAM_HEDGE_DELAY", "2"))  # Seconds before hedging until the p95 of recent first tokens is known
+
+# Exact-context cache of model replies (opt-in; retry always bypasses it)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "0"))  # Replies kept in memory (LRU, 0 disables)
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # Seconds a cached reply is reused
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "false").lower() == "true"  # Also persist replies in the response_cache table
+RESPONSE_CACHE_REPLAY_RATE = float(os.getenv("RESPONSE_CACHE_REPLAY_RATE", "100"))  # Chunks per second when replaying (0 = all at once)
+
+# Pre-sampled alternate replies for an instant retry (opt-in; costs one extra completion per reply)
+PRESAMPLE_RETRY = os.getenv("PRESAMPLE_RETRY", "false").lower() == "true"  # Generate one alternate in the background after each reply
+PRESAMPLE_TOKENS_PER_HOUR = int(os.getenv("PRESAMPLE_TOKENS_PER_HOUR", "100000"))  # Token budget shared by all pre-sampling (prompt + alternate)
+PRESAMPLE_MAX_PROMPT_TOKENS = int(os.getenv("PRESAMPLE_MAX_PROMPT_TOKENS", "4000"))  # Longer contexts are not pre-sampled
+PRESAMPLE_TTL = int(os.getenv("PRESAMPLE_TTL", "600"))  # Seconds an alternate stays usable
+
+# Completed replies kept so an edit back to an earlier wording reuses its reply (reply_variants table)
+REPLY_VARIANT_TTL = int(os.getenv("REPLY_VARIANT_TTL", "86400"))  # Seconds a kept reply is reused before it is purged
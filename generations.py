@@ -0,0 +1,143 @@
+"""
+One generation at a time per chat session.
+
+Every send / edit / retry stream is a Generation with its own id and stop
+event. When a session already has one running (an edit while a reply is
+streaming, two tabs), the new one follows GENERATION_POLICY:
+
+  reject   fail at once with an error frame
+  queue    wait, in arrival order, for the running generation to finish
+  preempt  stop the running generation and start once it has saved its partial reply
+
+Waiting is bounded by GENERATION_QUEUE_TIMEOUT. Stop requests and cleanup act
+on one generation by id, so a stream that finishes can never remove another
+generation's stop event, and two generations never race on the same rows.
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Optional
+
+import metrics
+from env import GENERATION_POLICY, GENERATION_QUEUE_TIMEOUT
+
+POLICIES = ("reject", "queue", "preempt")
+
+
+class GenerationBusy(Exception):
+    """The session already has a generation and this one may not run"""
+
+
+class Generation:
+    """One streamed reply for a session"""
+
+    def __init__(self, session_id: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.stop_event = threading.Event()
+        self.started = False  # True once it holds the session
+        self.prompt_tokens = 0  # Tokens sent upstream (history included), for rate limiting
+        self.completion_tokens = 0  # Tokens streamed back so far
+        self.cached = False  # Replayed from the response cache or a pre-sampled alternate, so no upstream tokens were used
+        self.committed = False  # Stored rows were changed (user row saved, message edited, reply deleted), so the turn must not run twice
+
+    @property
+    def upstream_tokens(self) -> int:
+        """Tokens this generation cost upstream"""
+        return 0 if self.cached else self.prompt_tokens + self.completion_tokens
+
+
+class GenerationRegistry:
+    """Running and waiting generations by session"""
+
+    def __init__(self, policy: str = GENERATION_POLICY, timeout: float = GENERATION_QUEUE_TIMEOUT):
+        if policy not in POLICIES:
+            raise ValueError(f"GENERATION_POLICY must be one of {', '.join(POLICIES)}, got {policy!r}")
+        self.policy = policy
+        self.timeout = timeout
+        self._changed = threading.Condition()
+        self._active = {}  # session_id -> Generation
+        self._waiting = {}  # session_id -> deque of Generation
+
+    def acquire(self, generation: Generation, policy: Optional[str] = None):
+        """
+        Block until the generation holds its session. Raises GenerationBusy when the policy
+        rejects it or the wait times out; returns with started=False if it was stopped while
+        waiting.
+        """
+        policy = policy or self.policy
+        session_id = generation.session_id
+        start = time.perf_counter()
+        with self._changed:
+            queue = self._waiting.setdefault(session_id, deque())
+            current = self._active.get(session_id)
+            if current is not None or queue:
+                if policy == "reject":
+                    self._drop_queue(session_id)
+                    metrics.inc("generation.rejected")
+                    raise GenerationBusy("A response is already being generated for this session")
+                if policy == "preempt":
+                    # The newest request wins over the running and the waiting ones
+                    for other in [current, *queue]:
+                        if other is not None:
+                            other.stop_event.set()
+                    metrics.inc("generation.preempted")
+                    self._changed.notify_all()
+
+            queue.append(generation)
+            try:
+                deadline = time.monotonic() + self.timeout
+                while self._active.get(session_id) is not None or queue[0] is not generation:
+                    if generation.stop_event.is_set():
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.inc("generation.timeouts")
+                        raise GenerationBusy("Timed out waiting for the previous response to finish")
+                    self._changed.wait(remaining)
+
+                self._active[session_id] = generation
+                generation.started = True
+            finally:
+                queue.remove(generation)
+                self._drop_queue(session_id)
+                self._changed.notify_all()
+                metrics.observe("generation.wait_seconds", time.perf_counter() - start)
+
+    def release(self, generation: Generation):
+        """End the generation; only clears the session if this generation still holds it"""
+        with self._changed:
+            if self._active.get(generation.session_id) is generation:
+                del self._active[generation.session_id]
+                self._changed.notify_all()
+
+    def stop(self, session_id: str, generation_id: Optional[str] = None) -> bool:
+        """Stop the session's running generation, or the (running or waiting) one with this id"""
+        with self._changed:
+            current = self._active.get(session_id)
+            if generation_id is None:
+                target = current
+            else:
+                candidates = [current, *self._waiting.get(session_id, ())]
+                target = next((g for g in candidates if g is not None and g.id == generation_id), None)
+            if target is None:
+                return False
+            target.stop_event.set()
+            self._changed.notify_all()
+            return True
+
+    def active(self, session_id: str) -> Optional[Generation]:
+        with self._changed:
+            return self._active.get(session_id)
+
+    def _drop_queue(self, session_id: str):
+        if not self._waiting.get(session_id):
+            self._waiting.pop(session_id, None)
+
+
+# Shared registry used by the chat endpoints
+generations = GenerationRegistry()
+
+metrics.set_gauge("generation.active", lambda: len(generations._active))
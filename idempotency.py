@@ -0,0 +1,151 @@
+"""
+Idempotency keys and single-flight deduplication for chat turns.
+
+A client that sends the same Idempotency-Key twice (a double Enter, a Gradio
+re-submit, a retry after a dropped connection) must not get a second user
+row or a second paid completion. The first request with a key starts a
+flight: its stream runs in a background thread and every NDJSON line is
+recorded. A duplicate that arrives while the flight is running attaches to
+it and receives the same lines; one that arrives after it finished replays
+the recorded result. Completed flights are kept for IDEMPOTENCY_TTL seconds
+(at most IDEMPOTENCY_MAX_KEYS of them). Flights that ended in an error before
+the turn changed any stored rows are forgotten, so retrying the key runs the
+turn again; once the user row is saved (or a message edited, or a reply
+deleted) the error is replayed like any other result, so a retry cannot
+insert the user message twice.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Iterator, Optional
+
+import metrics
+from env import IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+
+def request_fingerprint(*parts: str) -> str:
+    """Fingerprint of the request body, so a reused key with a different message is caught"""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """The NDJSON lines of one stream, readable by any number of clients while it runs"""
+
+    def __init__(self, fingerprint: str, generation_id: Optional[str] = None):
+        self.fingerprint = fingerprint
+        self.generation_id = generation_id  # Generation that produces the lines
+        self.lines = []
+        self.done = False
+        self.failed = False
+        self.finished_at = None
+        self._changed = threading.Condition()
+
+    def append(self, line: str):
+        with self._changed:
+            self.lines.append(line)
+            if "error" in json.loads(line):
+                self.failed = True
+            self._changed.notify_all()
+
+    def finish(self):
+        with self._changed:
+            self.done = True
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    def replay(self) -> Iterator[str]:
+        """Yield every line from the start, waiting for new ones until the stream is done"""
+        position = 0
+        while True:
+            with self._changed:
+                while position == len(self.lines) and not self.done:
+                    self._changed.wait()
+                pending = self.lines[position:]
+                done = self.done
+            yield from pending
+            position += len(pending)
+            if done and position == len(self.lines):
+                return
+
+
+class IdempotencyStore:
+    """In-flight and recently completed flights by key"""
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._flights = OrderedDict()  # key -> Flight
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def begin(self, key: str, fingerprint: str, generation_id: Optional[str] = None):
+        """Return (flight, started): started is False when the key is already in flight or done"""
+        with self._lock:
+            self._expire()
+            flight = self._flights.get(key)
+            if flight is not None:
+                if flight.fingerprint != fingerprint:
+                    metrics.inc("idempotency.conflicts")
+                    raise IdempotencyConflict(key)
+                metrics.inc("idempotency.replays" if flight.done else "idempotency.joins")
+                return flight, False
+
+            flight = Flight(fingerprint, generation_id)
+            self._flights[key] = flight
+            return flight, True
+
+    def complete(self, key: str, flight: Flight, retryable: bool = True):
+        """Mark the flight done; failed flights are dropped so the key can be retried, unless not retryable"""
+        flight.finish()
+        with self._lock:
+            if flight.failed and retryable and self._flights.get(key) is flight:
+                del self._flights[key]
+            self._expire()
+
+    def clear(self):
+        with self._lock:
+            self._flights.clear()
+
+    def _expire(self):
+        # Only finished flights expire; running ones stay until they complete
+        now = time.time()
+        finished = [key for key, flight in self._flights.items() if flight.done]
+        for key in finished:
+            if now - self._flights[key].finished_at > self.ttl_seconds:
+                del self._flights[key]
+        finished = [key for key in finished if key in self._flights]
+        while len(self._flights) > self.max_keys and finished:
+            del self._flights[finished.pop(0)]
+
+
+def run_flight(store: IdempotencyStore, key: str, flight: Flight, stream: Iterable[str],
+               retryable: Callable[[], bool] = lambda: True):
+    """
+    Drive the stream in a background thread, so it completes even if the first client leaves.
+    retryable() is asked when the stream ends: False keeps a failed flight for replay.
+    """
+    def pump():
+        try:
+            for line in stream:
+                flight.append(line)
+        except Exception as e:
+            flight.append(json.dumps({"error": str(e)}) + "\n")
+        finally:
+            store.complete(key, flight, retryable())
+
+    threading.Thread(target=pump, name="idempotent-stream", daemon=True).start()
+
+
+# Shared store used by the chat endpoints
+idempotency_store = IdempotencyStore()
+
+metrics.set_gauge("idempotency.keys", lambda: len(idempotency_store))
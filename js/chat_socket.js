@@ -0,0 +1,145 @@
+(function() {
+    // One WebSocket per chat session (/ws/chat/{session_id} in api.py) that carries edit and
+    // stop requests without a new HTTP request each. Callers fall back to the HTTP endpoints
+    // whenever the socket is not open.
+    const API_BASE = '__API_BASE_URL__';
+    const CONNECT_TIMEOUT_MS = 2000;
+
+    let socket = null;
+    let socketSessionId = null;
+    let connecting = null;
+    let nextTurn = 1;
+    const turns = new Map(); // turn id -> ReadableStream controller
+    const encoder = new TextEncoder();
+
+    function socketUrl(sessionId) {
+        // http -> ws, https -> wss
+        const base = API_BASE.replace(/^http/, 'ws');
+        return `${base}/ws/chat/${encodeURIComponent(sessionId)}`;
+    }
+
+    // Route a server frame to the stream of its turn, as an NDJSON line
+    function handleFrame(event) {
+        let frame;
+        try {
+            frame = JSON.parse(event.data);
+        } catch (e) {
+            console.warn('⚠️ Invalid WebSocket frame:', event.data);
+            return;
+        }
+        const controller = turns.get(frame.turn);
+        if (!controller) return;
+
+        const { turn, done, ...data } = frame;
+        if (Object.keys(data).length > 0) {
+            controller.enqueue(encoder.encode(JSON.stringify(data) + '\n'));
+        }
+        if (done) {
+            turns.delete(turn);
+            controller.close();
+        }
+    }
+
+    function failPendingTurns() {
+        for (const controller of turns.values()) {
+            controller.error(new Error('WebSocket closed'));
+        }
+        turns.clear();
+    }
+
+    // Resolve with the open socket for this session, or null if it cannot be opened
+    function connect(sessionId) {
+        if (typeof WebSocket === 'undefined' || !sessionId) {
+            return Promise.resolve(null);
+        }
+        if (socket && socketSessionId === sessionId && socket.readyState === WebSocket.OPEN) {
+            return Promise.resolve(socket);
+        }
+        if (connecting && socketSessionId === sessionId) {
+            return connecting;
+        }
+        if (socket) {
+            socket.close();
+            socket = null;
+        }
+
+        socketSessionId = sessionId;
+        connecting = new Promise((resolve) => {
+            let ws;
+            try {
+                ws = new WebSocket(socketUrl(sessionId));
+            } catch (e) {
+                resolve(null);
+                return;
+            }
+            const timer = setTimeout(() => {
+                ws.close();
+                resolve(null);
+            }, CONNECT_TIMEOUT_MS);
+            ws.onopen = () => {
+                clearTimeout(timer);
+                socket = ws;
+                console.log('✅ Chat WebSocket connected');
+                resolve(ws);
+            };
+            ws.onerror = () => {
+                clearTimeout(timer);
+                resolve(null);
+            };
+            ws.onmessage = handleFrame;
+            ws.onclose = () => {
+                if (socket === ws) {
+                    socket = null;
+                    failPendingTurns();
+                }
+            };
+        }).finally(() => {
+            connecting = null;
+        });
+        return connecting;
+    }
+
+    // Start a turn over the socket. Resolves with a Response whose body is the same NDJSON
+    // stream the HTTP endpoint returns, or null when the socket is unavailable.
+    async function fetchStream(sessionId, type, payload) {
+        const ws = await connect(sessionId);
+        if (!ws) return null;
+
+        const turn = nextTurn++;
+        const body = new ReadableStream({
+            start(controller) {
+                turns.set(turn, controller);
+            }
+        });
+        ws.send(JSON.stringify({ ...payload, type, turn }));
+        return new Response(body, { status: 200, headers: { 'Content-Type': 'text/event-stream' } });
+    }
+
+    // Send a stop request over the open socket; false if the caller should use HTTP instead.
+    // A turn streaming on this socket is stopped by its id, so another tab's reply is left alone.
+    function stop(sessionId) {
+        if (socket && socketSessionId === sessionId && socket.readyState === WebSocket.OPEN) {
+            const active = Array.from(turns.keys());
+            const request = active.length > 0 ? { type: 'stop', turn: active[active.length - 1] } : { type: 'stop' };
+            socket.send(JSON.stringify(request));
+            return true;
+        }
+        return false;
+    }
+
+    window.chattieSocket = { connect, fetchStream, stop };
+
+    // Connect as soon as the session is known, so the first edit or stop skips the handshake
+    document.addEventListener('sessionIdReady', (event) => {
+        const sid = event.detail && event.detail.sessionId;
+        if (typeof sid === 'string' && sid.trim()) {
+            connect(sid.trim());
+        }
+    });
+
+    // The prebuilt bundle is injected by a script tag, which runs asynchronously and can
+    // come after sessionIdReady has fired: use the session id that is already known
+    if (typeof window.__SESSION_ID__ === 'string' && window.__SESSION_ID__.trim()) {
+        connect(window.__SESSION_ID__.trim());
+    }
+})();
@@ -0,0 +1,47 @@
+(function() {
+    // Virtualized chat window: only recent messages are mounted (see CHAT_WINDOW_MESSAGES in main.py).
+    // Scrolling to the top of the chat clicks a hidden Gradio button that prepends the previous page.
+    const LOAD_THRESHOLD_PX = 40;
+    const LOAD_TIMEOUT_MS = 3000;
+    let loading = false;
+    
+    function findScrollContainer(target) {
+        if (!(target instanceof Element) || !target.closest('#chatbot-container')) {
+            return null;
+        }
+        return target;
+    }
+    
+    // Keep the message the user was reading in place once earlier messages are mounted
+    function anchorScroll(container, previousHeight) {
+        const observer = new MutationObserver(() => {
+            observer.disconnect();
+            clearTimeout(timeout);
+            requestAnimationFrame(() => {
+                container.scrollTop += container.scrollHeight - previousHeight;
+                loading = false;
+            });
+        });
+        // Nothing older to load: give up waiting
+        const timeout = setTimeout(() => {
+            observer.disconnect();
+            loading = false;
+        }, LOAD_TIMEOUT_MS);
+        observer.observe(container, { childList: true, subtree: true });
+    }
+    
+    // Scroll events don't bubble, so listen in the capture phase (no per-element setup)
+    document.addEventListener('scroll', (e) => {
+        if (loading) return;
+        const container = findScrollContainer(e.target);
+        if (!container || container.scrollTop > LOAD_THRESHOLD_PX) return;
+        
+        const trigger = document.querySelector('#load-earlier-trigger');
+        if (!trigger) return;
+        
+        loading = true;
+        anchorScroll(container, container.scrollHeight);
+        trigger.click();
+        console.log('⬆️ Loading earlier messages');
+    }, true);
+})();
@@ -26,43 +26,47 @@
             </svg>
         `;
         
-        // Function to inject edit button for latest user message
-        function injectEditButton() {
+        // Selectors that match a user message box
+        const USER_MESSAGE_SELECTOR =
+            '.message-wrap.user, ' +
+            '.message.user, ' +
+            '[class*="message-wrap"][class*="user"], ' +
+            '[class*="message"][class*="user"]';
+        
+        // Fallback check for user message boxes the selectors miss
+        function looksLikeUserMessage(element) {
+            const classes = (element.className || '').toString();
+            const hasUser = classes.includes('user');
+            const hasMessage = classes.includes('message') || classes.includes('message-wrap');
+            return hasUser && hasMessage;
+        }
+        
+        // User message that has the edit button, and the button itself
+        let editTarget = null;
+        let currentEditButton = null;
+        
+        // Full scan for the latest user message (only used once, at start-up)
+        function findLatestUserMessage() {
             // Find within chatbot container first
             const chatbot = document.querySelector('.chatbot, [data-testid*="chatbot"], #chatbot-container, [class*="chatbot"]');
             let searchRoot = chatbot || document;
             
             // Try multiple selectors to find user messages
-            let userMessages = Array.from(searchRoot.querySelectorAll(
-                '.message-wrap.user, ' +
-                '.message.user, ' +
-                '[class*="message-wrap"][class*="user"], ' +
-                '[class*="message"][class*="user"]'
-            ));
+            let userMessages = Array.from(searchRoot.querySelectorAll(USER_MESSAGE_SELECTOR));
             
             // Fallback search if needed
             if (userMessages.length === 0 && chatbot) {
-                const allDivs = Array.from(chatbot.querySelectorAll('div'));
-                userMessages = allDivs.filter(div => {
-                    const classes = (div.className || '').toString();
-                    const hasUser = classes.includes('user');
-                    const hasMessage = classes.includes('message') || classes.includes('message-wrap');
-                    return hasUser && hasMessage;
-                });
+                userMessages = Array.from(chatbot.querySelectorAll('div')).filter(looksLikeUserMessage);
             }
             
             console.log('🔍 Searching for user messages, found:', userMessages.length);
             
-            if (userMessages.length === 0) {
-                return;
-            }
-            
-            // Remove edit buttons from ALL user messages first
-            const allEditButtons = Array.from(searchRoot.querySelectorAll('.edit-user-message-btn'));
-            allEditButtons.forEach(btn => btn.remove());
-            
-            // Get the latest user message (last one in the DOM) - only add button to this one
-            const latestUserMessage = userMessages[userMessages.length - 1];
+            // The latest user message is the last one in the DOM
+            return userMessages.length > 0 ? userMessages[userMessages.length - 1] : null;
+        }
+        
+        // Function to inject edit button for latest user message
+        function injectEditButton(latestUserMessage) {
             if (!latestUserMessage) {
                 return;
             }
@@ -78,6 +82,12 @@
                 return;
             }
             
+            // Only the latest user message has an edit button
+            if (currentEditButton) {
+                currentEditButton.remove();
+            }
+            editTarget = latestUserMessage;
+            
             console.log('✅ Injecting edit button for latest user message only');
             
             // Get the text content
@@ -90,6 +100,7 @@
             editButton.setAttribute('aria-label', 'Edit message');
             editButton.setAttribute('title', 'Edit message');
             editButton.innerHTML = pencilIconSVG;
+            currentEditButton = editButton;
             
             // Add click handler to convert message to editable textarea
             editButton.addEventListener('click', (e) => {
@@ -476,12 +487,10 @@
         
         // Enable stop button when sending edited message
         function enableStopButtonForEdit() {
-            // Trigger the stop button monitoring by dispatching a custom event
-            // or directly calling the stop button's startMonitoring function
-            const event = new CustomEvent('editMessageSent', {
-                detail: { action: 'startMonitoring' }
-            });
-            document.dispatchEvent(event);
+            // Announce the stream to stop_messages.js; sendEditedMessage announces its end
+            document.dispatchEvent(new CustomEvent('chattie:stream-start', {
+                detail: { source: 'edit' }
+            }));
             console.log('🔄 Stop button monitoring triggered for edited message');
         }
         
@@ -772,11 +781,21 @@
                 const trimmedSessionId = currentSessionId.trim();
                 console.log('📤 Sending edit request with session_id:', trimmedSessionId.substring(0, 8) + '...');
                 
-                // Call the edit API endpoint and stream the response
-                const response = await fetch(`${API_BASE}/chat/edit/`, {
+                // One key per edit, so a repeated request for it shares the first one's response
+                const idempotencyKey = (window.crypto && window.crypto.randomUUID) ?
+                    window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+                
+                // Stream over the session's WebSocket when it is open, otherwise call the edit API endpoint
+                const socketResponse = window.chattieSocket ?
+                    await window.chattieSocket.fetchStream(trimmedSessionId, 'edit', {
+                        message: editedText,
+                        idempotency_key: idempotencyKey
+                    }) : null;
+                const response = socketResponse || await fetch(`${API_BASE}/chat/edit/`, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
+                        'Idempotency-Key': idempotencyKey,
                     },
                     body: JSON.stringify({
                         session_id: trimmedSessionId,
@@ -788,7 +807,14 @@
                 });
                 
                 if (!response || !response.ok) {
-                    const msg = `Error: Edit request failed (status ${response ? response.status : 'no response'}).`;
+                    const busy = response && (response.status === 429 || response.status === 503);
+                    const reason = busy ? ((await response.json().catch(() => ({}))).error || '') : '';
+                    const retryAfter = busy ? (response.headers.get('Retry-After') || 'a few') : '';
+                    const msg = !busy
+                        ? `Error: Edit request failed (status ${response ? response.status : 'no response'}).`
+                        : reason.startsWith('Rate limit')
+                            ? `Rate limit exceeded, please try again in ${retryAfter} seconds.`
+                            : `Server is busy, please try again in ${retryAfter} seconds.`;
                     if (textNodeToUpdate) {
                         textNodeToUpdate.textContent = msg;
                     } else if (botMessageElement) {
@@ -797,6 +823,10 @@
                     throw new Error(msg);
                 }
                 
+                // The stop button stops this generation only (not a reply from another tab)
+                const generationId = response.headers.get('X-Generation-Id');
+                window.chattieActiveGeneration = generationId ? { sessionId: trimmedSessionId, id: generationId } : null;
+                
                 // Read streaming response
                 const reader = response.body ? response.body.getReader() : null;
                 if (!reader) {
@@ -899,47 +929,66 @@
                 // Re-enable buttons
                 if (sendBtn) sendBtn.disabled = false;
                 if (cancelBtn) cancelBtn.disabled = false;
+            } finally {
+                window.chattieActiveGeneration = null;
+                // The edit stream is read here, not by Gradio, so announce its end ourselves
+                document.dispatchEvent(new CustomEvent('chattie:stream-end', {
+                    detail: { source: 'edit' }
+                }));
             }
         }
         
         // Watch for new user messages being added
-        let lastUserMessageCount = 0;
-        let isInjecting = false;
-
-        const observer = new MutationObserver((mutations) => {
-            if (isInjecting) {
-                return;
+        // Only the nodes added by each mutation are inspected, and the button goes
+        // into the latest of them, so neither a streamed token nor a new message
+        // costs a scan of the whole chat
+        const INJECT_DEBOUNCE_MS = 150;
+        let injectTimer = null;
+        let addedUserMessages = [];  // User messages added since the last injection
+        
+        function scheduleInjection() {
+            // Debounced: a burst of mutations (re-render, streaming) injects once
+            clearTimeout(injectTimer);
+            injectTimer = setTimeout(() => {
+                injectTimer = null;
+                const added = addedUserMessages.filter(message => message.isConnected);
+                addedUserMessages = [];
+                const latest = added[added.length - 1];
+                // Earlier messages loaded above the current one do not take the button
+                if (latest && (!editTarget || !editTarget.isConnected ||
+                        (editTarget.compareDocumentPosition(latest) & Node.DOCUMENT_POSITION_FOLLOWING))) {
+                    injectEditButton(latest);
+                }
+            }, INJECT_DEBOUNCE_MS);
+        }
+        
+        // Collect the user message boxes an added node is or contains, in DOM order
+        function collectUserMessages(node, into) {
+            if (node.nodeType !== Node.ELEMENT_NODE) {
+                return; // Streamed text
             }
-            
-            const chatbot = document.querySelector('.chatbot, [data-testid*="chatbot"], #chatbot-container, [class*="chatbot"]');
-            const searchRoot = chatbot || document;
-            
-            let userMessages = Array.from(searchRoot.querySelectorAll(
-                '.message-wrap.user, ' +
-                '.message.user, ' +
-                '[class*="message-wrap"][class*="user"], ' +
-                '[class*="message"][class*="user"]'
-            ));
-            
-            if (userMessages.length === 0 && chatbot) {
-                const allDivs = Array.from(chatbot.querySelectorAll('div'));
-                userMessages = allDivs.filter(div => {
-                    const classes = (div.className || '').toString();
-                    const hasUser = classes.includes('user');
-                    const hasMessage = classes.includes('message') || classes.includes('message-wrap');
-                    return hasUser && hasMessage;
-                });
+            if (node.classList.contains('edit-user-message-btn')) {
+                return; // Our own button
             }
-            
-            if (userMessages.length !== lastUserMessageCount) {
-                isInjecting = true;
-                setTimeout(() => {
-                    injectEditButton();
-                    lastUserMessageCount = userMessages.length;
-                    setTimeout(() => {
-                        isInjecting = false; // Set to false until next new user message triggers injection
-                    }, 100);
-                }, 300);
+            if (node.matches(USER_MESSAGE_SELECTOR) || looksLikeUserMessage(node)) {
+                into.push(node);
+            }
+            if (node.firstElementChild !== null) {
+                into.push(...node.querySelectorAll(USER_MESSAGE_SELECTOR));
+            }
+        }
+        
+        const observer = new MutationObserver((mutations) => {
+            // Every batch that adds a user message re-arms the timer, so injection
+            // runs once the burst has settled rather than in the middle of it
+            const before = addedUserMessages.length;
+            for (const mutation of mutations) {
+                for (const node of mutation.addedNodes) {
+                    collectUserMessages(node, addedUserMessages);
+                }
+            }
+            if (addedUserMessages.length > before) {
+                scheduleInjection();
             }
         });
         
@@ -954,7 +1003,9 @@
         
         // Initial injection
         setTimeout(() => {
-            injectEditButton();
+            if (!editTarget) {
+                injectEditButton(findLatestUserMessage());
+            }
         }, 1000);
         
         console.log('✅ Edit button script initialized');
@@ -11,55 +11,50 @@
     let textbox = null;
     let originalPlaceholder = null;
     
-    const SPEECH_TO_TEXT_API = '__API_BASE_URL__/speech-to-text/';
+    // Streams partial transcripts while the pieces of a long recording are transcribed
+    const SPEECH_TO_TEXT_API = '__API_BASE_URL__/speech-to-text/stream';
     
-    // Initialize microphone button handlers
-    function setupMicrophoneButton() {
-        // Find all microphone buttons (welcome and chat sections)
-        const micButtons = document.querySelectorAll('#mic-button');
-        
-        if (micButtons.length === 0) {
-            console.log('🎤 Microphone buttons not found, will retry...');
-            setTimeout(setupMicrophoneButton, 500);
-            return;
-        }
-        
-        console.log(`🎤 Found ${micButtons.length} microphone button(s)`);
-        
-        // Attach click event to all microphone buttons
-        micButtons.forEach((btn, index) => {
-            // Check if listener already attached (prevent duplicates)
-            if (!btn.hasAttribute('data-mic-listener-attached')) {
-                // Add click event to toggle recording
-                btn.addEventListener('click', toggleRecording);
-                btn.setAttribute('data-mic-listener-attached', 'true');
-                console.log(`✅ Microphone button ${index + 1} handler attached`);
-            }
-        });
-        
-        // Keep a reference to the main mic button, even if there are multiple buttons on the page
-        microphoneButton = micButtons[0];
-        
-        // Find textbox (will be updated based on which button is clicked)
-        textbox = document.querySelector('textarea[placeholder*="help"], textarea[data-testid*="textbox"], textarea');
-        
-        if (textbox) {
-            // Store original placeholder
-            if (!originalPlaceholder) {
-                originalPlaceholder = textbox.placeholder || 'How can I help you today?';
-            }
-            console.log('✅ Textbox found');
-        } else {
-            console.log('📝 Textbox not found, will retry...');
-            setTimeout(setupMicrophoneButton, 500);
-            return;
+    // Upload profile: mono Opus at a speech bitrate (Whisper works on 16 kHz mono anyway)
+    const AUDIO_BITS_PER_SECOND = 24000;
+    
+    // Voice activity detection: the recorder is paused while the microphone is silent,
+    // so leading/trailing silence and long pauses are never encoded or uploaded
+    const VAD_RMS_THRESHOLD = 0.015;  // RMS level (0-1) counted as speech
+    const VAD_HANGOVER_MS = 600;  // Keep recording this long after speech stops
+    const VAD_FRAME_MS = 30;  // Analysis interval
+    
+    let audioContext = null;
+    let vadTimer = null;
+    let lastVoiceAt = 0;
+    let speechDetected = false;
+    let voicedMs = 0;  // Time the recorder spent in the 'recording' state
+    let resumedAt = 0;
+    let recorderStopped = Promise.resolve();  // Resolves after the final chunk is delivered
+    let recorderOptions = null;
+    
+    // Live transcription: audio is streamed to the server while recording and a new segment
+    // starts after each pause, so earlier segments are transcribed while the user still speaks
+    const LIVE_SPEECH_SOCKET = '__API_BASE_URL__/ws/speech'.replace(/^http/, 'ws');
+    const LIVE_CONNECT_TIMEOUT_MS = 1500;
+    const LIVE_SEGMENT_MIN_MS = 3000;  // Speech in a segment before a pause may end it
+    
+    let liveSocket = null;  // Open /ws/speech connection while recording live
+    let liveConnecting = Promise.resolve(null);
+    let liveFinal = Promise.resolve(null);  // Resolves with the server's final frame
+    let liveSegments = [];  // Interim transcripts by segment index
+    let segmentStartVoicedMs = 0;  // voicedMs when the current segment started
+    
+    // Microphone buttons are handled by one delegated click listener on the document,
+    // so buttons Gradio renders later need no polling or DOM observers
+    function handleMicrophoneClick(e) {
+        const button = e.target.closest && e.target.closest('#mic-button');
+        if (button) {
+            toggleRecording(e, button);
         }
-        
-        console.log('✅ Microphone buttons setup complete');
     }
     
     // Toggle recording (click to start, will be stopped by cancel/confirm buttons)
-    async function toggleRecording(e) {
+    async function toggleRecording(e, button) {
         e.preventDefault();
         e.stopPropagation();
         
@@ -69,10 +64,11 @@
         }
         
         // Find the textbox associated with the clicked button
-        const clickedButton = e.currentTarget || e.target.closest('#mic-button');
+        const clickedButton = button || e.target.closest('#mic-button');
         let inputContainer = null;
         
         if (clickedButton) {
+            microphoneButton = clickedButton;
             // Find the textbox in the same input container
             inputContainer = clickedButton.closest('#input-container');
             if (inputContainer) {
@@ -174,22 +170,29 @@
                 throw new Error('getUserMedia is not supported in this browser');
             }
             
+            // Connect for live transcription while the user answers the permission prompt
+            liveConnecting = openLiveSocket();
+            
             // Request microphone access
             // Return a MediaStream (container of live media)
             currentStream = await navigator.mediaDevices.getUserMedia({ 
                 audio: {
                     echoCancellation: true,
                     noiseSuppression: true,
-                    sampleRate: 44100,
+                    sampleRate: 16000,
                     channelCount: 1
                 } 
             });
             
             console.log('✅ Microphone access granted');
             
+            // Without the socket the recording is uploaded in one piece after stop
+            startLiveTranscription(await liveConnecting);
+            
             // Tell the MediaRecorder what format to encode the audio in
             const options = {
-                mimeType: 'audio/webm;codecs=opus'
+                mimeType: 'audio/webm;codecs=opus',
+                audioBitsPerSecond: AUDIO_BITS_PER_SECOND
             };
             
             // Fallback to default if webm not supported
@@ -198,41 +201,14 @@
                 options.mimeType = '';
             }
             
-            // Create MediaRecorder
-            mediaRecorder = new MediaRecorder(currentStream, options);
-            
+            recorderOptions = options;
             audioChunks = [];
-            
-            // Called every time the recorder has a chunk of recorded audio ready
-            mediaRecorder.ondataavailable = (event) => {
-                if (event.data && event.data.size > 0) {
-                    audioChunks.push(event.data);
-                    console.log('📦 Audio chunk received:', event.data.size, 'bytes');
-                }
-            };
-            
-            // Run when recording stops
-            mediaRecorder.onstop = async () => {
-                // Stop all tracks to release microphone
-                if (currentStream) {
-                    currentStream.getTracks().forEach(track => {
-                        track.stop(); // Stop actual device, release the mic
-                        console.log('🛑 Track stopped:', track.kind);
-                    });
-                    currentStream = null;
-                }
-            };
-            
-            mediaRecorder.onerror = (event) => {
-                console.error('❌ MediaRecorder error:', event.error);
-                stopRecording();
-                hideRecordingUI();
-                alert('Error during recording. Please try again.');
-            };
+            mediaRecorder = createRecorder();
             
             // Start recording
             mediaRecorder.start(100); // Collect data every 100ms
             isRecording = true;
+            startVoiceActivityDetection(currentStream);
             
             console.log('🎤 Recording started, state:', mediaRecorder.state);
             
@@ -254,6 +230,8 @@
             }
             
             alert(errorMessage);
+            liveConnecting.then(ws => ws && ws.close());
+            closeLiveSocket(false);
             
             // Restore buttons if recording failed
             const inputContainer = textbox ? (textbox.closest('#input-container') || textbox.parentElement) : null;
@@ -298,15 +276,143 @@
         }
     }
     
+    // Create a recorder on the current stream (live mode streams its audio as it is encoded)
+    function createRecorder() {
+        const recorder = new MediaRecorder(currentStream, recorderOptions);
+        
+        // Called every time the recorder has a chunk of recorded audio ready
+        recorder.ondataavailable = (event) => {
+            if (event.data && event.data.size > 0) {
+                if (liveSocket) {
+                    sendLive(event.data);
+                } else {
+                    audioChunks.push(event.data);
+                }
+                console.log('📦 Audio chunk received:', event.data.size, 'bytes');
+            }
+        };
+        
+        // Run when recording stops
+        let resolveStopped;
+        recorderStopped = new Promise(resolve => { resolveStopped = resolve; });
+        recorder.onstop = async () => {
+            resolveStopped();
+            // A live segment ended at a pause; the microphone stays on
+            if (isRecording) return;
+            // Stop all tracks to release microphone
+            if (currentStream) {
+                currentStream.getTracks().forEach(track => {
+                    track.stop(); // Stop actual device, release the mic
+                    console.log('🛑 Track stopped:', track.kind);
+                });
+                currentStream = null;
+            }
+        };
+        
+        recorder.onerror = (event) => {
+            console.error('❌ MediaRecorder error:', event.error);
+            stopRecording();
+            closeLiveSocket(true);
+            hideRecordingUI();
+            alert('Error during recording. Please try again.');
+        };
+        
+        return recorder;
+    }
+    
+    // Resolve with an open /ws/speech socket, or null if live transcription is unavailable
+    function openLiveSocket() {
+        if (typeof WebSocket === 'undefined') return Promise.resolve(null);
+        return new Promise((resolve) => {
+            let ws;
+            try {
+                ws = new WebSocket(LIVE_SPEECH_SOCKET);
+            } catch (e) {
+                resolve(null);
+                return;
+            }
+            const timer = setTimeout(() => {
+                ws.close();
+                resolve(null);
+            }, LIVE_CONNECT_TIMEOUT_MS);
+            ws.onopen = () => {
+                clearTimeout(timer);
+                resolve(ws);
+            };
+            ws.onerror = () => {
+                clearTimeout(timer);
+                resolve(null);
+            };
+        });
+    }
+    
+    function startLiveTranscription(ws) {
+        liveSocket = ws;
+        liveSegments = [];
+        segmentStartVoicedMs = 0;
+        if (!ws) return;
+        
+        console.log('🎤 Live transcription connected');
+        liveFinal = new Promise((resolve) => {
+            ws.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                if (data.status) {
+                    resolve(data);
+                    return;
+                }
+                liveSegments[data.segment] = data.text;
+                // The recording overlay covers the input until the user confirms
+                if (!isRecording && liveText()) {
+                    setTranscript(liveText(), false);
+                }
+            };
+            ws.onclose = () => resolve(null);
+        });
+    }
+    
+    function liveText() {
+        return liveSegments.filter(Boolean).join(' ');
+    }
+    
+    function sendLive(data) {
+        if (liveSocket && liveSocket.readyState === WebSocket.OPEN) {
+            liveSocket.send(data);
+        }
+    }
+    
+    function closeLiveSocket(cancel) {
+        if (!liveSocket) return;
+        if (cancel) {
+            sendLive(JSON.stringify({ type: 'cancel' }));
+        }
+        liveSocket.close();
+        liveSocket = null;
+    }
+    
+    // Live mode: end the current segment at this pause. Its recorder delivers the rest of its
+    // audio before the stop event, so the server receives a complete clip; the next segment
+    // starts in a new recorder when speech resumes.
+    function endLiveSegment() {
+        const durationMs = Math.round(voicedMs - segmentStartVoicedMs);
+        segmentStartVoicedMs = voicedMs;
+        mediaRecorder.addEventListener('stop', () => {
+            sendLive(JSON.stringify({ type: 'segment', duration_ms: durationMs }));
+        });
+        mediaRecorder.stop();
+    }
+    
     // Stop recording audio (without processing)
     function stopRecording() {
         if (!isRecording || !mediaRecorder) return;
         
-        // Only stop if recording is in progress
-        if (mediaRecorder.state === 'recording' || mediaRecorder.state === 'inactive') {
+        stopVoiceActivityDetection();
+        
+        // Only stop if recording is in progress (a recorder paused by the VAD can be stopped too;
+        // after a live segment ended at a pause there is no recorder to stop)
+        isRecording = false;
+        if (mediaRecorder.state !== 'inactive') {
             try {
                 mediaRecorder.stop();
-                isRecording = false;
                 
                 console.log('🎤 Recording stopped, state:', mediaRecorder.state);
             } catch (error) {
@@ -328,6 +434,76 @@
         }
     }
     
+    // Pause the recorder until speech starts and again after each pause longer than
+    // VAD_HANGOVER_MS. Without Web Audio support the whole recording is kept.
+    function startVoiceActivityDetection(stream) {
+        speechDetected = false;
+        voicedMs = 0;
+        const AudioContextClass = window.AudioContext || window.webkitAudioContext;
+        if (!AudioContextClass || typeof mediaRecorder.pause !== 'function') {
+            speechDetected = true;
+            resumedAt = performance.now();
+            return;
+        }
+        
+        audioContext = new AudioContextClass();
+        const analyser = audioContext.createAnalyser();
+        analyser.fftSize = 1024;
+        audioContext.createMediaStreamSource(stream).connect(analyser);
+        const samples = new Float32Array(analyser.fftSize);
+        
+        // Nothing is encoded before the first word
+        mediaRecorder.pause();
+        
+        const tick = () => {
+            if (!isRecording || !mediaRecorder) return;
+            
+            analyser.getFloatTimeDomainData(samples);
+            let sum = 0;
+            for (let i = 0; i < samples.length; i++) {
+                sum += samples[i] * samples[i];
+            }
+            const rms = Math.sqrt(sum / samples.length);
+            const now = performance.now();
+            
+            if (rms >= VAD_RMS_THRESHOLD) {
+                lastVoiceAt = now;
+                speechDetected = true;
+                if (mediaRecorder.state === 'inactive') {
+                    // First word after a live segment ended
+                    mediaRecorder = createRecorder();
+                    mediaRecorder.start(100);
+                    resumedAt = now;
+                } else if (mediaRecorder.state === 'paused') {
+                    mediaRecorder.resume();
+                    resumedAt = now;
+                }
+            } else if (mediaRecorder.state === 'recording' && now - lastVoiceAt > VAD_HANGOVER_MS) {
+                mediaRecorder.pause();
+                voicedMs += now - resumedAt;
+                if (liveSocket && voicedMs - segmentStartVoicedMs >= LIVE_SEGMENT_MIN_MS) {
+                    endLiveSegment();
+                }
+            }
+            vadTimer = setTimeout(tick, VAD_FRAME_MS);
+        };
+        tick();
+    }
+    
+    function stopVoiceActivityDetection() {
+        if (vadTimer) {
+            clearTimeout(vadTimer);
+            vadTimer = null;
+        }
+        if (mediaRecorder && mediaRecorder.state === 'recording') {
+            voicedMs += performance.now() - resumedAt;
+        }
+        if (audioContext) {
+            audioContext.close().catch(() => {});
+            audioContext = null;
+        }
+    }
+    
     // Show recording UI inside textbox
     function showRecordingUI() {
         if (!textbox) {
@@ -557,6 +733,7 @@
         
         // Stop recording
         stopRecording();
+        closeLiveSocket(true);
         
         // Hide recording UI
         hideRecordingUI();
@@ -694,22 +871,59 @@
         }
     }
     
+    // Put (partial) transcribed text in the input
+    function setTranscript(text, final) {
+        // Find the text input (could be welcome or chat)
+        const textInput = document.querySelector('textarea[placeholder*="help"], textarea[data-testid*="textbox"], textarea');
+        if (!textInput) {
+            console.error('❌ Text input not found');
+            return;
+        }
+        
+        // Set the transcribed text
+        textInput.value = text;
+        
+        // Trigger input event so Gradio recognizes the change
+        textInput.dispatchEvent(new Event('input', { bubbles: true }));
+        if (final) {
+            textInput.dispatchEvent(new Event('change', { bubbles: true }));
+            
+            // Focus the input
+            textInput.focus();
+        }
+    }
+    
     // Process recorded audio and send to backend
     async function processRecording() {
+        // Wait for the recorder to deliver its final chunk
+        await recorderStopped;
+        
+        if (liveSocket) {
+            return finishLiveTranscription();
+        }
+        
         if (audioChunks.length === 0) {
             console.log('⚠️ No audio data recorded');
             alert('No audio recorded. Please try again.');
             return;
         }
         
+        if (!speechDetected) {
+            console.log('⚠️ No speech detected');
+            audioChunks = [];
+            alert('No speech detected. Please try again.');
+            return;
+        }
+        
         try {
             // Combine audio chunks into a blob
             const audioBlob = new Blob(audioChunks, { type: 'audio/webm;codecs=opus' });
-            console.log('📦 Audio blob created:', audioBlob.size, 'bytes');
+            console.log('📦 Audio blob created:', audioBlob.size, 'bytes,', Math.round(voicedMs), 'ms of speech');
             
             // Create FormData to send to backend
             const formData = new FormData();
             formData.append('audio', audioBlob, 'recording.webm');
+            formData.append('duration_ms', String(Math.round(voicedMs)));
             
             console.log('📤 Sending audio to backend for transcription...');
             
@@ -723,29 +937,39 @@
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             
-            const result = await response.json();
+            // Read NDJSON lines: one per transcribed segment (in completion order), then the result
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            const segments = [];
+            let buffer = '';
+            let result = null;
             
-            if (result.status === 'success' && result.text) {
-                console.log('✅ Transcription successful:', result.text);
+            while (!result) {
+                const { done, value } = await reader.read();
+                if (done) break;
                 
-                // Find the text input (could be welcome or chat)
-                const textInput = document.querySelector('textarea[placeholder*="help"], textarea[data-testid*="textbox"], textarea');
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop() || ''; // Keep incomplete line in buffer
                 
-                if (textInput) {
-                    // Set the transcribed text
-                    textInput.value = result.text;
-                    
-                    // Trigger input event so Gradio recognizes the change
-                    textInput.dispatchEvent(new Event('input', { bubbles: true }));
-                    textInput.dispatchEvent(new Event('change', { bubbles: true }));
-                    
-                    // Focus the input
-                    textInput.focus();
-                } else {
-                    console.error('❌ Text input not found');
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const data = JSON.parse(line);
+                    if (data.status) {
+                        result = data;
+                        break;
+                    }
+                    // Show what has been transcribed so far, in recording order
+                    segments[data.segment] = data.text;
+                    setTranscript(segments.filter(Boolean).join(' '), false);
                 }
+            }
+            
+            if (result && result.status === 'success' && result.text) {
+                console.log('✅ Transcription successful:', result.text);
+                setTranscript(result.text, true);
             } else {
-                console.error('❌ Transcription failed:', result.error || 'Unknown error');
+                console.error('❌ Transcription failed:', (result && result.error) || 'Unknown error');
                 alert('Error transcribing audio. Please try again.');
             }
             
@@ -758,60 +982,37 @@
         }
     }
     
-    // Initialize when DOM is ready
-    if (document.readyState === 'loading') {
-        document.addEventListener('DOMContentLoaded', () => {
-            console.log('🎤 DOM ready, setting up microphone button');
-            setupMicrophoneButton();
-            // Also set up periodic check for chat button
-            setTimeout(setupMicrophoneButton, 1000);
-        });
-    } else {
-        console.log('🎤 DOM already ready, setting up microphone button');
-        setupMicrophoneButton();
-        // Also set up periodic check for chat button
-        setTimeout(setupMicrophoneButton, 1000);
-    }
-    
-    // Also watch for Gradio's dynamic DOM updates
-    const observer = new MutationObserver((mutations) => {
-        // Check for new microphone buttons
-        const currentMicButtons = document.querySelectorAll('#mic-button');
-        
-        // Check if any button is missing the listener attribute
-        let needsSetup = false;
-        currentMicButtons.forEach(btn => {
-            if (!btn.hasAttribute('data-mic-listener-attached')) {
-                needsSetup = true;
+    // Live mode: most segments are already transcribed; only the last one is still in flight
+    async function finishLiveTranscription() {
+        const final = liveFinal;
+        try {
+            if (!speechDetected) {
+                console.log('⚠️ No speech detected');
+                closeLiveSocket(true);
+                alert('No speech detected. Please try again.');
+                return;
             }
-        });
-        
-        if (needsSetup) {
-            console.log(`🔄 Detected ${currentMicButtons.length} microphone button(s), some need setup...`);
-            setupMicrophoneButton();
-        }
-    });
-    
-    observer.observe(document.body, {
-        childList: true,
-        subtree: true,
-        attributes: true, // Watch for visibility changes
-        attributeFilter: ['style', 'class'] // Watch for style/class changes that might show/hide elements
-    });
-    
-    // Also periodically check (in case MutationObserver misses something)
-    setInterval(() => {
-        const currentMicButtons = document.querySelectorAll('#mic-button');
-        let needsSetup = false;
-        currentMicButtons.forEach(btn => {
-            if (!btn.hasAttribute('data-mic-listener-attached')) {
-                needsSetup = true;
+            
+            if (liveText()) {
+                setTranscript(liveText(), false);
             }
-        });
-        if (needsSetup && currentMicButtons.length > 0) {
-            console.log('🔄 Periodic check: Setting up microphone buttons...');
-            setupMicrophoneButton();
+            sendLive(JSON.stringify({ type: 'stop', duration_ms: Math.round(voicedMs - segmentStartVoicedMs) }));
+            console.log('📤 Waiting for the last segment, ' + Math.round(voicedMs) + ' ms of speech');
+            
+            const result = await final;
+            if (result && result.status === 'success' && result.text) {
+                console.log('✅ Transcription successful:', result.text);
+                setTranscript(result.text, true);
+            } else {
+                console.error('❌ Transcription failed:', (result && result.error) || 'Connection closed');
+                alert('Error transcribing audio. Please try again.');
+            }
+        } finally {
+            closeLiveSocket(false);
         }
-    }, 2000); // Check every 2 seconds
+    }
+    
+    document.addEventListener('click', handleMicrophoneClick);
+    console.log('✅ Microphone click handler attached');
     
 })();
\ No newline at end of file
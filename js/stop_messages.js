@@ -40,174 +40,55 @@
     // Setup stop button functionality
     function setupStopButton() {
         // Track streaming state
-        let lastBotMessageLength = 0;
-        let lastContentCheck = 0;
-        let loadingDotsDisappearedAt = 0; // Track when loading dots disappeared
-        let streamingTimeout = null;
+        // Streams are announced with explicit events instead of being inferred by polling the DOM:
+        // 'chattie:stream-start' from the send/retry/edit triggers below and the edit script,
+        // 'chattie:stream-end' from Gradio once the response handler finishes (see main.py)
+        const STREAM_START_EVENT = 'chattie:stream-start';
+        const STREAM_END_EVENT = 'chattie:stream-end';
         let isCurrentlyStreaming = false;
-        let stopSquareInterval = null;
         let stopObserver = null;
-        let periodicCheckInterval = null;
         let isMonitoring = false;
         let buttonAttributeObserver = null; // Watch for Gradio changing button attributes
+        let safetyTimeout = null;
+        let lastActivityAt = 0;
         
-        // INCREASED TIMEOUTS for better stability
-        const GRACE_PERIOD_MS = 15000; // Increased from 10s to 15s - wait longer for first token
-        const STREAMING_TIMEOUT_MS = 25000; // Increased from 15s to 25s - wait longer for content changes
-        const MONITORING_DURATION_CHECKS = 100; // Increased from 60 to 100 checks (50 seconds)
+        // Safety net if an end event is lost: leave stop mode after this long without any chat activity
+        const STREAM_IDLE_TIMEOUT_MS = 60000;
         
         // Function to check if streaming is active
         function isStreaming() {
-            const now = Date.now();
-            
-            // Check for loading dots
-            const loadingDotsSelectors = [
-                '.loading-dots',
-                '[class*="loading-dots"]',
-                '[class*="loading"]',
-                'span.loading-dots',
-                '.message.bot .loading-dots',
-                '.message-wrap.bot .loading-dots'
-            ];
-            
-            let loadingDotsVisible = false;
-            for (const selector of loadingDotsSelectors) {
-                const loadingDots = document.querySelectorAll(selector);
-                for (let dots of loadingDots) {
-                    const style = window.getComputedStyle(dots);
-                    const isVisible = style.display !== 'none' && 
-                                     style.visibility !== 'hidden' &&
-                                     dots.offsetParent !== null &&
-                                     style.opacity !== '0';
-                    
-                    if (isVisible) {
-                        loadingDotsVisible = true;
-                        if (!isCurrentlyStreaming) {
-                            console.log('📊 Streaming detected: loading dots visible (selector:', selector + ')');
-                            isCurrentlyStreaming = true;
-                            startMonitoring();
-                        }
-                        lastBotMessageLength = 0; // Set to 0 because new streaming has begun
-                        lastContentCheck = now; // Track the last time the bot message content changed
-                        loadingDotsDisappearedAt = 0; // Tracks when the loading dots disappear, set to 0 means dots are visible
-                        // Reset any existing timeout when loading dots appear
-                        if (streamingTimeout) {
-                            clearTimeout(streamingTimeout);
-                            streamingTimeout = null;
-                        }
-                        return true;
-                    }
-                }
-            }
-            
-            // Check if last bot message is actively growing
-            const chatbotContainer = document.querySelector('.gradio-chatbot, [class*="chatbot"]');
-            const botMessages = chatbotContainer 
-                ? chatbotContainer.querySelectorAll('.message.bot, .message-wrap.bot .message')
-                : document.querySelectorAll('.message.bot');
-            
-            if (botMessages.length > 0) {
-                const lastBotMessage = botMessages[botMessages.length - 1];
-                if (!lastBotMessage) 
-                    return false;
-
-                const currentText = lastBotMessage.textContent || '';
-                const currentLength = currentText.trim().length;
-
-                // Handle grace period when loading dots disappear
-                if (isCurrentlyStreaming && !loadingDotsVisible && currentLength === 0) {
-                    if (loadingDotsDisappearedAt === 0) {
-                        loadingDotsDisappearedAt = now;
-                        console.log('📊 Loading dots disappeared - starting grace period');
-                    }
-
-                    const timeSinceDotsDisappeared = now - loadingDotsDisappearedAt;
-
-                    if (timeSinceDotsDisappeared < GRACE_PERIOD_MS) {
-                        console.log(`⏳ Grace period: waiting for first token (${Math.round((GRACE_PERIOD_MS - timeSinceDotsDisappeared) / 1000)}s remaining)`);
-                        return true;
-                    } else {
-                        console.log('⏰ Grace period expired - no content received');
-                        isCurrentlyStreaming = false;
-                        lastBotMessageLength = 0;
-                        loadingDotsDisappearedAt = 0;
-                        stopMonitoring();
-                        if (streamingTimeout) {
-                            clearTimeout(streamingTimeout);
-                            streamingTimeout = null;
-                        }
-                        return false;
-                    }
-                }
-
-                // Reset grace period if content has started
-                if (currentLength > 0 && loadingDotsDisappearedAt > 0) {
-                    loadingDotsDisappearedAt = 0;
-                }
-
-                // Check if content is growing or streaming
-                if (currentLength > lastBotMessageLength) {
-                    if (!isCurrentlyStreaming) {
-                        console.log(`📊 Streaming detected: content growing (${lastBotMessageLength} → ${currentLength} chars)`);
-                        isCurrentlyStreaming = true;
-                        startMonitoring();
-                    }
-
-                    console.log(`📊 Streaming detected: content growing (${lastBotMessageLength} → ${currentLength} chars)`);
-                    lastBotMessageLength = currentLength;
-                    lastContentCheck = now;
-
-                    if (streamingTimeout) {
-                        clearTimeout(streamingTimeout);
-                    }
-                    streamingTimeout = setTimeout(() => {
-                        console.log(`📊 Streaming finished: no content change for ${STREAMING_TIMEOUT_MS / 1000}s`);
-                        isCurrentlyStreaming = false;
-                        stopMonitoring();
-                        updateButtonState();
-                    }, STREAMING_TIMEOUT_MS);
-
-                    return true;
-                }
-
-                // Handle ongoing streaming with no growth
-                if (isCurrentlyStreaming && currentLength > 0) {
-                    const timeSinceLastChange = now - lastContentCheck;
-                    if (timeSinceLastChange < STREAMING_TIMEOUT_MS) {
-                        return true;
-                    } else {
-                        console.log(`📊 Streaming finished: no content change for ${STREAMING_TIMEOUT_MS / 1000}s`);
-                        isCurrentlyStreaming = false;
-                        stopMonitoring();
-                        if (streamingTimeout) {
-                            clearTimeout(streamingTimeout);
-                            streamingTimeout = null;
-                        }
-                        return false;
-                    }
-                }
-
-                // Update lastBotMessageLength if necessary
-                if (currentLength > 0 && lastBotMessageLength !== currentLength) {
-                    lastBotMessageLength = currentLength;
-                }
-            }
-            
-            if (botMessages.length === 0 && isCurrentlyStreaming) {
-                isCurrentlyStreaming = false;
-                lastBotMessageLength = 0;
-                lastContentCheck = 0;
-                loadingDotsDisappearedAt = 0;
-                stopMonitoring();
-                if (streamingTimeout) {
-                    clearTimeout(streamingTimeout);
-                    streamingTimeout = null;
-                }
-            }
-            
             return isCurrentlyStreaming;
         }
         
+        function beginStream(source) {
+            document.dispatchEvent(new CustomEvent(STREAM_START_EVENT, { detail: { source } }));
+        }
+        
+        // Create the white square shown on the button in stop mode
+        function createStopSquare(button) {
+            const stopSquare = document.createElement('div');
+            stopSquare.className = 'stop-square';
+            stopSquare.style.cssText = `
+                width: 14px !important;
+                height: 14px !important;
+                background-color: white !important;
+                border-radius: 2px !important;
+                position: absolute !important;
+                top: 50% !important;
+                left: 50% !important;
+                transform: translate(-50%, -50%) !important;
+                z-index: 10 !important;
+                pointer-events: none !important;
+                display: block !important;
+                visibility: visible !important;
+                opacity: 1 !important;
+                margin: 0 !important;
+                padding: 0 !important;
+            `;
+            button.appendChild(stopSquare);
+            return stopSquare;
+        }
+        
         // Force button to stay enabled during streaming
         function forceButtonEnabled(button) {
             if (!button) return;
@@ -230,6 +111,12 @@
                     // Only react if we're still streaming
                     if (!isCurrentlyStreaming) return;
                     
+                    // Gradio re-rendered the button content - put the stop square back
+                    if (button.classList.contains('stop-mode') && !button.querySelector('.stop-square')) {
+                        createStopSquare(button);
+                        console.log('🔄 Stop square recreated');
+                    }
+                    
                     for (const mutation of mutations) {
                         if (mutation.type === 'attributes') {
                             const attrName = mutation.attributeName;
@@ -261,10 +148,11 @@
                     }
                 });
                 
-                // Observe the button for attribute changes
+                // Observe the button for attribute and content changes (disconnected when streaming ends)
                 buttonAttributeObserver.observe(button, {
                     attributes: true,
-                    attributeFilter: ['disabled', 'style', 'class', 'aria-disabled']
+                    attributeFilter: ['disabled', 'style', 'class', 'aria-disabled'],
+                    childList: true
                 });
                 
                 console.log('✅ Button attribute observer started - will fight Gradio\'s disable attempts');
@@ -351,26 +239,7 @@
                 // Create/update stop square
                 let stopSquare = button.querySelector('.stop-square');
                 if (!stopSquare) {
-                    stopSquare = document.createElement('div');
-                    stopSquare.className = 'stop-square';
-                    stopSquare.style.cssText = `
-                        width: 14px !important;
-                        height: 14px !important;
-                        background-color: white !important;
-                        border-radius: 2px !important;
-                        position: absolute !important;
-                        top: 50% !important;
-                        left: 50% !important;
-                        transform: translate(-50%, -50%) !important;
-                        z-index: 10 !important;
-                        pointer-events: none !important;
-                        display: block !important;
-                        visibility: visible !important;
-                        opacity: 1 !important;
-                        margin: 0 !important;
-                        padding: 0 !important;
-                    `;
-                    button.appendChild(stopSquare);
+                    createStopSquare(button);
                     console.log('✅ Stop square created');
                 } else {
                     stopSquare.style.display = 'block';
@@ -387,37 +256,6 @@
                     });
                 }
                 
-                // Start interval to maintain stop square
-                if (!stopSquareInterval) {
-                    stopSquareInterval = setInterval(() => {
-                        if (isCurrentlyStreaming && button.classList.contains('stop-mode')) {
-                            // Keep button enabled
-                            forceButtonEnabled(button);
-                            
-                            // Ensure square exists
-                            const square = button.querySelector('.stop-square');
-                            if (!square) {
-                                const newSquare = document.createElement('div');
-                                newSquare.className = 'stop-square';
-                                newSquare.style.cssText = `
-                                    width: 14px !important;
-                                    height: 14px !important;
-                                    background-color: white !important;
-                                    border-radius: 2px !important;
-                                    position: absolute !important;
-                                    top: 50% !important;
-                                    left: 50% !important;
-                                    transform: translate(-50%, -50%) !important;
-                                    z-index: 10 !important;
-                                    pointer-events: none !important;
-                                    display: block !important;
-                                `;
-                                button.appendChild(newSquare);
-                                console.log('🔄 Stop square recreated');
-                            }
-                        }
-                    }, 200);
-                }
             } else {
                 // Streaming stopped - show send button
                 const wasInStopMode = button.classList.contains('stop-mode');
@@ -432,27 +270,12 @@
                         stopSquare.remove();
                     }
                     
-                    // Clear interval
-                    if (stopSquareInterval) {
-                        clearInterval(stopSquareInterval);
-                        stopSquareInterval = null;
-                    }
-                    
                     // Stop button attribute observer
                     if (buttonAttributeObserver) {
                         buttonAttributeObserver.disconnect();
                         buttonAttributeObserver = null;
                         console.log('✅ Button attribute observer stopped');
                     }
-                    
-                    // Reset tracking
-                    lastBotMessageLength = 0;
-                    lastContentCheck = 0;
-                    loadingDotsDisappearedAt = 0;
-                    if (streamingTimeout) {
-                        clearTimeout(streamingTimeout);
-                        streamingTimeout = null;
-                    }
                 }
                 
                 // When not streaming, check if textbox has text and manage button state accordingly
@@ -509,14 +332,7 @@
             
             // Mark that streaming was stopped by user
             isCurrentlyStreaming = false;
-            lastBotMessageLength = 0;
-            lastContentCheck = 0;
-            loadingDotsDisappearedAt = 0;
             stopMonitoring();
-            if (streamingTimeout) {
-                clearTimeout(streamingTimeout);
-                streamingTimeout = null;
-            }
             
             // Get current session_id (from Python)
             const currentSessionId = getSessionId();
@@ -527,26 +343,35 @@
             
             // Call backend stop endpoint with proper error handling
             try {
-                const response = await fetch(API_BASE + '/chat/stop/' + currentSessionId, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    }
-                }).catch(err => {
-                    // Handle network errors
-                    console.warn('⚠️ Fetch error (network issue):', err);
-                    return null;
-                });
+                // Over the session's WebSocket when it is open (no new request), otherwise POST
+                if (window.chattieSocket && window.chattieSocket.stop(currentSessionId)) {
+                    console.log('✅ Stop request sent over WebSocket');
+                } else {
+                    // Name the generation when this page started it (edits over HTTP)
+                    const active = window.chattieActiveGeneration;
+                    const query = active && active.sessionId === currentSessionId ?
+                        '?generation_id=' + encodeURIComponent(active.id) : '';
+                    const response = await fetch(API_BASE + '/chat/stop/' + currentSessionId + query, {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json'
+                        }
+                    }).catch(err => {
+                        // Handle network errors
+                        console.warn('⚠️ Fetch error (network issue):', err);
+                        return null;
+                    });
                 
-                if (response && response.ok) {
-                    try {
-                        const data = await response.json();
-                        console.log('✅ Stop request sent:', data);
-                    } catch (jsonError) {
-                        console.warn('⚠️ Failed to parse stop response:', jsonError);
+                    if (response && response.ok) {
+                        try {
+                            const data = await response.json();
+                            console.log('✅ Stop request sent:', data);
+                        } catch (jsonError) {
+                            console.warn('⚠️ Failed to parse stop response:', jsonError);
+                        }
+                    } else if (response) {
+                        console.warn('⚠️ Failed to stop stream:', response.status);
                     }
-                } else if (response) {
-                    console.warn('⚠️ Failed to stop stream:', response.status);
                 }
             } catch (error) {
                 // Silently handle errors - don't let them propagate as unhandled promises
@@ -613,48 +438,30 @@
             }, 200);
         }
         
-        // Debounce function
-        let updateTimeout = null;
-        function debouncedUpdateButtonState() {
-            if (updateTimeout) clearTimeout(updateTimeout);
-            updateTimeout = setTimeout(() => {
-                updateButtonState();
-            }, 100);
+        // Leave stop mode if the chat has been idle for too long (end event lost)
+        function armSafetyTimeout() {
+            clearTimeout(safetyTimeout);
+            safetyTimeout = setTimeout(() => {
+                const idleFor = Date.now() - lastActivityAt;
+                if (idleFor < STREAM_IDLE_TIMEOUT_MS) {
+                    armSafetyTimeout();
+                    return;
+                }
+                console.log(`📊 No stream activity for ${STREAM_IDLE_TIMEOUT_MS / 1000}s - leaving stop mode`);
+                document.dispatchEvent(new CustomEvent(STREAM_END_EVENT, { detail: { source: 'timeout' } }));
+            }, STREAM_IDLE_TIMEOUT_MS);
         }
         
-        // Start monitoring
+        // Start monitoring (only while a stream is active)
         function startMonitoring() {
             if (isMonitoring) return;
             isMonitoring = true;
+            lastActivityAt = Date.now();
             
-            // Create MutationObserver
+            // Scoped to the chatbot; only records activity for the safety timeout
             if (!stopObserver) {
-                stopObserver = new MutationObserver((mutations) => {
-                    let shouldUpdate = false;
-                    for (const mutation of mutations) {
-                        // Catch entirely new messages or loading indicators
-                        if (mutation.addedNodes.length > 0) {
-                            for (const node of mutation.addedNodes) {
-                                if (node.nodeType === Node.ELEMENT_NODE) {
-                                    const classes = node.className || '';
-                                    if (classes.includes('loading') || classes.includes('message') || classes.includes('bot')) {
-                                        shouldUpdate = true; // Marks that something happened in the chat that could require updating the button, e.g. send -> stop if bot started streaming
-                                        break;
-                                    }
-                                }
-                            }
-                        }
-                        // Catch incremental updates inside a message like bot streaming tokens
-                        if (mutation.type === 'characterData' || mutation.type === 'childList') {
-                            const target = mutation.target;
-                            if (target && (target.closest && target.closest('.message.bot, .message-wrap.bot'))) {
-                                shouldUpdate = true;
-                            }
-                        }
-                    }
-                    if (shouldUpdate) {
-                        debouncedUpdateButtonState();
-                    }
+                stopObserver = new MutationObserver(() => {
+                    lastActivityAt = Date.now();
                 });
             }
             
@@ -667,32 +474,12 @@
                     attributes: false
                 });
             }
-            
-            // Start periodic check - more frequent for better detection
-            if (!periodicCheckInterval) {
-                let checkCount = 0;
-                periodicCheckInterval = setInterval(() => {
-                    checkCount++;
-                    const wasStreaming = isCurrentlyStreaming;
-                    const nowStreaming = isStreaming();
-                    
-                    // nowStreaming - bot is actively streaming tokens right now
-                    // wasStreaming - the streaming might have just stopped, want to update the button from stop → send
-                    if (nowStreaming || wasStreaming || isEditingMessage()) {
-                        updateButtonState();
-                    }
-                    
-                    // INCREASED: Keep monitoring longer for long messages
-                    if (checkCount > MONITORING_DURATION_CHECKS && !isCurrentlyStreaming) {
-                        stopMonitoring();
-                    }
-                }, 500);
-            }
+            armSafetyTimeout();
             
             console.log('✅ Monitoring started');
         }
         
-        // Stop monitoring
+        // Stop monitoring: disconnect observers and timers so an idle page does no DOM work
         function stopMonitoring() {
             if (!isMonitoring) return;
             isMonitoring = false;
@@ -702,10 +489,8 @@
                 console.log('✅ Monitoring stopped (streaming ended)');
             }
             
-            if (periodicCheckInterval) {
-                clearInterval(periodicCheckInterval);
-                periodicCheckInterval = null;
-            }
+            clearTimeout(safetyTimeout);
+            safetyTimeout = null;
             
             // Also stop button attribute observer
             if (buttonAttributeObserver) {
@@ -715,29 +500,23 @@
             }
         }
         
-        // Add click handler for stop button
-        document.addEventListener('click', handleStopClick, true);
-        
-        // Listen for edit message sent event
-        document.addEventListener('editMessageSent', (e) => {
-            console.log('📤 Edit message sent - starting monitoring...');
+        document.addEventListener(STREAM_START_EVENT, (e) => {
+            console.log(`📤 Stream started (${e.detail && e.detail.source}) - STOP mode`);
+            isCurrentlyStreaming = true;
             startMonitoring();
-            
-            // Check for streaming with strategic timing
-            setTimeout(() => {
-                isStreaming();
-                updateButtonState();
-            }, 100);
-            setTimeout(() => {
-                isStreaming();
-                updateButtonState();
-            }, 300);
-            setTimeout(() => {
-                isStreaming();
-                updateButtonState();
-            }, 600);
+            updateButtonState();
         });
         
+        document.addEventListener(STREAM_END_EVENT, (e) => {
+            console.log(`📥 Stream ended (${e.detail && e.detail.source ? e.detail.source : 'gradio'}) - SEND mode`);
+            isCurrentlyStreaming = false;
+            stopMonitoring();
+            updateButtonState();
+        });
+        
+        // Add click handler for stop button
+        document.addEventListener('click', handleStopClick, true);
+        
         // Detect when send button is clicked
         document.addEventListener('click', (e) => {
             const button = e.target.closest('#upload-button-chat') || 
@@ -748,23 +527,7 @@
                 if (isEditingMessage()) {
                     return;
                 }
-                
-                console.log('📤 Send button clicked - starting monitoring...');
-                startMonitoring();
-                
-                // Check for streaming with strategic timing
-                setTimeout(() => {
-                    isStreaming();
-                    updateButtonState();
-                }, 100);
-                setTimeout(() => {
-                    isStreaming();
-                    updateButtonState();
-                }, 300);
-                setTimeout(() => {
-                    isStreaming();
-                    updateButtonState();
-                }, 600);
+                beginStream('send');
             }
         }, true);
         
@@ -781,26 +544,7 @@
                                ));
             
             if (retryButton) {
-                console.log('🔄 Retry button clicked - starting monitoring...');
-                startMonitoring();
-                
-                // Check for streaming with strategic timing
-                setTimeout(() => {
-                    isStreaming();
-                    updateButtonState();
-                }, 100);
-                setTimeout(() => {
-                    isStreaming();
-                    updateButtonState();
-                }, 300);
-                setTimeout(() => {
-                    isStreaming();
-                    updateButtonState();
-                }, 600);
-                setTimeout(() => {
-                    isStreaming();
-                    updateButtonState();
-                }, 1000);
+                beginStream('retry');
             }
         }, true);
         
@@ -812,90 +556,30 @@
             return editableTextarea !== null || editingMessage !== null;
         }
         
-        // Setup textbox input listener to update button state when user types
-        function setupTextboxListener() {
-            const textboxes = document.querySelectorAll('textarea[placeholder*="help"], textarea[data-testid*="textbox"], textarea');
-            
-            textboxes.forEach(textbox => {
-                // Skip editable textarea (for editing messages) - it has its own send button
-                if (textbox.classList.contains('editable-message-textarea')) {
-                    return;
-                }
-                
-                // Check if listener already attached
-                if (!textbox.hasAttribute('data-stop-script-listener')) {
-                    // Listen for input changes (typing)
-                    textbox.addEventListener('input', () => {
-                        // Only update button state if not currently streaming and not editing
-                        if (!isCurrentlyStreaming && !isEditingMessage()) {
-                            updateButtonState();
-                        }
-                    });
-                    
-                    // Listen for Enter key press (to send message)
-                    textbox.addEventListener('keydown', (e) => {
-                        // Check if Enter is pressed (without Shift - Shift+Enter is for new line)
-                        if (e.key === 'Enter' && !e.shiftKey) {
-                            console.log('⌨️ Enter key pressed - starting monitoring...');
-                            // Start monitoring immediately when Enter is pressed
-                            startMonitoring();
-                            
-                            // Check for streaming with strategic timing
-                            setTimeout(() => {
-                                isStreaming();
-                                updateButtonState();
-                            }, 100);
-                            setTimeout(() => {
-                                isStreaming();
-                                updateButtonState();
-                            }, 300);
-                            setTimeout(() => {
-                                isStreaming();
-                                updateButtonState();
-                            }, 600);
-                        }
-                    });
-                    
-                    textbox.setAttribute('data-stop-script-listener', 'true');
-                    console.log('✅ Textbox input and Enter key listener attached');
-                }
-            });
+        // Main textboxes (not the inline edit textarea, which has its own send button)
+        function isMainTextbox(target) {
+            return target && target.tagName === 'TEXTAREA' &&
+                !target.classList.contains('editable-message-textarea');
         }
         
-        // Initial check
-        function initialCheck() {
-            const testButton = document.querySelector('#upload-button-chat');
-            if (testButton) {
-                console.log('✅ Stop button script initialized - chat button found');
-            } else {
-                console.warn('⚠️ Chat upload button not found - will retry when needed');
-            }
-            
-            // Setup textbox listener
-            setupTextboxListener();
-            
-            // Also setup listener when new textboxes are added (Gradio might add them dynamically)
-            const textboxObserver = new MutationObserver(() => {
-                setupTextboxListener();
-                // Also check if editing state changed
+        // Delegated textbox listeners: no need to find (or watch for) textboxes Gradio renders later
+        document.addEventListener('input', (e) => {
+            // Only update button state if not currently streaming and not editing
+            if (isMainTextbox(e.target) && !isCurrentlyStreaming && !isEditingMessage()) {
                 updateButtonState();
-            });
-            
-            // Watch for new textboxes being added and editing state changes
-            if (document.body) {
-                textboxObserver.observe(document.body, {
-                    childList: true,
-                    subtree: true
-                });
             }
-        }
+        }, true);
+        
+        document.addEventListener('keydown', (e) => {
+            // Enter without Shift sends the message (Shift+Enter is for new line)
+            if (e.key === 'Enter' && !e.shiftKey && isMainTextbox(e.target) && e.target.value.trim()) {
+                console.log('⌨️ Enter key pressed');
+                beginStream('send');
+            }
+        }, true);
         
-        if (document.readyState === 'loading') {
-            document.addEventListener('DOMContentLoaded', () => {
-                setTimeout(initialCheck, 1000);
-            });
-        } else {
-            setTimeout(initialCheck, 1000);
+        if (document.querySelector('#upload-button-chat')) {
+            console.log('✅ Stop button script initialized - chat button found');
         }
     }
     
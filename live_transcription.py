@@ -0,0 +1,78 @@
+"""
+Live speech-to-text: transcribe a recording while the user is still speaking.
+
+The browser sends audio over /ws/speech as it is recorded and closes a segment
+at each pause. Every closed segment is a complete clip and is transcribed in
+the background right away, so once the user stops only the last segment is
+still in flight and the full transcript follows almost immediately.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+import metrics
+
+
+class LiveTranscription:
+    """Audio of one recording arriving in segments, each transcribed as soon as it is complete"""
+
+    def __init__(self, transcribe: Callable[[bytes], Awaitable[str]],
+                 on_segment: Callable[[int, str], Awaitable[None]],
+                 validate: Callable[[int, Optional[float]], Optional[str]]):
+        self.transcribe = transcribe  # Segment bytes -> transcript
+        self.on_segment = on_segment  # Called with (index, text) as each segment is transcribed
+        self.validate = validate  # (total bytes, total duration_ms) -> error or None
+
+        self._buffer = bytearray()
+        self._tasks = []
+        self._texts = {}
+        self.received_bytes = 0
+        self.duration_ms = None
+
+    @property
+    def segments(self) -> int:
+        return len(self._tasks)
+
+    def append(self, chunk: bytes) -> Optional[str]:
+        """Add audio to the open segment, returning an error once the recording is too large"""
+        if not chunk:
+            return None  # A recorder flushing before it has audio; not an empty recording
+        self._buffer += chunk
+        self.received_bytes += len(chunk)
+        return self.validate(self.received_bytes, self.duration_ms)
+
+    def end_segment(self, duration_ms: Optional[float] = None, last: bool = False) -> Optional[str]:
+        """Close the open segment and start transcribing it; duration_ms is its length of speech"""
+        if duration_ms is not None:
+            self.duration_ms = (self.duration_ms or 0) + duration_ms
+        if not self.received_bytes and not last:
+            return None  # Nothing recorded yet
+        error = self.validate(self.received_bytes, self.duration_ms)
+        if error or not self._buffer:
+            return error
+
+        index = len(self._tasks)
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self._tasks.append(asyncio.ensure_future(self._transcribe(index, data)))
+        metrics.inc("speech.live.segments")
+        return None
+
+    async def _transcribe(self, index: int, data: bytes):
+        text = await self.transcribe(data)
+        self._texts[index] = text
+        await self.on_segment(index, text)
+
+    async def finish(self, join: Callable[[list], str]) -> str:
+        """Wait for every segment and return the transcript of the whole recording"""
+        start = time.perf_counter()
+        await asyncio.gather(*self._tasks)
+        metrics.observe("speech.live.finish_seconds", time.perf_counter() - start)
+        return join([self._texts[i] for i in range(len(self._tasks))])
+
+    def cancel(self):
+        """Abandon the recording and any transcription still running"""
+        self._buffer.clear()
+        for task in self._tasks:
+            task.cancel()
@@ -1,4 +1,3 @@
-import gradio as gr
 import requests
 import json
 import uuid
@@ -15,6 +14,12 @@ BASE_API_URL = os.getenv("FASTAPI_URL", "http://localhost:8000")
 API_URL = f"{BASE_API_URL}/chat/"
 RETRY_API_URL = f"{BASE_API_URL}/chat/retry/"
 EDIT_API_URL = f"{BASE_API_URL}/chat/edit/"
+HISTORY_API_URL = f"{BASE_API_URL}/chat/history/"
+
+# Virtualized chat view: only the most recent messages stay mounted in the Chatbot,
+# older ones are loaded back from the backend when scrolling up (0 disables)
+CHAT_WINDOW_MESSAGES = int(os.getenv("CHAT_WINDOW_MESSAGES", "60"))
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "30"))
 
 # Session ID will be generated per user session using Gradio State
 
@@ -50,7 +55,8 @@ def load_css():
     return '\n\n'.join(combined_css)
 
 # Load external JavaScript files and inject session_id
-def load_js():
+# api_base_url replaces the __API_BASE_URL__ placeholder (defaults to BASE_API_URL)
+def load_js(api_base_url=None):
     js_content_parts = []
     
     # Suppress browser extension errors (message channel errors)
@@ -209,7 +215,15 @@ def load_js():
             js_content_parts.append(textbox_auto_grow_js)
     
     # Get API URL for JavaScript (use BASE_API_URL from environment)
-    js_api_base = BASE_API_URL
+    js_api_base = api_base_url if api_base_url is not None else BASE_API_URL
+    
+    # Load chat_socket.js (used by the edit and stop scripts)
+    chat_socket_js_path = os.path.join(js_dir, 'chat_socket.js')
+    if os.path.exists(chat_socket_js_path):
+        with open(chat_socket_js_path, 'r', encoding='utf-8') as f:
+            chat_socket_js = f.read()
+            chat_socket_js = chat_socket_js.replace("__API_BASE_URL__", js_api_base)
+            js_content_parts.append(chat_socket_js)
     
     # Load edit_user_messages.js
     edit_js_path = os.path.join(js_dir, 'edit_user_messages.js')
@@ -227,6 +241,12 @@ def load_js():
             stop_js = stop_js.replace("__API_BASE_URL__", js_api_base)
             js_content_parts.append(stop_js)
 
+    # Load chat_window.js
+    chat_window_js_path = os.path.join(js_dir, 'chat_window.js')
+    if os.path.exists(chat_window_js_path):
+        with open(chat_window_js_path, 'r', encoding='utf-8') as f:
+            js_content_parts.append(f.read())
+
     # Load mic_recording.js
     mic_js_path = os.path.join(js_dir, 'mic_recording.js')
     if os.path.exists(mic_js_path):
@@ -248,10 +268,47 @@ def initialize_session_id(session_id):
     
 def check_input(text):
     """Check if input is empty and return button state."""
+    import gradio as gr
     return gr.update(interactive=bool(text.strip()))
 
 # Send user message to FastAPI backend and stream the response
 # Returns: (response_text, is_stopped) as a tuple
+def turn_idempotency_key(action):
+    """Idempotency-Key for one user action (a send or a retry click). It is made once per action
+    and reused when that action is re-submitted, so the backend runs it once, while sending the
+    same text again (or retrying a reply with the same content) is a new turn"""
+    return f"{action}-{uuid.uuid4().hex}"
+
+def post_turn(url, payload, idempotency_key):
+    """POST one chat turn; if the connection fails before a response, re-submit it once with the
+    same Idempotency-Key (the backend replays the turn instead of running it twice)"""
+    for attempt in range(2):
+        try:
+            return requests.post(
+                url,
+                json=payload,
+                headers={"Idempotency-Key": idempotency_key},
+                stream=True,
+                timeout=60
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt:
+                raise
+            print(f"🔁 Chat request failed before a response ({e}), re-submitting the same turn")
+
+def api_error_message(response) -> str:
+    """Message for a failed chat request; when the server is busy, say when to try again"""
+    if response.status_code in (429, 503):
+        retry_after = response.headers.get("Retry-After", "a few")
+        try:
+            reason = response.json().get("error", "")
+        except ValueError:
+            reason = ""
+        if reason.startswith("Rate limit"):
+            return f"Rate limit exceeded, please try again in {retry_after} seconds."
+        return f"Server is busy, please try again in {retry_after} seconds."
+    return f"Error: API returned status code {response.status_code}"
+
 def chat_with_llm(message, history, session_id):
     global active_stream_response, STOP_STREAMING
     
@@ -272,21 +329,17 @@ def chat_with_llm(message, history, session_id):
         "session_id": session_id,
         "message": message
     }
+    idempotency_key = turn_idempotency_key("chat")
     
     try:
-        response = requests.post(
-            API_URL,
-            json=payload,
-            stream=True,
-            timeout=60
-        )
+        response = post_turn(API_URL, payload, idempotency_key)
         
         # Store response for potential cancellation
         with STREAMING_LOCK:
             active_stream_response = response
         
         if response.status_code != 200:
-            yield (f"Error: API returned status code {response.status_code}", False)
+            yield (api_error_message(response), False)
             with STREAMING_LOCK:
                 active_stream_response = None
             with frontend_stop_lock:
@@ -435,6 +488,52 @@ def chat_with_llm(message, history, session_id):
         # Force garbage collection to free memory
         gc.collect()
 
+# Fetch a page of stored messages (oldest first) from the backend
+def fetch_history_page(session_id, before_id=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    params = {"limit": limit}
+    if before_id is not None:
+        params["before_id"] = before_id
+    response = requests.get(f"{HISTORY_API_URL}{session_id}", params=params, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+def window_history(chat_history, session_id, cursor=None):
+    """
+    Unmount older messages once the conversation outgrows the window, so each
+    streamed update re-renders a bounded list. The window is reloaded from the
+    backend (the source of truth) only every CHAT_WINDOW_MESSAGES / 2 messages.
+    Returns the history and the cursor: the id of the oldest mounted message
+    (None when nothing older is stored), kept in the tab's gr.State.
+    """
+    if not CHAT_WINDOW_MESSAGES or len(chat_history) <= CHAT_WINDOW_MESSAGES * 3 // 2:
+        return chat_history, cursor
+    try:
+        page = fetch_history_page(session_id, limit=CHAT_WINDOW_MESSAGES)
+    except Exception as e:
+        print(f"⚠️ Could not window chat history: {str(e)}")
+        return chat_history, cursor
+    messages = page.get("messages") or []
+    if not messages:
+        return chat_history, cursor
+    print(f"🪟 Chat window: {len(chat_history)} → {len(messages)} mounted messages")
+    cursor = messages[0]["id"] if page.get("has_more") else None
+    return [{"role": m["role"], "content": m["content"]} for m in messages], cursor
+
+# Prepend the previous page of messages (triggered by scrolling to the top of the chat)
+def load_earlier_messages(chat_history, session_id, cursor):
+    chat_history = chat_history or []
+    if cursor is None:
+        return chat_history, cursor
+    try:
+        page = fetch_history_page(session_id, before_id=cursor)
+    except Exception as e:
+        print(f"⚠️ Could not load earlier messages: {str(e)}")
+        return chat_history, cursor
+    messages = page.get("messages") or []
+    cursor = messages[0]["id"] if messages and page.get("has_more") else None
+    earlier = [{"role": m["role"], "content": m["content"]} for m in messages]
+    return earlier + chat_history, cursor
+
 # Generate response
 def respond(message, chat_history, session_id):
     chat_history = chat_history or []
@@ -526,6 +625,7 @@ def respond(message, chat_history, session_id):
         yield chat_history  # Streaming finished normally
 
 def submit_and_respond_welcome(message, history, started, session_id):
+    import gradio as gr
     try:
         # Safety check: generate UUID if None (shouldn't happen after demo.load(), but just in case)
         if session_id is None:
@@ -564,22 +664,23 @@ def submit_and_respond_welcome(message, history, started, session_id):
         history.append({"role": "assistant", "content": error_msg})
         yield "", history, True, gr.update(), gr.update(), gr.update(), session_id
 
-def submit_and_respond_chat(message, history, started, session_id):
+def submit_and_respond_chat(message, history, started, session_id, history_cursor):
     try:
         # Safety check: generate UUID if None (shouldn't happen after demo.load(), but just in case)
         if session_id is None:
             session_id = str(uuid.uuid4())
         
         if not message.strip():
-            return "", history, session_id
+            return "", history, session_id, history_cursor
         
-        # Ensure history is a list
+        # Ensure history is a list, windowed to the most recent messages
         if history is None:
             history = []
+        history, history_cursor = window_history(history, session_id, history_cursor)
         
         # Normal new message flow
         for updated_history in respond(message, history, session_id):
-            yield "", updated_history, session_id
+            yield "", updated_history, session_id, history_cursor
     except Exception as e:
         # Catch any errors and return error message
         traceback.print_exc()
@@ -588,7 +689,7 @@ def submit_and_respond_chat(message, history, started, session_id):
         if history is None:
             history = []
         history.append({"role": "assistant", "content": error_msg})
-        yield "", history, session_id
+        yield "", history, session_id, history_cursor
 
 # Retry generating the last bot response
 def retry_last_response(chat_history, session_id):
@@ -667,6 +768,8 @@ def retry_last_response(chat_history, session_id):
             return chat_history, session_id
         
         print(f"🎯 Retry: Found assistant message at index {last_assistant_idx}")
+        # Every retry click is a new retry, even when the reply it replaces has the same text
+        idempotency_key = turn_idempotency_key("retry")
         
         # Show loading - ensure clean format
         chat_history[last_assistant_idx] = {
@@ -683,15 +786,10 @@ def retry_last_response(chat_history, session_id):
         print(f"📤 Retry: Calling API at {RETRY_API_URL} with session_id: {session_id}")
         
         try:
-            response = requests.post(
-                RETRY_API_URL, 
-                json=payload, 
-                stream=True, 
-                timeout=60
-            )
+            response = post_turn(RETRY_API_URL, payload, idempotency_key)
             
             if response.status_code != 200:
-                error_msg = f"Error: API returned status code {response.status_code}"
+                error_msg = api_error_message(response)
                 print(f"❌ Retry: {error_msg}")
                 chat_history[last_assistant_idx] = {
                     "role": "assistant",
@@ -797,42 +895,88 @@ def retry_last_response(chat_history, session_id):
         
         yield chat_history, session_id
 
-# Load CSS and JS from external files
-custom_css = load_css()
-custom_js = load_js()
+# Runs in the browser after a streaming handler finishes; js/stop_messages.js
+# switches the button back from stop to send on this event
+STREAM_END_JS = "() => { document.dispatchEvent(new CustomEvent('chattie:stream-end')); }"
 
-# Create Gradio interface
-# Gradio 6+: css/js should be passed to launch(), not Blocks()
-with gr.Blocks(title="Chattie") as demo:
-    # Logo
-    gr.HTML("""
-        <div id="logo-container">
-            <div id="logo-left">
-                <div id="logo-icon">💬</div>
-                <h1 id="logo-text">Chattie</h1>
-            </div>
-            <div id="session-info">
-                <span id="session-id-display">Session: Loading...</span>
-            </div>
-        </div>
-    """)
-    
-    # Welcome section
-    welcome_section = gr.Column(visible=True, elem_id="welcome-container")
-    with welcome_section:
-        # Welcome message
+def build_demo():
+    """
+    Build the Gradio Blocks UI. Gradio is imported here rather than at module
+    level, so importing main (e.g. from tests) stays cheap.
+    """
+    import gradio as gr
+
+    # Create Gradio interface
+    with gr.Blocks(title="Chattie") as demo:
+        # Logo
         gr.HTML("""
-            <div id="welcome-message">
-                <strong>Hello! I'm Chattie, your AI assistant.</strong><br/>
-                <span style="font-size: 18px;">Ask me anything and I'll help you out!</span>
+            <div id="logo-container">
+                <div id="logo-left">
+                    <div id="logo-icon">💬</div>
+                    <h1 id="logo-text">Chattie</h1>
+                </div>
+                <div id="session-info">
+                    <span id="session-id-display">Session: Loading...</span>
+                </div>
             </div>
         """)
+    
+        # Welcome section
+        welcome_section = gr.Column(visible=True, elem_id="welcome-container")
+        with welcome_section:
+            # Welcome message
+            gr.HTML("""
+                <div id="welcome-message">
+                    <strong>Hello! I'm Chattie, your AI assistant.</strong><br/>
+                    <span style="font-size: 18px;">Ask me anything and I'll help you out!</span>
+                </div>
+            """)
+
+            # Welcome input
+            input_welcome = gr.Column(elem_id="input-wrapper-welcome")
+            with input_welcome:
+                with gr.Row(elem_id="input-container"):
+                    msg_welcome = gr.Textbox(
+                        placeholder="How can I help you today?",
+                        show_label=False,
+                        container=False,
+                        elem_classes=["input-box"],
+                        lines=1,
+                        max_lines=6,
+                        scale=1
+                    )
+                    mic_btn_welcome = gr.Button(
+                        "",
+                        elem_id="mic-button",
+                        size="sm",
+                        interactive=True,
+                        scale=0,
+                        min_width=40
+                    )
+                    submit_btn_welcome = gr.Button(
+                        "",
+                        elem_id="upload-button-welcome",
+                        elem_classes=["upload-button"],
+                        size="sm",
+                        interactive=False,
+                        scale=0,
+                        min_width=40
+                    )
 
-        # Welcome input
-        input_welcome = gr.Column(elem_id="input-wrapper-welcome")
-        with input_welcome:
+        # Chat section
+        chat_section = gr.Column(visible=False, elem_id="chatbot-container")
+        with chat_section:
+            chatbot = gr.Chatbot(
+                height=None,
+                show_label=False,
+                container=False
+            )
+
+        # Chat input
+        input_chat = gr.Column(visible=False, elem_id="input-wrapper-chat")
+        with input_chat:
             with gr.Row(elem_id="input-container"):
-                msg_welcome = gr.Textbox(
+                msg_chat = gr.Textbox(
                     placeholder="How can I help you today?",
                     show_label=False,
                     container=False,
@@ -841,7 +985,7 @@ with gr.Blocks(title="Chattie") as demo:
                     max_lines=6,
                     scale=1
                 )
-                mic_btn_welcome = gr.Button(
+                mic_btn_chat = gr.Button(
                     "",
                     elem_id="mic-button",
                     size="sm",
@@ -849,9 +993,9 @@ with gr.Blocks(title="Chattie") as demo:
                     scale=0,
                     min_width=40
                 )
-                submit_btn_welcome = gr.Button(
+                submit_btn_chat = gr.Button(
                     "",
-                    elem_id="upload-button-welcome",
+                    elem_id="upload-button-chat",
                     elem_classes=["upload-button"],
                     size="sm",
                     interactive=False,
@@ -859,145 +1003,148 @@ with gr.Blocks(title="Chattie") as demo:
                     min_width=40
                 )
 
-    # Chat section
-    chat_section = gr.Column(visible=False, elem_id="chatbot-container")
-    with chat_section:
-        chatbot = gr.Chatbot(
-            height=None,
-            show_label=False,
-            container=False
-        )
-
-    # Chat input
-    input_chat = gr.Column(visible=False, elem_id="input-wrapper-chat")
-    with input_chat:
-        with gr.Row(elem_id="input-container"):
-            msg_chat = gr.Textbox(
-                placeholder="How can I help you today?",
-                show_label=False,
-                container=False,
-                elem_classes=["input-box"],
-                lines=1,
-                max_lines=6,
-                scale=1
-            )
-            mic_btn_chat = gr.Button(
-                "",
-                elem_id="mic-button",
-                size="sm",
-                interactive=True,
-                scale=0,
-                min_width=40
-            )
-            submit_btn_chat = gr.Button(
-                "",
-                elem_id="upload-button-chat",
-                elem_classes=["upload-button"],
-                size="sm",
-                interactive=False,
-                scale=0,
-                min_width=40
-            )
-
-    chat_started = gr.State(False)
-    # Session ID: Each browser tab gets a unique session_id (isolated chat history)
-    # Page refresh generates a new session_id (new chat session)
-    # UUID is generated in demo.load() on each page load/refresh
-    session_id_state = gr.State(value=None)
+        chat_started = gr.State(False)
+        # Session ID: Each browser tab gets a unique session_id (isolated chat history)
+        # Page refresh generates a new session_id (new chat session)
+        # UUID is generated in demo.load() on each page load/refresh
+        session_id_state = gr.State(value=None)
+        # Id of the oldest mounted message when older ones were unmounted (see window_history)
+        history_cursor_state = gr.State(value=None)
     
-    # Enable/disable buttons based on input
-    msg_welcome.change(fn=check_input, inputs=[msg_welcome], outputs=[submit_btn_welcome], queue=False)
-    msg_chat.change(fn=check_input, inputs=[msg_chat], outputs=[submit_btn_chat], queue=False)
+        # Enable/disable buttons based on input
+        msg_welcome.change(fn=check_input, inputs=[msg_welcome], outputs=[submit_btn_welcome], queue=False)
+        msg_chat.change(fn=check_input, inputs=[msg_chat], outputs=[submit_btn_chat], queue=False)
     
-    # Welcome input handlers
-    submit_btn_welcome.click(
-        fn=submit_and_respond_welcome,
-        inputs=[msg_welcome, chatbot, chat_started, session_id_state],
-        outputs=[msg_welcome, chatbot, chat_started, welcome_section, chat_section, input_chat, session_id_state]
-    )
+        # Welcome input handlers
+        submit_btn_welcome.click(
+            fn=submit_and_respond_welcome,
+            inputs=[msg_welcome, chatbot, chat_started, session_id_state],
+            outputs=[msg_welcome, chatbot, chat_started, welcome_section, chat_section, input_chat, session_id_state]
+        ).then(fn=None, js=STREAM_END_JS, queue=False)
 
-    msg_welcome.submit(
-        fn=submit_and_respond_welcome,
-        inputs=[msg_welcome, chatbot, chat_started, session_id_state],
-        outputs=[msg_welcome, chatbot, chat_started, welcome_section, chat_section, input_chat, session_id_state]
-    )
+        msg_welcome.submit(
+            fn=submit_and_respond_welcome,
+            inputs=[msg_welcome, chatbot, chat_started, session_id_state],
+            outputs=[msg_welcome, chatbot, chat_started, welcome_section, chat_section, input_chat, session_id_state]
+        ).then(fn=None, js=STREAM_END_JS, queue=False)
 
-    # Chat input handlers
-    submit_btn_chat.click(
-        fn=submit_and_respond_chat,
-        inputs=[msg_chat, chatbot, chat_started, session_id_state],
-        outputs=[msg_chat, chatbot, session_id_state]
-    )
+        # Hidden trigger clicked by js/chat_window.js when the chat is scrolled to the top
+        load_earlier_btn = gr.Button("Load earlier messages", elem_id="load-earlier-trigger", elem_classes=["hidden-trigger"])
+        load_earlier_btn.click(
+            fn=load_earlier_messages,
+            inputs=[chatbot, session_id_state, history_cursor_state],
+            outputs=[chatbot, history_cursor_state],
+            queue=False
+        )
 
-    msg_chat.submit(
-        fn=submit_and_respond_chat,
-        inputs=[msg_chat, chatbot, chat_started, session_id_state],
-        outputs=[msg_chat, chatbot, session_id_state]
-    )
+        # Chat input handlers
+        submit_btn_chat.click(
+            fn=submit_and_respond_chat,
+            inputs=[msg_chat, chatbot, chat_started, session_id_state, history_cursor_state],
+            outputs=[msg_chat, chatbot, session_id_state, history_cursor_state]
+        ).then(fn=None, js=STREAM_END_JS, queue=False)
 
-    # Retry button handler
-    chatbot.retry(
-        fn=retry_last_response,
-        inputs=[chatbot, session_id_state],
-        outputs=[chatbot, session_id_state]
-    )
+        msg_chat.submit(
+            fn=submit_and_respond_chat,
+            inputs=[msg_chat, chatbot, chat_started, session_id_state, history_cursor_state],
+            outputs=[msg_chat, chatbot, session_id_state, history_cursor_state]
+        ).then(fn=None, js=STREAM_END_JS, queue=False)
+
+        # Retry button handler
+        chatbot.retry(
+            fn=retry_last_response,
+            inputs=[chatbot, session_id_state],
+            outputs=[chatbot, session_id_state]
+        ).then(fn=None, js=STREAM_END_JS, queue=False)
     
-    # Replace the hidden HTML component
-    session_id_display = gr.HTML(visible=True, elem_id="session-id-display")
+        # Replace the hidden HTML component
+        session_id_display = gr.HTML(visible=True, elem_id="session-id-display")
     
-    # Load event to generate and set initial session_id
-    # Generates new UUID on every page load/refresh and syncs to both DOM and state
-    demo.load(
-        fn=initialize_session_id,
-        inputs=[session_id_state],
-        outputs=[session_id_display, session_id_state],
-        js="""
-        function(html_output) {
-            // html_output is the HTML string returned from initialize_session_id
-            // Extract session_id from the HTML's data-session-id attribute
-            if (typeof window !== 'undefined' && html_output) {
-                // Parse the HTML to extract session_id
-                const match = html_output.match(/data-session-id="([^"]+)"/);
-                if (match && match[1]) {
-                    const session_id = match[1];
-                    window.__SESSION_ID__ = session_id;
-                    console.log('📝 Session ID initialized from Python:', session_id);
+        # Load event to generate and set initial session_id
+        # Generates new UUID on every page load/refresh and syncs to both DOM and state
+        demo.load(
+            fn=initialize_session_id,
+            inputs=[session_id_state],
+            outputs=[session_id_display, session_id_state],
+            js="""
+            function(html_output) {
+                // html_output is the HTML string returned from initialize_session_id
+                // Extract session_id from the HTML's data-session-id attribute
+                if (typeof window !== 'undefined' && html_output) {
+                    // Parse the HTML to extract session_id
+                    const match = html_output.match(/data-session-id="([^"]+)"/);
+                    if (match && match[1]) {
+                        const session_id = match[1];
+                        window.__SESSION_ID__ = session_id;
+                        console.log('📝 Session ID initialized from Python:', session_id);
                     
-                    // Set in container immediately
-                    const container = document.getElementById('session-id-container');
-                    if (!container) {
-                        // Create container if it doesn't exist
-                        const newContainer = document.createElement('div');
-                        newContainer.id = 'session-id-container';
-                        newContainer.setAttribute('data-session-id', session_id);
-                        newContainer.style.display = 'none';
-                        document.body.appendChild(newContainer);
-                    } else {
-                        // Update existing container
-                        container.setAttribute('data-session-id', session_id);
-                    }
+                        // Set in container immediately
+                        const container = document.getElementById('session-id-container');
+                        if (!container) {
+                            // Create container if it doesn't exist
+                            const newContainer = document.createElement('div');
+                            newContainer.id = 'session-id-container';
+                            newContainer.setAttribute('data-session-id', session_id);
+                            newContainer.style.display = 'none';
+                            document.body.appendChild(newContainer);
+                        } else {
+                            // Update existing container
+                            container.setAttribute('data-session-id', session_id);
+                        }
                     
-                    // Update the display
-                    const display = document.getElementById('session-id-display');
-                    if (display) {
-                        display.textContent = `Session: ${session_id}`;
-                    }
+                        // Update the display
+                        const display = document.getElementById('session-id-display');
+                        if (display) {
+                            display.textContent = `Session: ${session_id}`;
+                        }
 
-                    // Trigger custom event so edit script knows session is ready
-                    const event = new CustomEvent('sessionIdReady', {
-                        detail: { sessionId: session_id }
-                    });
-                    document.dispatchEvent(event);
-                } else {
-                    console.warn('⚠️ Could not extract session_id from HTML');
+                        // Trigger custom event so edit script knows session is ready
+                        const event = new CustomEvent('sessionIdReady', {
+                            detail: { sessionId: session_id }
+                        });
+                        document.dispatchEvent(event);
+                    } else {
+                        console.warn('⚠️ Could not extract session_id from HTML');
+                    }
                 }
+                // Return the HTML string as-is
+                return html_output;
             }
-            // Return the HTML string as-is
-            return html_output;
-        }
-        """
+            """
+        )
+
+    return demo
+
+def build_frontend_app(manifest):
+    """FastAPI app serving the Gradio UI plus the prebuilt CSS/JS bundle (see static_assets.py)"""
+    import gradio as gr
+    from fastapi import FastAPI
+    from static_assets import ASSETS_DIR, ASSETS_URL_PATH, ImmutableStaticFiles, page_head, page_loader_js
+
+    app = FastAPI()
+    # Mounted before Gradio so its catch-all routes don't shadow the bundle
+    app.mount(ASSETS_URL_PATH, ImmutableStaticFiles(directory=ASSETS_DIR), name="bundle")
+    demo = build_demo()
+    demo.queue()
+    return gr.mount_gradio_app(
+        app,
+        demo,
+        path="/",
+        head=page_head(manifest),
+        js=page_loader_js(manifest, BASE_API_URL),
     )
 
+_demo = None
+
+def __getattr__(name):
+    # main.demo is built on first access (used by `gradio main.py` reload mode)
+    global _demo
+    if name == "demo":
+        if _demo is None:
+            _demo = build_demo()
+        return _demo
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
     print("=" * 60)
     print("🚀 Starting Chattie - AI Chat Assistant")
@@ -1016,13 +1163,29 @@ if __name__ == "__main__":
     else:
         server_port = int(os.getenv("GRADIO_SERVER_PORT", "7860"))
     inbrowser = os.getenv("GRADIO_INBROWSER", "false").lower() == "true"
-    
-    demo.queue()
-    demo.launch(
-        server_name=server_name,
-        server_port=server_port,
-        css=custom_css,
-        js=custom_js,
-        share=False,
-        inbrowser=inbrowser,
-    )
\ No newline at end of file
+
+    from static_assets import load_manifest
+
+    manifest = load_manifest()
+    if manifest:
+        # Prebuilt bundle (python static_assets.py): CSS/JS are cached by the browser
+        import uvicorn
+
+        print(f"📦 Serving asset bundle {manifest['css']}, {manifest['js']}")
+        uvicorn.run(build_frontend_app(manifest), host=server_name, port=server_port)
+    else:
+        # Development: inline CSS and JS from external files on every page load
+        # Gradio 6+: css/js should be passed to launch(), not Blocks()
+        custom_css = load_css()
+        custom_js = load_js()
+
+        demo = build_demo()
+        demo.queue()
+        demo.launch(
+            server_name=server_name,
+            server_port=server_port,
+            css=custom_css,
+            js=custom_js,
+            share=False,
+            inbrowser=inbrowser,
+        )
\ No newline at end of file
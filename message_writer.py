@@ -0,0 +1,262 @@
+"""
+Write-behind persistence for chat messages.
+
+Assistant replies are handed to a bounded in-memory buffer instead of being
+committed on the streaming path. A background thread batches the buffered
+rows from all sessions into multi-row INSERTs, flushing when the batch size
+is reached or the flush interval elapses. Before a turn reads its session's
+history, write_session() moves that session's queued rows into the turn's
+own transaction, so it sees its own writes without a second connection and
+without waiting on other sessions' rows.
+
+A reply that streamed to the end can also be kept in reply_variants, written
+in the same batch, so an edit back to an earlier wording can reuse it.
+Expired variants, and expired persisted response cache entries, are purged
+from the background thread.
+"""
+
+import threading
+import time
+
+from typing import Optional
+
+from sqlalchemy import event, insert
+
+import metrics
+from database import ChatMessage, ReplyVariant, SessionLocal, malaysia_now, purge_reply_variants
+from response_cache import response_cache
+from env import WRITE_BEHIND_MAX_QUEUE, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL
+
+# Seconds between purges of expired reply variants and response cache rows
+PURGE_INTERVAL = 3600
+
+
+class MessageWriter:
+    """Bounded write-behind queue that batches chat message inserts"""
+
+    def __init__(self, session_factory, max_queue: int = WRITE_BEHIND_MAX_QUEUE,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL):
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer = []  # Rows waiting to be written
+        self._pending = 0  # Rows buffered or currently being written
+        self._writing = set()  # Sessions with rows in the batch being written
+        self._cond = threading.Condition()
+        # Held while rows are taken from the buffer AND written, so a flush()
+        # only returns once everything enqueued before it is committed
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._last_purge = None  # Expired rows are purged on the first background pass
+
+    @property
+    def depth(self) -> int:
+        """Number of rows not yet committed to the database"""
+        return self._pending
+
+    def enqueue(self, session_id: str, role: str, content: str, variant_key: Optional[str] = None,
+                reply_to: Optional[int] = None):
+        """
+        Queue a message for insertion; never blocks on the database unless the queue is full.
+        With variant_key and reply_to (a complete reply to that user message) it is also kept
+        in reply_variants under that key.
+        """
+        row = {
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "created_at": malaysia_now(),  # Stamp now so ordering matches the conversation
+            "variant_key": variant_key,
+            "reply_to": reply_to,
+        }
+
+        with self._cond:
+            accepted = not self._closed and len(self._buffer) < self.max_queue
+            if accepted:
+                self._buffer.append(row)
+                self._pending += 1
+                if len(self._buffer) >= self.batch_size:
+                    self._cond.notify()
+
+        if not accepted:
+            # Queue full (or shutting down) - write synchronously so nothing is lost
+            metrics.inc("write_behind.sync_fallback_writes")
+            self._write([row])
+            return
+
+        metrics.inc("write_behind.enqueued")
+        self._ensure_started()
+
+    def flush(self):
+        """Write every buffered row now and wait until it is committed"""
+        if not self._pending:
+            return
+
+        with self._flush_lock:
+            with self._cond:
+                rows = self._buffer
+                self._buffer = []
+                self._writing = {row["session_id"] for row in rows}
+            if not rows:
+                return
+            try:
+                self._write(rows)
+            except Exception as e:
+                # Put the rows back in front so they are retried on the next flush
+                with self._cond:
+                    self._buffer = rows + self._buffer
+                metrics.inc("write_behind.write_errors")
+                print(f"❌ Write-behind flush failed ({len(rows)} rows): {str(e)}")
+                raise
+            finally:
+                with self._cond:
+                    self._writing = set()
+                    self._pending = len(self._buffer)
+                    self._cond.notify_all()
+
+    def write_session(self, session_id: str, db):
+        """
+        Read-your-writes for one chat session: insert its queued rows in db's transaction,
+        ahead of the caller's own statements, and leave other sessions' rows queued. The
+        caller's commit writes them; if its transaction ends without a commit they are
+        queued again.
+        """
+        with self._cond:
+            # A batch holding this session's rows is committed before they are looked for
+            self._cond.wait_for(lambda: session_id not in self._writing)
+            rows = [row for row in self._buffer if row["session_id"] == session_id]
+            if not rows:
+                return
+            self._buffer = [row for row in self._buffer if row["session_id"] != session_id]
+            self._pending -= len(rows)
+
+        session = getattr(db, "session", db)  # RequestSession wraps a Session
+        committed, ended = [], []
+
+        def on_commit(session):
+            committed.append(True)
+
+        def on_end(session, transaction):
+            # Only the end of the outermost transaction decides (flushes end nested ones)
+            if transaction.parent is not None or ended:
+                return
+            ended.append(True)
+            if not committed:
+                self._requeue(rows)
+
+        event.listen(session, "after_commit", on_commit)
+        event.listen(session, "after_transaction_end", on_end)
+        try:
+            self._insert(db, rows)
+        except Exception:
+            db.rollback()
+            raise
+        metrics.inc("write_behind.session_writes")
+
+    def _requeue(self, rows: list):
+        with self._cond:
+            self._buffer = rows + self._buffer
+            self._pending += len(rows)
+        self._ensure_started()
+
+    def open(self):
+        """Accept queued writes again (called on app startup)"""
+        with self._cond:
+            self._closed = False
+
+    def close(self):
+        """Stop the background thread and durably drain the queue"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or len(self._buffer) >= self.batch_size,
+                    timeout=self.flush_interval,
+                )
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception:
+                # Already counted and logged; back off before retrying
+                time.sleep(self.flush_interval)
+            if closed:
+                return
+            if self._last_purge is None or time.monotonic() - self._last_purge >= PURGE_INTERVAL:
+                self._last_purge = time.monotonic()
+                self._purge_expired()
+
+    def _purge_expired(self):
+        db = self.session_factory()
+        try:
+            purged = purge_reply_variants(db)
+            if purged:
+                print(f"🧹 Purged {purged} expired reply variants")
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Reply variant purge failed: {str(e)}")
+        finally:
+            db.close()
+
+        if response_cache.persist:
+            try:
+                purged = response_cache.purge_expired()
+                if purged:
+                    print(f"🧹 Purged {purged} expired response cache entries")
+            except Exception as e:
+                print(f"⚠️ Response cache purge failed: {str(e)}")
+
+    @staticmethod
+    def _insert(db, rows: list):
+        """Add the message rows (and the reply variants among them) to db's transaction"""
+        db.execute(insert(ChatMessage.__table__).values([
+            {column: row[column] for column in ("session_id", "role", "content", "created_at")} for row in rows
+        ]))
+        variants = [
+            {"session_id": row["session_id"], "message_id": row["reply_to"], "key": row["variant_key"],
+             "content": row["content"], "created_at": row["created_at"]}
+            for row in rows if row.get("variant_key") and row.get("reply_to") is not None
+        ]
+        if variants:
+            db.execute(insert(ReplyVariant.__table__).values(variants))
+
+    def _write(self, rows: list):
+        """Insert rows with a single multi-row INSERT in one transaction"""
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            self._insert(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        metrics.inc("write_behind.batches")
+        metrics.inc("write_behind.rows_written", len(rows))
+        metrics.observe("write_behind.batch_rows", len(rows))
+        metrics.observe("write_behind.flush_seconds", time.perf_counter() - start)
+
+
+message_writer = MessageWriter(SessionLocal)
+metrics.set_gauge("write_behind.queue_depth", lambda: message_writer.depth)
+
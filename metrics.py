@@ -0,0 +1,59 @@
+"""
+Lightweight in-process metrics registry, exposed through GET /metrics
+"""
+
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+
+
+def inc(name: str, value: float = 1):
+    """Increase a counter by value"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value):
+    """Set a gauge to a fixed value, or to a callable evaluated at snapshot time"""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """Record one observation (e.g. a latency in seconds) for a timing metric"""
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["sum"] += value
+        timing["max"] = max(timing["max"], value)
+
+
+def snapshot() -> dict:
+    """Return a JSON-serialisable copy of all metrics"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {name: dict(t) for name, t in _timings.items()}
+
+    # Evaluate callable gauges outside the lock (they may take their own locks)
+    for name, value in gauges.items():
+        if callable(value):
+            try:
+                gauges[name] = value()
+            except Exception:
+                gauges[name] = None
+
+    for timing in timings.values():
+        timing["avg"] = timing["sum"] / timing["count"] if timing["count"] else 0.0
+
+    return {"counters": counters, "gauges": gauges, "timings": timings}
+
+
+def reset():
+    """Clear all counters and timings (gauges stay registered)"""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,192 @@
+"""
+Token-bucket rate limiting of chat turns, measured in OpenAI tokens.
+
+A request-count limit treats "hi" and a pasted 1200-token message the same,
+while the OpenAI budget is in tokens per minute. Each chat session and each
+client IP gets a bucket of RATE_LIMIT_SESSION_TPM / RATE_LIMIT_IP_TPM tokens
+that refills continuously. A turn is charged up front for its message plus
+RATE_LIMIT_REPLY_ESTIMATE completion tokens, and refused with 429 before any
+upstream call when either bucket cannot cover it. When the reply ends the
+charge is settled against what the turn really used (the prompt with its
+history, plus the reply), so a long conversation drains the bucket faster
+than a short one.
+
+Buckets live in process memory, or with RATE_LIMIT_BACKEND=db in the
+rate_limit_buckets table so every worker shares them. A database error lets
+the request through rather than failing the chat.
+"""
+
+import math
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from admission import AdmissionRejected
+from database import SessionLocal, RateLimitBucket
+from env import RATE_LIMIT_SESSION_TPM, RATE_LIMIT_IP_TPM, RATE_LIMIT_REPLY_ESTIMATE, RATE_LIMIT_BACKEND
+
+BACKENDS = ("memory", "db")
+
+
+class RateLimited(AdmissionRejected):
+    """The session or client IP has used its token budget; always a 429"""
+
+    def __init__(self, retry_after: int, message: str = "Rate limit exceeded. Please try again in a moment."):
+        super().__init__(429, retry_after, message)
+
+
+def refill(tokens: float, updated_at: float, now: float, capacity: float, rate: float) -> float:
+    """Bucket level after refilling at `rate` tokens per second since updated_at"""
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class MemoryBuckets:
+    """Buckets in a dict; full buckets are dropped since a missing bucket is a full one"""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated_at, full_at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key: str, cost: float, capacity: float, rate: float, required: Optional[float]) -> float:
+        """
+        Take `cost` tokens when the bucket holds at least `required` (None takes unconditionally,
+        and a negative cost gives tokens back). Returns 0, or the seconds until it would hold enough.
+        """
+        now = time.time()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = refill(tokens, updated_at, now, capacity, rate)
+            if required is not None and tokens < required:
+                return (required - tokens) / rate
+            # A turn larger than its estimate leaves the bucket in debt until it refills
+            tokens = min(capacity, tokens - cost)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            self._sweep(now)
+            return 0.0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def _sweep(self, now: float):
+        if len(self._buckets) > 10000:
+            for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                del self._buckets[key]
+
+
+class DatabaseBuckets:
+    """Buckets in the rate_limit_buckets table, updated under a row lock (FOR UPDATE on Postgres)"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def take(self, key: str, cost: float, capacity: float, rate: float, required: Optional[float]) -> float:
+        for attempt in range(2):
+            db = self.session_factory()
+            try:
+                now = time.time()
+                row = db.execute(
+                    select(RateLimitBucket).where(RateLimitBucket.key == key).with_for_update()
+                ).scalar_one_or_none()
+                tokens = capacity if row is None else refill(row.tokens, row.updated_at, now, capacity, rate)
+                if required is not None and tokens < required:
+                    db.rollback()
+                    return (required - tokens) / rate
+                tokens = min(capacity, tokens - cost)
+                if row is None:
+                    db.add(RateLimitBucket(key=key, tokens=tokens, updated_at=now))
+                else:
+                    row.tokens, row.updated_at = tokens, now
+                db.commit()
+                return 0.0
+            except IntegrityError:
+                # Another worker created the bucket first; read it again
+                db.rollback()
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Rate limit bucket update failed: {e}")
+                return 0.0
+            finally:
+                db.close()
+        return 0.0
+
+    def clear(self):
+        db = self.session_factory()
+        try:
+            db.query(RateLimitBucket).delete()
+            db.commit()
+        finally:
+            db.close()
+
+
+class Reservation:
+    """Tokens charged to some buckets for one turn, settled once its real usage is known"""
+
+    def __init__(self, limiter: "RateLimiter", buckets: List[Tuple[str, int]], charged: int):
+        self.limiter = limiter
+        self.buckets = buckets  # (key, tokens per minute)
+        self.charged = charged
+        self.settled = False
+
+    def settle(self, used: int):
+        """Charge the difference between the real usage and the up-front estimate"""
+        if self.settled:
+            return
+        self.settled = True
+        difference = used - self.charged
+        if difference:
+            for key, per_minute in self.buckets:
+                self.limiter.backend.take(key, difference, per_minute, per_minute / 60, None)
+        metrics.observe("ratelimit.settled_tokens", used)
+
+    def cancel(self):
+        """Give the whole charge back (the turn never reached upstream)"""
+        self.settle(0)
+
+
+class RateLimiter:
+    """Per-session and per-IP token buckets for chat turns"""
+
+    def __init__(self, session_tpm: int = RATE_LIMIT_SESSION_TPM, ip_tpm: int = RATE_LIMIT_IP_TPM,
+                 reply_estimate: int = RATE_LIMIT_REPLY_ESTIMATE, backend: str = RATE_LIMIT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"RATE_LIMIT_BACKEND must be one of {', '.join(BACKENDS)}, got {backend!r}")
+        self.session_tpm = session_tpm  # 0 disables the session bucket
+        self.ip_tpm = ip_tpm  # 0 disables the IP bucket
+        self.reply_estimate = reply_estimate
+        self.backend = MemoryBuckets() if backend == "memory" else DatabaseBuckets()
+
+    def charge(self, session_id: str, client_ip: Optional[str], message_tokens: int) -> Reservation:
+        """Charge a turn's estimated tokens to its session and IP, or raise RateLimited"""
+        buckets = []
+        if self.session_tpm > 0:
+            buckets.append((f"session:{session_id}", self.session_tpm))
+        if self.ip_tpm > 0 and client_ip:
+            buckets.append((f"ip:{client_ip}", self.ip_tpm))
+
+        cost = message_tokens + self.reply_estimate
+        taken = []
+        for key, per_minute in buckets:
+            # A turn bigger than the whole budget still runs when the bucket is full
+            wait = self.backend.take(key, cost, per_minute, per_minute / 60, min(cost, per_minute))
+            if wait:
+                for taken_key, taken_per_minute in taken:
+                    self.backend.take(taken_key, -cost, taken_per_minute, taken_per_minute / 60, None)
+                metrics.inc(f"ratelimit.rejected_{key.split(':')[0]}")
+                raise RateLimited(max(1, math.ceil(wait)))
+            taken.append((key, per_minute))
+        return Reservation(self, taken, cost)
+
+    def clear(self):
+        self.backend.clear()
+
+
+# Shared limiter used by the chat endpoints
+rate_limiter = RateLimiter()
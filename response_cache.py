@@ -0,0 +1,205 @@
+"""
+Exact-context cache of model replies (opt-in).
+
+The same context is often sent more than once: "hi" as the first message of
+many new sessions, canned prompts from the UI, or an edit that restores an
+earlier wording. With RESPONSE_CACHE_SIZE > 0, a reply that streamed to the
+end is stored under a hash of the model, its parameters and the exact
+(truncated) message list. The next request with that context replays the
+stored chunks as a token stream, at RESPONSE_CACHE_REPLAY_RATE chunks per
+second, without a model call. With RESPONSE_CACHE_DB=true entries are also
+kept in the response_cache table. Both honour RESPONSE_CACHE_TTL.
+
+Stopped, truncated and failed replies are never stored. Retry never reads or
+writes the cache, since it exists to get a different answer.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from database import SessionLocal, ResponseCacheEntry, malaysia_now
+from env import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB, RESPONSE_CACHE_REPLAY_RATE
+
+
+def context_key(model: str, messages: List[dict], **params) -> str:
+    """Cache key for one exact request: model, parameters and message list"""
+    request = {"model": model, "messages": messages, "params": params}
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def content_of(event) -> Optional[str]:
+    choices = getattr(event, "choices", None)
+    if choices and choices[0].delta:
+        return choices[0].delta.content
+    return None
+
+
+def chunk_event(content: str):
+    """A chunk shaped like the ones the OpenAI SDK streams"""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class ResponseCache:
+    """LRU of streamed replies with a TTL, optionally backed by the response_cache table"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl_seconds: int = RESPONSE_CACHE_TTL,
+                 persist: bool = RESPONSE_CACHE_DB, replay_rate: float = RESPONSE_CACHE_REPLAY_RATE,
+                 session_factory=SessionLocal):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.replay_rate = replay_rate  # Chunks per second when replaying (0 = as fast as possible)
+        self.session_factory = session_factory
+
+        self._entries = OrderedDict()  # key -> (chunks, tokens, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.persist
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[List[str], int]]:
+        """Return (chunks, tokens the original request used) for key, or None (counted as a hit or a miss)"""
+        entry = self._get_memory(key)
+        if entry is None and self.persist:
+            entry = self._get_db(key)
+            if entry is not None:
+                self._put_memory(key, *entry)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.inc("response_cache.misses" if entry is None else "response_cache.hits")
+        if entry is not None:
+            metrics.inc("response_cache.saved_tokens", entry[1])
+        return entry
+
+    def put(self, key: str, chunks: List[str], tokens: int):
+        """Store a complete reply (empty replies are not cached)"""
+        if not "".join(chunks).strip():
+            return
+        self._put_memory(key, chunks, tokens)
+        if self.persist:
+            self._put_db(key, chunks, tokens)
+
+    def replay(self, chunks: List[str], stop_event: Optional[threading.Event] = None) -> Iterator:
+        """Yield the stored chunks as stream events, paced at replay_rate"""
+        interval = 1 / self.replay_rate if self.replay_rate > 0 else 0
+        for i, content in enumerate(chunks):
+            if i and interval:
+                if stop_event is not None:
+                    # The caller's loop sees the stop on the next event
+                    stop_event.wait(interval)
+                else:
+                    time.sleep(interval)
+            yield chunk_event(content)
+
+    def record(self, key: str, events: Iterable, tokens_used) -> Iterator:
+        """Pass the events through and store the reply if the stream is read to the end"""
+        chunks = []
+        for event in events:
+            yield event
+            content = content_of(event)
+            if content:
+                chunks.append(content)
+        # A stopped, truncated or failed stream is closed before it gets here
+        self.put(key, chunks, tokens_used())
+
+    def clear(self):
+        """Drop the in-memory entries and statistics (persisted rows are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _get_memory(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            chunks, tokens, stored_at = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return chunks, tokens
+
+    def _put_memory(self, key: str, chunks: List[str], tokens: int):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (list(chunks), tokens, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_db(self, key: str):
+        db = self.session_factory()
+        try:
+            cutoff = malaysia_now() - timedelta(seconds=self.ttl_seconds)
+            row = db.execute(
+                select(ResponseCacheEntry.chunks, ResponseCacheEntry.tokens)
+                .where(ResponseCacheEntry.key == key, ResponseCacheEntry.created_at >= cutoff)
+            ).one_or_none()
+            return (json.loads(row.chunks), row.tokens) if row else None
+        except Exception as e:
+            print(f"⚠️ Response cache lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _put_db(self, key: str, chunks: List[str], tokens: int):
+        db = self.session_factory()
+        try:
+            # Replace an expired row for the same context
+            db.execute(delete(ResponseCacheEntry).where(ResponseCacheEntry.key == key))
+            db.add(ResponseCacheEntry(key=key, chunks=json.dumps(chunks, ensure_ascii=False), tokens=tokens))
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same context first
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Response cache write failed: {e}")
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        """Delete persisted entries older than the TTL, returning how many were removed"""
+        db = self.session_factory()
+        try:
+            cutoff = malaysia_now() - timedelta(seconds=self.ttl_seconds)
+            result = db.execute(delete(ResponseCacheEntry).where(ResponseCacheEntry.created_at < cutoff))
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+
+# Shared instance used by /chat/ and /chat/edit/
+response_cache = ResponseCache()
+
+metrics.set_gauge("response_cache.hit_rate", lambda: response_cache.hit_rate)
+metrics.set_gauge("response_cache.entries", lambda: len(response_cache))
@@ -0,0 +1,135 @@
+"""
+Build step for the frontend CSS/JS bundle.
+
+Concatenates and minifies what main.load_css() / main.load_js() would otherwise
+inline into every page, and writes content-hashed files plus a manifest:
+
+    python static_assets.py
+
+When the bundle exists, main.py serves it with immutable cache headers, so
+repeat visits only download the HTML shell.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+from starlette.staticfiles import StaticFiles
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dist")
+MANIFEST_NAME = "manifest.json"
+ASSETS_URL_PATH = "/bundle"  # Gradio already owns /assets and /static
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# The backend URL differs per deploy, so the bundle reads it from the page at runtime
+# (the placeholder sits inside a quoted string in the JS files)
+RUNTIME_API_BASE = "' + window.__API_BASE_URL__ + '"
+
+# Same prefix Gradio adds to custom css, so the bundle keeps its specificity
+GRADIO_CSS_SCOPE = ".gradio-container .contain"
+
+# At-rules whose blocks hold ordinary rules, which get scoped like top-level ones
+# (@keyframes, @font-face, @page and the like are kept once, as-is)
+GROUPING_AT_RULES = ("@media", "@supports", "@container", "@layer", "@document")
+
+def scope_css(css: str) -> str:
+    """Emit every rule as-is and again under GRADIO_CSS_SCOPE, including rules nested in @media/@supports blocks"""
+    out = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(css):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                rule = css[start:i + 1].strip()
+                start = i + 1
+                selector, body = rule.split("{", 1)
+                if selector.startswith(GROUPING_AT_RULES):
+                    out.append(selector + "{" + scope_css(body[:-1]) + "}")
+                    continue
+                out.append(rule)
+                if not selector.startswith("@"):
+                    scoped = ",".join(f"{GRADIO_CSS_SCOPE} {s.strip()}" for s in selector.split(","))
+                    out.append(scoped + "{" + body)
+    return "".join(out)
+
+def build(output_dir: str = ASSETS_DIR) -> dict:
+    """Write the minified, content-hashed CSS and JS bundle and return the manifest"""
+    # Build-time only dependencies
+    from rcssmin import cssmin
+    from rjsmin import jsmin
+    from main import load_css, load_js
+
+    css = scope_css(cssmin(load_css()))
+    # Gradio ran the inline js inside a function, so keep the bundle out of the global scope
+    js = jsmin("(function() {\n" + load_js(api_base_url=RUNTIME_API_BASE) + "\n})();")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    for kind, content in (("css", css), ("js", js)):
+        data = content.encode("utf-8")
+        name = f"app.{hashlib.sha256(data).hexdigest()[:12]}.{kind}"
+        with open(os.path.join(output_dir, name), "wb") as f:
+            f.write(data)
+        manifest[kind] = name
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def load_manifest(output_dir: str = ASSETS_DIR):
+    """Return the manifest of the last build, or None if the bundle has not been built"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def page_head(manifest: dict) -> str:
+    """<head> markup for the bundled stylesheet"""
+    return f'<link rel="stylesheet" href="{ASSETS_URL_PATH}/{manifest["css"]}">'
+
+def page_loader_js(manifest: dict, api_base_url: str) -> str:
+    """Gradio js= hook: set the backend URL, then load the bundled script (cached after the first visit)"""
+    return f"""() => {{
+        window.__API_BASE_URL__ = {json.dumps(api_base_url)};
+        const script = document.createElement('script');
+        script.src = '{ASSETS_URL_PATH}/{manifest["js"]}';
+        document.head.appendChild(script);
+    }}"""
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files whose names are content hashes, so browsers may cache them forever"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+def page_weight(manifest: dict, output_dir: str = ASSETS_DIR) -> dict:
+    """Bytes of CSS/JS a visitor downloads, inlined (before) vs bundled (first and repeat visits)"""
+    from main import load_css, load_js
+
+    def sizes(data: bytes):
+        return {"bytes": len(data), "gzip_bytes": len(gzip.compress(data))}
+
+    inline = (load_css() + load_js()).encode("utf-8")
+    bundle = b""
+    for kind in ("css", "js"):
+        with open(os.path.join(output_dir, manifest[kind]), "rb") as f:
+            bundle += f.read()
+    loader = (page_head(manifest) + page_loader_js(manifest, "https://example.com")).encode("utf-8")
+    return {
+        "inline_every_visit": sizes(inline),
+        "bundle_first_visit": sizes(bundle + loader),
+        "bundle_repeat_visit": sizes(loader),
+    }
+
+if __name__ == "__main__":
+    manifest = build()
+    print(f"📦 Built {manifest['css']} and {manifest['js']} in {ASSETS_DIR}")
+    for name, size in page_weight(manifest).items():
+        print(f"   {name}: {size['bytes'] / 1024:.1f} KB ({size['gzip_bytes'] / 1024:.1f} KB gzip)")
@@ -5,14 +5,48 @@ Shared pytest fixtures for all test modules
 import pytest
 import os
 import tempfile
+import time
 import uuid
+from types import SimpleNamespace
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from database import Base, ChatMessage, SessionLocal
+from database import Base, ChatMessage, SessionLocal, init_db
 from api import app, count_tokens
+from message_writer import message_writer
 from fastapi.testclient import TestClient
 
 
+def pytest_addoption(parser):
+    parser.addoption("--run-manual", action="store_true", help="Also run tests marked manual (benchmarks with extra setup)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "manual: needs extra setup; runs only with --run-manual")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Deselect manual tests unless --run-manual is given"""
+    if config.getoption("--run-manual"):
+        return
+    kept = [item for item in items if item.get_closest_marker("manual") is None]
+    if len(kept) < len(items):
+        config.hook.pytest_deselected(items=[item for item in items if item not in kept])
+        items[:] = kept
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database_schema():
+    """Create the tables once per test run (schema creation no longer happens at import)"""
+    init_db()
+
+
+@pytest.fixture(autouse=True)
+def rate_limits():
+    """Start every test with full token buckets (all test clients share one IP)"""
+    from ratelimit import rate_limiter
+    rate_limiter.clear()
+
+
 @pytest.fixture
 def temp_db():
     """Create a temporary database for testing"""
@@ -38,10 +72,20 @@ def test_session_id():
     return str(uuid.uuid4())
 
 
+class FlushingTestClient(TestClient):
+    """TestClient that drains the write-behind queue after each request, so tests reading
+    the database through their own session see the rows the request queued"""
+
+    def request(self, *args, **kwargs):
+        response = super().request(*args, **kwargs)
+        message_writer.flush()
+        return response
+
+
 @pytest.fixture
 def client():
     """Create a test client for FastAPI"""
-    return TestClient(app)
+    return FlushingTestClient(app)
 
 
 @pytest.fixture
@@ -62,4 +106,52 @@ def sample_long_message():
 @pytest.fixture
 def sample_medium_message():
     """A medium-length message within token limits"""
-    return "This is a medium length message that should be well within the token limit. " * 5
\ No newline at end of file
+    return "This is a medium length message that should be well within the token limit. " * 5
+
+
+@pytest.fixture
+def fake_whisper(monkeypatch):
+    """Replace the Whisper call with a fake that records (file suffix, bytes) of each upload"""
+    import api
+    from transcription_cache import transcription_cache
+
+    # Transcripts cached by earlier tests would skip the fake
+    transcription_cache.clear()
+
+    uploads = []
+
+    def create(model, file):
+        uploads.append((os.path.splitext(file.name)[1], file.read()))
+        return SimpleNamespace(text="hello world")
+
+    monkeypatch.setattr(api.client.audio.transcriptions, "create", create)
+    return uploads
+
+
+class FakeChatCompletions:
+    """Stand-in for client.chat.completions: streams `reply` one word per chunk, `delay` seconds apart"""
+
+    def __init__(self, reply="Stub reply from the fake model", delay=0.0):
+        self.reply = reply
+        self.delay = delay
+        self.calls = []  # Messages sent with each request
+
+    def create(self, model, messages, stream, max_tokens, **kwargs):
+        self.calls.append(list(messages))
+        return self.stream(self.reply)
+
+    def stream(self, text):
+        for i, word in enumerate(text.split(" ")):
+            time.sleep(self.delay)
+            content = word if i == 0 else " " + word
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Replace the streaming chat completion call with a FakeChatCompletions"""
+    import api
+
+    fake = FakeChatCompletions()
+    monkeypatch.setattr(api.client.chat.completions, "create", fake.create)
+    return fake
@@ -0,0 +1,101 @@
+// Browser-free benchmark for the edit-button MutationObserver in js/edit_user_messages.js
+//
+// Streams tokens into the last bot message of chats of growing size and reports
+// the time spent in MutationObserver callbacks per mutation batch. The cost
+// should stay flat as the chat grows.
+//
+// Usage: npm install && node bench_edit_observer.js [path/to/edit_user_messages.js]
+
+const fs = require('fs');
+const path = require('path');
+const { JSDOM, VirtualConsole } = require('jsdom');
+
+const SCRIPT_PATH = process.argv[2] || path.join(__dirname, '..', '..', 'js', 'edit_user_messages.js');
+const CHAT_SIZES = [10, 100, 500];  // user/bot message pairs
+const STREAMED_TOKENS = 200;
+const SETTLE_MS = 1300;  // Initial injection runs after 1 s
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+// MutationObserver callbacks run as microtasks; a macrotask turn flushes them
+const flushMutations = () => new Promise((resolve) => setImmediate(resolve));
+
+function buildChat(document, pairs) {
+    const chatbot = document.createElement('div');
+    chatbot.className = 'chatbot';
+    for (let i = 0; i < pairs; i++) {
+        const userRow = document.createElement('div');
+        userRow.className = 'message-row user-row';
+        userRow.innerHTML = `<div class="message user"><p>Question ${i}</p></div>`;
+        const botRow = document.createElement('div');
+        botRow.className = 'message-row bot-row';
+        botRow.innerHTML = `<div class="message bot"><p>Answer ${i}</p></div>`;
+        chatbot.appendChild(userRow);
+        chatbot.appendChild(botRow);
+    }
+    document.body.appendChild(chatbot);
+    return chatbot;
+}
+
+async function measure(script, pairs) {
+    const dom = new JSDOM('<!DOCTYPE html><html><body></body></html>', {
+        runScripts: 'outside-only',
+        pretendToBeVisual: true,
+        virtualConsole: new VirtualConsole(),  // Silence the script's logging
+    });
+    const { window } = dom;
+
+    // Time every observer callback the script registers
+    let observerMs = 0;
+    let batches = 0;
+    const NativeMutationObserver = window.MutationObserver;
+    window.MutationObserver = class extends NativeMutationObserver {
+        constructor(callback) {
+            super((mutations, observer) => {
+                const start = performance.now();
+                callback(mutations, observer);
+                observerMs += performance.now() - start;
+                batches++;
+            });
+        }
+    };
+
+    const chatbot = buildChat(window.document, pairs);
+    window.eval(script);
+    await sleep(SETTLE_MS);
+
+    const injected = chatbot.querySelectorAll('.edit-user-message-btn').length;
+    observerMs = 0;
+    batches = 0;
+
+    // Stream tokens into the last bot message, one rendered element per token
+    const lastBot = chatbot.querySelectorAll('.message.bot p');
+    const target = lastBot[lastBot.length - 1];
+    for (let i = 0; i < STREAMED_TOKENS; i++) {
+        const token = window.document.createElement('span');
+        token.textContent = ` token${i}`;
+        target.appendChild(token);
+        await flushMutations();
+    }
+
+    window.close();
+    return {
+        pairs,
+        batches,
+        edit_buttons: injected,
+        us_per_batch: batches ? (observerMs * 1000) / batches : 0,
+    };
+}
+
+async function main() {
+    const script = fs.readFileSync(SCRIPT_PATH, 'utf8');
+    const results = [];
+    for (const pairs of CHAT_SIZES) {
+        results.push(await measure(script, pairs));
+    }
+    console.log(JSON.stringify(results));
+}
+
+main().catch((error) => {
+    console.error(error);
+    process.exit(1);
+});
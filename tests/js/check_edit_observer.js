@@ -0,0 +1,113 @@
+// Browser-free check of the edit-button MutationObserver in js/edit_user_messages.js
+//
+// Runs the script on the minimal DOM in minidom.js (no npm install needed) for
+// chats of growing size and counts the elements it examines while tokens stream
+// into the last reply and while a new turn is added. Both counts should be the
+// same for every chat size. Also checks that the button ends up on the newest
+// user message only, and stays there when earlier messages are loaded above it.
+//
+// Usage: node check_edit_observer.js [path/to/edit_user_messages.js]
+
+'use strict';
+
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const { createWindow, stats } = require('./minidom');
+
+const SCRIPT_PATH = process.argv[2] || path.join(__dirname, '..', '..', 'js', 'edit_user_messages.js');
+const CHAT_SIZES = [10, 100, 500];  // user/bot message pairs
+const STREAMED_TOKENS = 200;
+const SETTLE_MS = 1000;  // Initial injection delay
+const DEBOUNCE_MS = 200;  // Longer than the script's injection debounce
+
+// MutationObserver callbacks run as microtasks; a macrotask turn flushes them
+const flushMutations = () => new Promise((resolve) => setImmediate(resolve));
+
+function messageRow(document, role, text) {
+    const row = document.createElement('div');
+    row.className = `message-row ${role}-row`;
+    const message = document.createElement('div');
+    message.className = `message ${role}`;
+    const paragraph = document.createElement('p');
+    paragraph.textContent = text;
+    message.appendChild(paragraph);
+    row.appendChild(message);
+    return row;
+}
+
+// Whether the only edit button on the page sits right before this user message
+function hasOnlyButton(document, message) {
+    const buttons = document.querySelectorAll('.edit-user-message-btn');
+    return buttons.length === 1 && buttons[0].parentNode === message.parentNode &&
+        message.parentNode.childNodes.indexOf(buttons[0]) === message.parentNode.childNodes.indexOf(message) - 1;
+}
+
+async function measure(script, pairs) {
+    const { window, document, clock } = createWindow();
+    const chatbot = document.createElement('div');
+    chatbot.className = 'chatbot';
+    for (let i = 0; i < pairs; i++) {
+        chatbot.appendChild(messageRow(document, 'user', `Question ${i}`));
+        chatbot.appendChild(messageRow(document, 'bot', `Answer ${i}`));
+    }
+    document.body.appendChild(chatbot);
+    await flushMutations();
+
+    vm.createContext(window);
+    vm.runInContext(script, window);
+    clock.advance(SETTLE_MS);
+    const users = () => chatbot.querySelectorAll('.message.user');
+    const initial = hasOnlyButton(document, users()[pairs - 1]);
+
+    // Stream tokens into the last bot message, one rendered element per token
+    const bots = chatbot.querySelectorAll('.message.bot');
+    const target = bots[bots.length - 1].firstElementChild;
+    stats.visited = 0;
+    for (let i = 0; i < STREAMED_TOKENS; i++) {
+        const token = document.createElement('span');
+        token.textContent = ` token${i}`;
+        target.appendChild(token);
+        await flushMutations();
+    }
+    clock.advance(DEBOUNCE_MS);
+    const perToken = stats.visited / STREAMED_TOKENS;
+
+    // A new turn: the button moves to the new user message
+    stats.visited = 0;
+    const newUser = messageRow(document, 'user', 'New question');
+    const newMessage = newUser.firstElementChild;
+    chatbot.appendChild(newUser);
+    chatbot.appendChild(messageRow(document, 'bot', 'New answer'));
+    await flushMutations();
+    clock.advance(DEBOUNCE_MS);
+    const perNewTurn = stats.visited;
+    const moved = hasOnlyButton(document, newMessage);
+
+    // Earlier messages loaded above the chat leave the button where it is
+    chatbot.insertBefore(messageRow(document, 'user', 'Older question'), chatbot.firstChild);
+    await flushMutations();
+    clock.advance(DEBOUNCE_MS);
+    const kept = hasOnlyButton(document, newMessage);
+
+    return {
+        pairs,
+        visited_per_token: perToken,
+        visited_per_new_turn: perNewTurn,
+        button_on_latest: initial && moved && kept,
+    };
+}
+
+async function main() {
+    const script = fs.readFileSync(SCRIPT_PATH, 'utf8');
+    const results = [];
+    for (const pairs of CHAT_SIZES) {
+        results.push(await measure(script, pairs));
+    }
+    console.log(JSON.stringify(results));
+}
+
+main().catch((error) => {
+    console.error(error);
+    process.exit(1);
+});
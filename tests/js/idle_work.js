@@ -0,0 +1,82 @@
+// Browser-free check that js/mic_recording.js and js/stop_messages.js do no periodic
+// DOM work on an idle page, and only observe the DOM while a stream is active.
+//
+// Runs both scripts on the minimal DOM in minidom.js (no npm install needed)
+// with a manual clock, so the idle period takes no wall time.
+//
+// Usage: node idle_work.js
+
+'use strict';
+
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const { createWindow } = require('./minidom');
+
+const JS_DIR = path.join(__dirname, '..', '..', 'js');
+const SCRIPTS = ['mic_recording.js', 'stop_messages.js'];
+const SETTLE_MS = 1500;  // One-shot startup timers
+const IDLE_MS = 60000;
+
+function element(document, parent, tagName, attributes) {
+    const node = document.createElement(tagName);
+    for (const [name, value] of Object.entries(attributes || {})) {
+        node.setAttribute(name, value);
+    }
+    return parent.appendChild(node);
+}
+
+async function main() {
+    const { window, document, clock } = createWindow();
+    const chatbot = element(document, document.body, 'div', { class: 'chatbot' });
+    element(document, element(document, chatbot, 'div', { class: 'message bot' }), 'p').textContent = 'Hello';
+    const inputContainer = element(document, document.body, 'div', { id: 'input-container' });
+    element(document, inputContainer, 'textarea', { placeholder: 'How can I help you today?' });
+    element(document, inputContainer, 'button', { id: 'mic-button' });
+    const sendButton = element(document, inputContainer, 'button', { id: 'upload-button-chat', class: 'upload-button' });
+
+    // Count timer callbacks and track which observers are connected
+    let timerCallbacks = 0;
+    let intervals = 0;
+    const wrap = (fn) => (...args) => { timerCallbacks++; return fn(...args); };
+    window.setTimeout = (fn, ms) => clock.setTimeout(wrap(fn), ms);
+    window.setInterval = (fn, ms) => { intervals++; return clock.setInterval(wrap(fn), ms); };
+
+    const connected = new Set();
+    const NativeMutationObserver = window.MutationObserver;
+    window.MutationObserver = class extends NativeMutationObserver {
+        observe(...args) { connected.add(this); return super.observe(...args); }
+        disconnect() { connected.delete(this); return super.disconnect(); }
+    };
+
+    vm.createContext(window);
+    for (const name of SCRIPTS) {
+        const source = fs.readFileSync(path.join(JS_DIR, name), 'utf8').replace(/__API_BASE_URL__/g, 'http://backend');
+        vm.runInContext(source, window);
+    }
+    clock.advance(SETTLE_MS);
+
+    timerCallbacks = 0;
+    clock.advance(IDLE_MS);
+    const idle = { timer_callbacks: timerCallbacks, intervals, observers: connected.size };
+
+    const { CustomEvent } = window;
+    document.dispatchEvent(new CustomEvent('chattie:stream-start', { detail: { source: 'test' } }));
+    const streaming = {
+        observers: connected.size,
+        stop_mode: sendButton.classList.contains('stop-mode'),
+    };
+
+    document.dispatchEvent(new CustomEvent('chattie:stream-end'));
+    const ended = {
+        observers: connected.size,
+        stop_mode: sendButton.classList.contains('stop-mode'),
+    };
+
+    console.log(JSON.stringify({ idle, streaming, ended }));
+}
+
+main().catch((error) => {
+    console.error(error);
+    process.exit(1);
+});
@@ -0,0 +1,432 @@
+// Minimal DOM for running the frontend scripts under plain node, with no npm install.
+//
+// Implements only what the edit-button observer path of js/edit_user_messages.js
+// and the idle and stream paths of js/mic_recording.js and js/stop_messages.js
+// use: elements and text nodes, simple selectors (tag, .class, #id, [attr],
+// [attr="v"], [attr*="v"] and comma lists, no combinators), MutationObserver
+// (childList records, delivered as microtasks) and a manual clock for timers.
+// Every element a selector is tested against is counted in stats.visited, so
+// checks can assert on how much of the page a piece of code looks at.
+
+'use strict';
+
+const stats = { visited: 0 };
+
+const ELEMENT_NODE = 1;
+const TEXT_NODE = 3;
+const DOCUMENT_NODE = 9;
+const DOCUMENT_POSITION_DISCONNECTED = 1;
+const DOCUMENT_POSITION_PRECEDING = 2;
+const DOCUMENT_POSITION_FOLLOWING = 4;
+const DOCUMENT_POSITION_CONTAINS = 8;
+const DOCUMENT_POSITION_CONTAINED_BY = 16;
+
+function parseSelector(selector) {
+    return selector.split(',').map((part) => {
+        const compound = part.trim();
+        const tests = [];
+        const pattern = /^([a-zA-Z][\w-]*)|\.([\w-]+)|#([\w-]+)|\[([\w-]+)(?:([*^$]?=)"([^"]*)")?\]/y;
+        let index = 0;
+        while (index < compound.length) {
+            pattern.lastIndex = index;
+            const match = pattern.exec(compound);
+            if (!match || (match[1] && index > 0)) {
+                throw new Error(`minidom: unsupported selector ${JSON.stringify(selector)}`);
+            }
+            const [, tag, cls, id, attr, op, value] = match;
+            if (tag) tests.push((el) => el.tagName === tag.toUpperCase());
+            if (cls) tests.push((el) => el.classList.contains(cls));
+            if (id) tests.push((el) => el.getAttribute('id') === id);
+            if (attr) {
+                tests.push((el) => {
+                    const actual = el.getAttribute(attr);
+                    if (actual === null) return false;
+                    if (!op) return true;
+                    if (op === '=') return actual === value;
+                    if (op === '*=') return actual.includes(value);
+                    if (op === '^=') return actual.startsWith(value);
+                    return actual.endsWith(value);
+                });
+            }
+            index = pattern.lastIndex;
+        }
+        return (el) => tests.every((test) => test(el));
+    });
+}
+
+function matchesAny(compounds, el) {
+    stats.visited++;
+    return compounds.some((compound) => compound(el));
+}
+
+// Path of child indexes from the root, and the root itself
+function treePath(node) {
+    const path = [];
+    while (node.parentNode) {
+        path.unshift(node.parentNode.childNodes.indexOf(node));
+        node = node.parentNode;
+    }
+    return { path, root: node };
+}
+
+class Node {
+    constructor(ownerDocument) {
+        this.ownerDocument = ownerDocument;
+        this.parentNode = null;
+        this.childNodes = [];
+    }
+
+    get parentElement() {
+        return this.parentNode && this.parentNode.nodeType === ELEMENT_NODE ? this.parentNode : null;
+    }
+
+    get isConnected() {
+        return treePath(this).root === this.ownerDocument;
+    }
+
+    get firstChild() {
+        return this.childNodes[0] || null;
+    }
+
+    get textContent() {
+        return this.childNodes.map((child) => child.textContent).join('');
+    }
+
+    set textContent(text) {
+        for (const child of [...this.childNodes]) {
+            this.removeChild(child);
+        }
+        if (text) {
+            this.appendChild(this.ownerDocument.createTextNode(String(text)));
+        }
+    }
+
+    appendChild(child) {
+        return this.insertBefore(child, null);
+    }
+
+    insertBefore(child, reference) {
+        if (child.parentNode) {
+            child.parentNode.removeChild(child);
+        }
+        const index = reference ? this.childNodes.indexOf(reference) : this.childNodes.length;
+        if (index < 0) {
+            throw new Error('minidom: reference node is not a child');
+        }
+        this.childNodes.splice(index, 0, child);
+        child.parentNode = this;
+        this.ownerDocument._record(this, [child], []);
+        return child;
+    }
+
+    removeChild(child) {
+        const index = this.childNodes.indexOf(child);
+        if (index < 0) {
+            throw new Error('minidom: node is not a child');
+        }
+        this.childNodes.splice(index, 1);
+        child.parentNode = null;
+        this.ownerDocument._record(this, [], [child]);
+        return child;
+    }
+
+    remove() {
+        if (this.parentNode) {
+            this.parentNode.removeChild(this);
+        }
+    }
+
+    compareDocumentPosition(other) {
+        const a = treePath(this);
+        const b = treePath(other);
+        if (a.root !== b.root) {
+            return DOCUMENT_POSITION_DISCONNECTED;
+        }
+        for (let i = 0; i < Math.min(a.path.length, b.path.length); i++) {
+            if (a.path[i] !== b.path[i]) {
+                return a.path[i] < b.path[i] ? DOCUMENT_POSITION_FOLLOWING : DOCUMENT_POSITION_PRECEDING;
+            }
+        }
+        if (a.path.length < b.path.length) {
+            return DOCUMENT_POSITION_CONTAINED_BY | DOCUMENT_POSITION_FOLLOWING;
+        }
+        if (a.path.length > b.path.length) {
+            return DOCUMENT_POSITION_CONTAINS | DOCUMENT_POSITION_PRECEDING;
+        }
+        return 0;
+    }
+
+    addEventListener(type, listener) {
+        this._listeners = this._listeners || {};
+        (this._listeners[type] = this._listeners[type] || []).push(listener);
+    }
+
+    removeEventListener(type, listener) {
+        const listeners = (this._listeners || {})[type] || [];
+        const index = listeners.indexOf(listener);
+        if (index >= 0) listeners.splice(index, 1);
+    }
+
+    dispatchEvent(event) {
+        for (const listener of [...((this._listeners || {})[event.type] || [])]) {
+            listener.call(this, event);
+        }
+        return true;
+    }
+}
+
+Object.assign(Node, {
+    ELEMENT_NODE, TEXT_NODE, DOCUMENT_NODE,
+    DOCUMENT_POSITION_DISCONNECTED, DOCUMENT_POSITION_PRECEDING, DOCUMENT_POSITION_FOLLOWING,
+    DOCUMENT_POSITION_CONTAINS, DOCUMENT_POSITION_CONTAINED_BY,
+});
+
+class Text extends Node {
+    constructor(ownerDocument, data) {
+        super(ownerDocument);
+        this.nodeType = TEXT_NODE;
+        this.data = data;
+    }
+
+    get textContent() {
+        return this.data;
+    }
+}
+
+class Element extends Node {
+    constructor(ownerDocument, tagName) {
+        super(ownerDocument);
+        this.nodeType = ELEMENT_NODE;
+        this.tagName = tagName.toUpperCase();
+        this.attributes = {};
+        this.style = {};
+        this.value = '';
+        const element = this;
+        this.classList = {
+            contains: (name) => element.className.split(/\s+/).includes(name),
+            add: (...names) => {
+                const classes = element.className.split(/\s+/).filter(Boolean);
+                element.className = [...classes, ...names.filter((name) => !classes.includes(name))].join(' ');
+            },
+            remove: (...names) => {
+                element.className = element.className.split(/\s+/).filter((name) => name && !names.includes(name)).join(' ');
+            },
+        };
+    }
+
+    get className() {
+        return this.attributes.class || '';
+    }
+
+    set className(value) {
+        this.attributes.class = String(value);
+    }
+
+    get id() {
+        return this.attributes.id || '';
+    }
+
+    set id(value) {
+        this.attributes.id = String(value);
+    }
+
+    get children() {
+        return this.childNodes.filter((child) => child.nodeType === ELEMENT_NODE);
+    }
+
+    get firstElementChild() {
+        return this.children[0] || null;
+    }
+
+    get innerText() {
+        return this.textContent;
+    }
+
+    // Markup is kept as-is and not parsed (the scripts only set icons this way)
+    set innerHTML(html) {
+        this.textContent = '';
+        this._html = html;
+    }
+
+    getAttribute(name) {
+        return Object.prototype.hasOwnProperty.call(this.attributes, name) ? this.attributes[name] : null;
+    }
+
+    setAttribute(name, value) {
+        this.attributes[name] = String(value);
+    }
+
+    hasAttribute(name) {
+        return this.getAttribute(name) !== null;
+    }
+
+    removeAttribute(name) {
+        delete this.attributes[name];
+    }
+
+    matches(selector) {
+        return matchesAny(parseSelector(selector), this);
+    }
+
+    querySelectorAll(selector) {
+        const compounds = parseSelector(selector);
+        const found = [];
+        const walk = (node) => {
+            for (const child of node.children) {
+                if (matchesAny(compounds, child)) found.push(child);
+                walk(child);
+            }
+        };
+        walk(this);
+        return found;
+    }
+
+    querySelector(selector) {
+        return this.querySelectorAll(selector)[0] || null;
+    }
+}
+
+class Document extends Node {
+    constructor() {
+        super(null);
+        this.ownerDocument = this;
+        this.nodeType = DOCUMENT_NODE;
+        this.readyState = 'complete';
+        this._observers = [];
+        this.documentElement = this.appendChild(this.createElement('html'));
+        this.body = this.documentElement.appendChild(this.createElement('body'));
+    }
+
+    createElement(tagName) {
+        return new Element(this, tagName);
+    }
+
+    createTextNode(data) {
+        return new Text(this, data);
+    }
+
+    getElementById(id) {
+        return this.querySelector(`#${id}`);
+    }
+
+    querySelectorAll(selector) {
+        const compounds = parseSelector(selector);
+        const root = this.documentElement;
+        return (matchesAny(compounds, root) ? [root] : []).concat(root.querySelectorAll(selector));
+    }
+
+    querySelector(selector) {
+        return this.querySelectorAll(selector)[0] || null;
+    }
+
+    _record(target, addedNodes, removedNodes) {
+        for (const { observer, node, options } of this._observers) {
+            if (node === target || (options.subtree && node.compareDocumentPosition(target) & DOCUMENT_POSITION_CONTAINED_BY)) {
+                observer._queue({ type: 'childList', target, addedNodes, removedNodes });
+            }
+        }
+    }
+}
+
+class MutationObserver {
+    constructor(callback) {
+        this.callback = callback;
+        this.records = [];
+        this.document = null;
+    }
+
+    observe(node, options) {
+        this.document = node.ownerDocument;
+        this.document._observers.push({ observer: this, node, options: options || {} });
+    }
+
+    disconnect() {
+        if (this.document) {
+            this.document._observers = this.document._observers.filter((entry) => entry.observer !== this);
+        }
+        this.records = [];
+    }
+
+    takeRecords() {
+        const records = this.records;
+        this.records = [];
+        return records;
+    }
+
+    _queue(record) {
+        this.records.push(record);
+        if (this.records.length === 1) {
+            queueMicrotask(() => {
+                const records = this.takeRecords();
+                if (records.length) this.callback(records, this);
+            });
+        }
+    }
+}
+
+class CustomEvent {
+    constructor(type, init) {
+        this.type = type;
+        this.detail = (init && init.detail) || null;
+    }
+}
+
+// Timers that only run when the clock is advanced
+class Clock {
+    constructor() {
+        this.now = 0;
+        this.timers = new Map();
+        this.nextId = 1;
+        this.setTimeout = (callback, ms) => {
+            const id = this.nextId++;
+            this.timers.set(id, { at: this.now + (ms || 0), callback });
+            return id;
+        };
+        this.clearTimeout = (id) => this.timers.delete(id);
+        this.setInterval = (callback, ms) => {
+            const id = this.nextId++;
+            const tick = () => {
+                this.timers.set(id, { at: this.now + (ms || 1), callback: tick });
+                callback();
+            };
+            this.timers.set(id, { at: this.now + (ms || 1), callback: tick });
+            return id;
+        };
+        this.clearInterval = this.clearTimeout;
+    }
+
+    advance(ms) {
+        const until = this.now + ms;
+        for (;;) {
+            const due = [...this.timers.entries()].filter(([, timer]) => timer.at <= until)
+                .sort((a, b) => a[1].at - b[1].at || a[0] - b[0])[0];
+            if (!due) break;
+            const [id, timer] = due;
+            this.timers.delete(id);
+            this.now = timer.at;
+            timer.callback();
+        }
+        this.now = until;
+    }
+}
+
+// A window-like global for vm.runInContext: document, DOM classes and a manual clock
+function createWindow() {
+    const document = new Document();
+    const clock = new Clock();
+    const silent = () => {};
+    const window = Object.assign(new Node(document), {
+        document, Node, Element, Text, MutationObserver, CustomEvent,
+        setTimeout: clock.setTimeout,
+        clearTimeout: clock.clearTimeout,
+        setInterval: clock.setInterval,
+        clearInterval: clock.clearInterval,
+        getComputedStyle: (element) => element.style,
+        navigator: {},
+        console: { log: silent, warn: silent, error: silent, info: silent, debug: silent },
+    });
+    window.window = window;
+    return { window, document, clock };
+}
+
+module.exports = { createWindow, stats };
@@ -0,0 +1,215 @@
+"""
+Test cases for global admission control of chat generations (admission.py)
+"""
+
+import pytest
+import asyncio
+import gc
+import json
+import threading
+import time
+import uuid
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, test_session_id, fake_openai
+from admission import AdmissionController, AdmissionRejected, release_when_done, admission
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(max_in_flight, max_queue, queue_timeout=5):
+        monkeypatch.setattr(admission, "max_in_flight", max_in_flight)
+        monkeypatch.setattr(admission, "max_queue", max_queue)
+        monkeypatch.setattr(admission, "queue_timeout", queue_timeout)
+    return set_limits
+
+
+def tokens(response):
+    lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    return "".join(line.get("token", "") for line in lines)
+
+
+def start_in_background(client, session_id, message="Long question"):
+    """Post a chat message in a thread and wait until its generation holds a slot"""
+    result = [None]
+    thread = threading.Thread(target=lambda: result.__setitem__(0, client.post(
+        "/chat/", json={"session_id": session_id, "message": message})))
+    thread.start()
+    while admission.in_flight == 0:
+        time.sleep(0.005)
+    return thread, result
+
+
+# Test the controller itself
+class TestAdmissionController:
+
+    # Test that requests under the limit are admitted at once and slots are counted
+    def test_admits_under_limit(self):
+        async def scenario():
+            controller = AdmissionController(max_in_flight=2, max_queue=1, queue_timeout=1)
+            first = await controller.acquire()
+            second = await controller.acquire()
+            assert controller.in_flight == 2
+            first.release()
+            first.release()
+            assert controller.in_flight == 1
+            second.release()
+            assert controller.in_flight == 0
+
+        asyncio.run(scenario())
+
+    # Test that waiters get freed slots in arrival order
+    def test_waiters_are_fifo(self):
+        async def scenario():
+            controller = AdmissionController(max_in_flight=1, max_queue=3, queue_timeout=2)
+            running = await controller.acquire()
+            order = []
+
+            async def wait(name):
+                ticket = await controller.acquire()
+                order.append(name)
+                ticket.release()
+
+            waiters = []
+            for name in ["a", "b", "c"]:
+                waiters.append(asyncio.create_task(wait(name)))
+                await asyncio.sleep(0.01)
+            assert controller.queued == 3
+            running.release()
+            await asyncio.gather(*waiters)
+
+            assert order == ["a", "b", "c"]
+            assert controller.in_flight == 0
+
+        asyncio.run(scenario())
+
+    # Test that a full queue is refused at once with 429
+    def test_full_queue_gets_429(self):
+        async def scenario():
+            controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=2)
+            await controller.acquire()
+            waiter = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.acquire()
+            assert rejected.value.status_code == 429
+            assert 1 <= rejected.value.retry_after <= 60
+            waiter.cancel()
+
+        asyncio.run(scenario())
+
+    # Test that waiting past the deadline gets 503 and leaves the queue
+    def test_timeout_gets_503(self):
+        async def scenario():
+            controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+            await controller.acquire()
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.acquire()
+            assert rejected.value.status_code == 503
+            assert controller.queued == 0
+
+        asyncio.run(scenario())
+
+    # Test that a stream dropped before it was read still gives its slot back
+    def test_unread_stream_releases_slot(self):
+        async def scenario():
+            controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+            stream = release_when_done(iter(["line\n"]), await controller.acquire())
+            assert controller.in_flight == 1
+            del stream
+            gc.collect()
+            assert controller.in_flight == 0
+
+            read = release_when_done(iter(["line\n"]), await controller.acquire())
+            assert list(read) == ["line\n"]
+            assert controller.in_flight == 0
+
+        asyncio.run(scenario())
+
+    # Test that the done callback runs once with the release, read or not
+    def test_on_done_runs_once(self):
+        async def scenario():
+            controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+            calls = []
+            stream = release_when_done(iter(["line\n"]), await controller.acquire(), lambda: calls.append("unread"))
+            del stream
+            gc.collect()
+
+            read = release_when_done(iter(["line\n"]), await controller.acquire(), lambda: calls.append("read"))
+            assert list(read) == ["line\n"]
+            del read
+            gc.collect()
+            assert calls == ["unread", "read"]
+            assert controller.in_flight == 0
+
+        asyncio.run(scenario())
+
+
+# Test the 429 / 503 responses of the chat endpoints
+class TestAdmissionEndpoints:
+
+    # Test that a request beyond the queue gets 429 with Retry-After while the admitted one completes
+    def test_chat_gets_429_when_queue_full(self, client, test_session_id, fake_openai, limits):
+        limits(max_in_flight=1, max_queue=0)
+        fake_openai.delay = 0.02
+        thread, first = start_in_background(client, test_session_id)
+
+        response = client.post("/chat/", json={"session_id": str(uuid.uuid4()), "message": "Hi"})
+        thread.join()
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.json()["error"] == "Server is busy, please try again shortly."
+        assert tokens(first[0]) == "Stub reply from the fake model"
+        assert admission.in_flight == 0
+
+    # Test that a request that waits too long for a slot gets 503
+    def test_retry_gets_503_after_queue_timeout(self, client, test_session_id, fake_openai, limits):
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Hello"})
+        limits(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+        fake_openai.delay = 0.05
+        thread, first = start_in_background(client, str(uuid.uuid4()))
+
+        response = client.post("/chat/retry/", json={"session_id": test_session_id, "message": ""})
+        thread.join()
+
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        assert admission.queued == 0
+
+    # Test that a queued request runs once the slot is free
+    def test_queued_request_completes(self, client, test_session_id, fake_openai, limits):
+        limits(max_in_flight=1, max_queue=1, queue_timeout=5)
+        fake_openai.delay = 0.01
+        thread, first = start_in_background(client, str(uuid.uuid4()))
+
+        response = client.post("/chat/", json={"session_id": test_session_id, "message": "Hi"})
+        thread.join()
+
+        assert response.status_code == 200
+        assert tokens(response) == tokens(first[0]) == "Stub reply from the fake model"
+
+    # Test that a refused WebSocket turn gets an error frame with retry_after
+    def test_socket_turn_refused(self, client, test_session_id, fake_openai, limits):
+        limits(max_in_flight=1, max_queue=0)
+        fake_openai.delay = 0.02
+        thread, first = start_in_background(client, str(uuid.uuid4()))
+
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "send", "message": "Hi", "turn": 1})
+            frame = socket.receive_json()
+        thread.join()
+
+        assert frame["turn"] == 1 and frame["done"] is True
+        assert frame["error"] == "Server is busy, please try again shortly."
+        assert frame["retry_after"] >= 1
@@ -0,0 +1,221 @@
+"""
+Test cases for pre-sampled alternate replies used by retry (alternates.py)
+"""
+
+import pytest
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, fake_openai
+from database import SessionLocal, ChatMessage
+from message_writer import message_writer
+from alternates import Presampler, presampler
+from admission import admission
+import metrics
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def words(*parts):
+    return lambda: iter([chunk(part) for part in parts])
+
+
+def count_tokens(text):
+    return len(text.split())
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def settled(sampler):
+    """No job running or waiting"""
+    wait_for(lambda: sampler._pending == 0)
+
+
+@pytest.fixture
+def alternates(monkeypatch, fake_openai):
+    """Turn the shared pre-sampler on (it is off by default); each model call gets the next reply"""
+    import api
+
+    replies = iter(["First reply", "Second reply", "Third reply", "Fourth reply", "Fifth reply"])
+
+    def create(**kwargs):
+        fake_openai.reply = next(replies)
+        return fake_openai.create(**kwargs)
+
+    monkeypatch.setattr(api.client.chat.completions, "create", create)
+    monkeypatch.setattr(presampler, "enabled", True)
+    presampler.clear()
+    yield presampler
+    settled(presampler)
+    presampler.clear()
+
+
+def tokens(response):
+    lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    return "".join(line.get("token", "") for line in lines)
+
+
+def stored_messages(session_id):
+    message_writer.flush()
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id).all()
+        return [(m.role, m.content) for m in rows]
+    finally:
+        db.close()
+
+
+# Test the pre-sampler itself
+class TestPresampler:
+
+    # Test that a stored alternate is returned once, for the same context only
+    def test_take_matches_context(self):
+        sampler = Presampler(enabled=True, tokens_per_hour=10000)
+        assert sampler.schedule("s", "key", 10, "Hello", words("Hi", " there"), count_tokens)
+        settled(sampler)
+
+        assert sampler.take("s", "other") is None
+        assert sampler.take("s", "key") is None  # The mismatched lookup used it up
+        sampler.schedule("s", "key", 10, "Hello", words("Hi", " there"), count_tokens)
+        settled(sampler)
+        assert sampler.take("s", "key") == ["Hi", " there"]
+        assert sampler.take("s", "key") is None
+
+    # Test that an alternate expires after the TTL
+    def test_ttl(self, monkeypatch):
+        import alternates as module
+        sampler = Presampler(enabled=True, tokens_per_hour=10000, ttl_seconds=60)
+        sampler.schedule("s", "key", 10, "Hello", words("Hi"), count_tokens)
+        settled(sampler)
+
+        later = time.time() + 61
+        monkeypatch.setattr(module.time, "time", lambda: later)
+        assert sampler.take("s", "key") is None
+
+    # Test that an alternate identical to the reply, or empty, is not kept
+    def test_useless_alternates_are_dropped(self):
+        sampler = Presampler(enabled=True, tokens_per_hour=10000)
+        sampler.schedule("same", "key", 10, "Hello there", words("Hello", " there"), count_tokens)
+        sampler.schedule("blank", "key", 10, "Hello", words(" "), count_tokens)
+        settled(sampler)
+
+        assert sampler.stored == 0
+
+    # Test that discarding cancels a running job and closes its stream
+    def test_discard_cancels_running_job(self):
+        release = threading.Event()
+        closed = threading.Event()
+
+        def slow():
+            try:
+                yield chunk("Partial")
+                release.wait(5)
+                yield chunk(" reply")
+            finally:
+                closed.set()
+
+        sampler = Presampler(enabled=True, tokens_per_hour=10000)
+        sampler.schedule("s", "key", 10, "Hello", slow, count_tokens)
+        time.sleep(0.05)
+        sampler.discard("s")
+        release.set()
+        settled(sampler)
+
+        assert closed.is_set()
+        assert sampler.take("s", "key") is None
+
+    # Test that jobs stop once the hourly token budget is spent, and are charged what they used
+    def test_token_budget(self):
+        metrics.reset()
+        sampler = Presampler(enabled=True, tokens_per_hour=100)
+
+        # Charged 40 + 10 up front, settled at 40 + 2
+        assert sampler.schedule("a", "key", 40, " ".join(["word"] * 10), words("Hi", " there"), count_tokens)
+        settled(sampler)
+        assert sampler.schedule("b", "key", 40, "Hello", words("Hi", " there"), count_tokens)
+        settled(sampler)
+        assert not sampler.schedule("c", "key", 40, "Hello", words("Hi", " there"), count_tokens)
+
+        counters = metrics.snapshot()["counters"]
+        assert counters["presample.skipped_budget"] == 1
+        assert counters["presample.tokens"] == 84
+
+    # Test that nothing is pre-sampled while the server is busy or for long contexts
+    def test_skipped_when_busy_or_long(self, monkeypatch):
+        sampler = Presampler(enabled=True, tokens_per_hour=10000, max_prompt_tokens=100)
+        assert not sampler.schedule("s", "key", 101, "Hello", words("Hi"), count_tokens)
+
+        monkeypatch.setattr(admission, "max_in_flight", 4)
+        monkeypatch.setattr(admission, "in_flight", 3)
+        assert not sampler.schedule("s", "key", 10, "Hello", words("Hi"), count_tokens)
+        monkeypatch.setattr(admission, "in_flight", 2)
+        assert sampler.schedule("s", "key", 10, "Hello", words("Hi"), count_tokens)
+        settled(sampler)
+
+    # Test that it does nothing unless enabled
+    def test_disabled(self):
+        assert not Presampler(enabled=False).schedule("s", "key", 10, "Hello", words("Hi"), count_tokens)
+
+
+# Test instant retries through the chat endpoints
+class TestAlternateRetries:
+
+    # Test that a retry streams the pre-sampled alternate without calling the model
+    def test_retry_uses_alternate(self, client, fake_openai, alternates):
+        session_id = str(uuid.uuid4())
+        first = client.post("/chat/", json={"session_id": session_id, "message": "hi"})
+        wait_for(lambda: alternates.stored == 1)
+        assert len(fake_openai.calls) == 2
+
+        retried = client.post("/chat/retry/", json={"session_id": session_id, "message": ""})
+
+        assert tokens(first) == "First reply"
+        assert tokens(retried) == "Second reply"
+        assert stored_messages(session_id) == [("user", "hi"), ("assistant", "Second reply")]
+        # The only new call is the next alternate, made after the retry finished
+        settled(alternates)
+        assert len(fake_openai.calls) == 3
+
+    # Test that a new message drops the alternate for the previous context
+    def test_new_message_discards_alternate(self, client, fake_openai, alternates):
+        session_id = str(uuid.uuid4())
+        client.post("/chat/", json={"session_id": session_id, "message": "hi"})
+        wait_for(lambda: alternates.stored == 1)
+
+        alternates.enabled = False  # No alternate for the new message
+        client.post("/chat/", json={"session_id": session_id, "message": "and another thing"})
+
+        assert alternates.stored == 0
+
+    # Test that a retry with no alternate calls the model as before
+    def test_retry_without_alternate(self, client, fake_openai, alternates):
+        session_id = str(uuid.uuid4())
+        alternates.enabled = False
+        client.post("/chat/", json={"session_id": session_id, "message": "hi"})
+        alternates.enabled = True
+
+        retried = client.post("/chat/retry/", json={"session_id": session_id, "message": ""})
+
+        assert tokens(retried) == "Second reply"
+        wait_for(lambda: alternates.stored == 1)
+        assert len(fake_openai.calls) == 3
@@ -0,0 +1,112 @@
+"""
+Test cases for the ffmpeg normalization stage of POST /speech-to-text/
+"""
+
+import pytest
+import io
+import math
+import shutil
+import struct
+import sys
+import os
+import wave
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, fake_whisper
+import audio_preprocess
+import metrics
+
+# Stand-in for ffmpeg: keeps every 4th byte of stdin, or fails when asked to
+FAKE_FFMPEG = """#!{python}
+import sys
+data = sys.stdin.buffer.read()
+if {fail!r}:
+    sys.stderr.write("Invalid data found when processing input")
+    sys.exit(1)
+sys.stdout.buffer.write(data[::4])
+"""
+
+
+def write_fake_ffmpeg(tmp_path, fail=False):
+    path = tmp_path / "ffmpeg"
+    path.write_text(FAKE_FFMPEG.format(python=sys.executable, fail=fail))
+    path.chmod(0o755)
+    return str(path)
+
+
+def stereo_wav(seconds=3, rate=48000):
+    """A 48 kHz stereo WAV: one second of silence, then a 440 Hz tone"""
+    frames = bytearray()
+    for i in range(seconds * rate):
+        sample = 0 if i < rate else int(12000 * math.sin(2 * math.pi * 440 * i / rate))
+        frames += struct.pack("<hh", sample, sample)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def upload(client, data):
+    return client.post("/speech-to-text/", files={"audio": ("recording.webm", io.BytesIO(data), "audio/webm")})
+
+
+# Test the audio normalization stage
+class TestAudioNormalization:
+
+    # Test that normalized audio (not the raw upload) is sent to Whisper, with size metrics
+    def test_normalized_audio_is_transcribed(self, client, fake_whisper, monkeypatch, tmp_path):
+        monkeypatch.setattr(audio_preprocess, "AUDIO_NORMALIZE", "true")
+        monkeypatch.setattr(audio_preprocess, "FFMPEG_BINARY", write_fake_ffmpeg(tmp_path))
+        metrics.reset()
+
+        response = upload(client, b"0123456789abcdef")
+
+        assert response.json() == {"text": "hello world", "status": "success"}
+        assert fake_whisper == [(".ogg", b"048c")]
+        timings = metrics.snapshot()["timings"]
+        assert timings["speech.normalize.input_bytes"]["sum"] == 16
+        assert timings["speech.normalize.output_bytes"]["sum"] == 4
+        assert timings["speech.normalize.seconds"]["count"] == 1
+
+    # Test that a failed transcode falls back to the original upload
+    def test_failed_normalization_sends_original(self, client, fake_whisper, monkeypatch, tmp_path):
+        monkeypatch.setattr(audio_preprocess, "AUDIO_NORMALIZE", "true")
+        monkeypatch.setattr(audio_preprocess, "FFMPEG_BINARY", write_fake_ffmpeg(tmp_path, fail=True))
+        metrics.reset()
+
+        response = upload(client, b"raw upload")
+
+        assert response.json()["status"] == "success"
+        assert fake_whisper == [(".webm", b"raw upload")]
+        assert metrics.snapshot()["counters"]["speech.normalize.failures"] == 1
+
+    # Test that "auto" leaves uploads unchanged when ffmpeg is not installed
+    def test_auto_without_ffmpeg_is_disabled(self, client, fake_whisper, monkeypatch, tmp_path):
+        monkeypatch.setattr(audio_preprocess, "AUDIO_NORMALIZE", "auto")
+        monkeypatch.setattr(audio_preprocess, "FFMPEG_BINARY", str(tmp_path / "missing-ffmpeg"))
+
+        upload(client, b"raw upload")
+
+        assert fake_whisper == [(".webm", b"raw upload")]
+
+    # Test that real ffmpeg turns a stereo 48 kHz recording into much smaller mono Opus
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+    def test_real_ffmpeg_shrinks_stereo_recording(self, monkeypatch):
+        monkeypatch.setattr(audio_preprocess, "FFMPEG_BINARY", "ffmpeg")
+        original = stereo_wav()
+
+        normalized = audio_preprocess.transcode(original)
+
+        print(f"🎧 {len(original)} -> {len(normalized)} bytes")
+        assert normalized.startswith(b"OggS")
+        assert len(normalized) < len(original) / 10
@@ -0,0 +1,68 @@
+"""
+Test cases for the paged history endpoint used by the virtualized chat view
+"""
+
+import pytest
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from datetime import timedelta
+from conftest import client, test_session_id
+from database import SessionLocal, ChatMessage, malaysia_now
+
+
+def seed_messages(session_id, count):
+    """Store `count` alternating user/assistant messages with increasing timestamps"""
+    db = SessionLocal()
+    try:
+        start = malaysia_now()
+        for i in range(count):
+            db.add(ChatMessage(session_id=session_id, role="user" if i % 2 == 0 else "assistant",
+                               content=f"message {i}", created_at=start + timedelta(seconds=i)))
+        db.commit()
+    finally:
+        db.close()
+
+
+# Test GET /chat/history/{session_id}
+class TestChatHistoryPage:
+
+    # Test that the latest page is returned oldest first and reports older messages
+    def test_latest_page(self, client, test_session_id):
+        seed_messages(test_session_id, 10)
+
+        data = client.get(f"/chat/history/{test_session_id}", params={"limit": 4}).json()
+
+        assert [m["content"] for m in data["messages"]] == ["message 6", "message 7", "message 8", "message 9"]
+        assert data["has_more"] is True
+
+    # Test that pages before a cursor walk back to the start of the conversation
+    def test_pages_before_cursor(self, client, test_session_id):
+        seed_messages(test_session_id, 10)
+
+        contents = []
+        before_id = None
+        while True:
+            params = {"limit": 4}
+            if before_id is not None:
+                params["before_id"] = before_id
+            data = client.get(f"/chat/history/{test_session_id}", params=params).json()
+            contents = [m["content"] for m in data["messages"]] + contents
+            if not data["has_more"]:
+                break
+            before_id = data["messages"][0]["id"]
+
+        assert contents == [f"message {i}" for i in range(10)]
+
+    # Test that an unknown session returns an empty page
+    def test_empty_session(self, client, test_session_id):
+        data = client.get(f"/chat/history/{test_session_id}").json()
+        assert data == {"session_id": test_session_id, "messages": [], "has_more": False}
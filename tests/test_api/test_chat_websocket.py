@@ -0,0 +1,126 @@
+"""
+Test cases for the WebSocket chat channel (/ws/chat/{session_id})
+"""
+
+import pytest
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, test_session_id, fake_openai
+from database import SessionLocal, ChatMessage
+from message_writer import message_writer
+
+
+def read_turn(socket, turn):
+    """Collect the frames of one turn up to its done frame"""
+    frames = []
+    while True:
+        frame = socket.receive_json()
+        assert frame.get("turn") == turn
+        frames.append(frame)
+        if frame.get("done"):
+            return frames
+
+
+def tokens(frames):
+    return "".join(frame.get("token", "") for frame in frames)
+
+
+def stored_messages(session_id):
+    message_writer.flush()
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id).all()
+        return [(m.role, m.content) for m in rows]
+    finally:
+        db.close()
+
+
+# Test the WebSocket chat channel
+class TestChatWebSocket:
+
+    # Test that send, edit and retry stream their tokens over one connection
+    def test_send_edit_retry_on_one_connection(self, client, test_session_id, fake_openai):
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "send", "message": "First question", "turn": 1})
+            assert tokens(read_turn(socket, 1)) == "Stub reply from the fake model"
+
+            fake_openai.reply = "Edited reply"
+            socket.send_json({"type": "edit", "message": "Edited question", "turn": 2})
+            assert tokens(read_turn(socket, 2)) == "Edited reply"
+
+            fake_openai.reply = "Retried reply"
+            socket.send_json({"type": "retry", "turn": 3})
+            assert tokens(read_turn(socket, 3)) == "Retried reply"
+
+        assert stored_messages(test_session_id) == [("user", "Edited question"), ("assistant", "Retried reply")]
+
+    # Test that a stop message ends the streaming turn with a stopped frame
+    def test_stop_over_socket(self, client, test_session_id, fake_openai):
+        fake_openai.reply = " ".join(["word"] * 200)
+        fake_openai.delay = 0.01
+
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "send", "message": "Tell me a long story", "turn": "a"})
+            assert "token" in socket.receive_json()
+            socket.send_json({"type": "stop"})
+            frames = read_turn(socket, "a")
+
+        assert any(frame.get("stopped") for frame in frames)
+        assert len(tokens(frames).split()) < 200
+
+    # Test that a second turn is rejected while one is streaming
+    def test_one_turn_at_a_time(self, client, test_session_id, fake_openai):
+        fake_openai.delay = 0.05
+
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "send", "message": "First", "turn": 1})
+            socket.send_json({"type": "send", "message": "Second", "turn": 2})
+
+            rejected = None
+            first = []
+            while not (first and first[-1].get("done")):
+                frame = socket.receive_json()
+                if frame["turn"] == 2:
+                    rejected = frame
+                else:
+                    first.append(frame)
+
+        assert rejected == {"turn": 2, "error": "A response is already streaming", "done": True}
+        assert tokens(first) == "Stub reply from the fake model"
+
+    # Test that invalid requests get an error frame and keep the connection open
+    def test_invalid_requests(self, client, test_session_id, fake_openai):
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "send", "message": "  ", "turn": 1})
+            assert socket.receive_json() == {"turn": 1, "error": "Message cannot be empty.", "done": True}
+
+            socket.send_json({"type": "dance", "turn": 2})
+            assert socket.receive_json()["error"] == "Unknown request type: dance"
+
+            socket.send_text("not json")
+            assert socket.receive_json() == {"error": "Messages must be JSON objects"}
+
+            socket.send_json({"type": "ping"})
+            assert socket.receive_json() == {"type": "pong"}
+
+    # Test that the stop endpoint also stops a turn streamed over the socket
+    def test_http_stop_stops_socket_turn(self, client, test_session_id, fake_openai):
+        fake_openai.reply = " ".join(["word"] * 200)
+        fake_openai.delay = 0.01
+
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "send", "message": "Tell me a long story", "turn": 1})
+            assert "token" in socket.receive_json()
+            assert client.post(f"/chat/stop/{test_session_id}").json()["success"] is True
+            frames = read_turn(socket, 1)
+
+        assert any(frame.get("stopped") for frame in frames)
@@ -0,0 +1,171 @@
+"""
+Test cases for splitting long recordings at pauses and transcribing the pieces in parallel
+"""
+
+import pytest
+import io
+import json
+import math
+import shutil
+import struct
+import threading
+import time
+import sys
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client
+from transcription_cache import transcription_cache
+import audio_preprocess
+
+# Segment bytes -> (seconds the fake Whisper takes, transcript); the first piece is the slowest
+SEGMENTS = {
+    b"segment 0": (0.3, "The first part."),
+    b"segment 1": (0.1, "The second part."),
+    b"segment 2": (0.0, "The third part."),
+}
+
+
+@pytest.fixture
+def segmented_whisper(monkeypatch):
+    """Split every upload into SEGMENTS and transcribe them with a slow fake Whisper on 2 workers"""
+    import api
+
+    async def split_on_silence(data, suffix):
+        return [(segment, ".ogg") for segment in SEGMENTS]
+
+    state = {"running": 0, "max_running": 0, "calls": 0}
+    lock = threading.Lock()
+
+    def create(model, file):
+        delay, text = SEGMENTS[file.read()]
+        with lock:
+            state["calls"] += 1
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+        time.sleep(delay)
+        with lock:
+            state["running"] -= 1
+        return SimpleNamespace(text=text)
+
+    pool = ThreadPoolExecutor(max_workers=2)
+    transcription_cache.clear()
+    monkeypatch.setattr(audio_preprocess, "AUDIO_NORMALIZE", "false")
+    monkeypatch.setattr(audio_preprocess, "split_on_silence", split_on_silence)
+    monkeypatch.setattr(api, "get_transcribe_pool", lambda: pool)
+    monkeypatch.setattr(api.client.audio.transcriptions, "create", create)
+    yield state
+    pool.shutdown()
+
+
+def stream_lines(response):
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+def upload(client, path, data=b"long recording"):
+    return client.post(path, files={"audio": ("recording.webm", io.BytesIO(data), "audio/webm")})
+
+
+def tone_and_pauses(pattern, rate=16000):
+    """Mono WAV of ("tone" | "silence", seconds) pieces"""
+    frames = bytearray()
+    for kind, seconds in pattern:
+        for i in range(int(seconds * rate)):
+            sample = 0 if kind == "silence" else int(12000 * math.sin(2 * math.pi * 440 * i / rate))
+            frames += struct.pack("<h", sample)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+# Test how recordings are cut into segments
+class TestPlanSegments:
+
+    # Test that a recording shorter than 1.5 chunks stays whole
+    def test_short_recording_is_not_split(self):
+        assert audio_preprocess.plan_segments(40, [(10, 11), (25, 26)], chunk_seconds=30) == [(0.0, 40)]
+
+    # Test that cuts fall in the middle of the first pause after each chunk length
+    def test_cuts_at_pauses(self):
+        silences = [(10, 11), (31, 32), (45, 46), (63, 64)]
+        segments = audio_preprocess.plan_segments(100, silences, chunk_seconds=30)
+        assert segments == [(0.0, 31.5), (31.5, 63.5), (63.5, 100)]
+
+    # Test that no cut leaves a tail shorter than half a chunk
+    def test_no_short_tail(self):
+        assert audio_preprocess.plan_segments(70, [(60, 61)], chunk_seconds=30) == [(0.0, 70)]
+
+    # Test that a recording without pauses stays whole
+    def test_no_pauses(self):
+        assert audio_preprocess.plan_segments(120, [], chunk_seconds=30) == [(0.0, 120)]
+
+    # Test that real ffmpeg cuts a long recording at its pauses
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+    def test_real_ffmpeg_split(self, monkeypatch):
+        monkeypatch.setattr(audio_preprocess, "FFMPEG_BINARY", "ffmpeg")
+        recording = tone_and_pauses([("tone", 4), ("silence", 1), ("tone", 4), ("silence", 1), ("tone", 4)])
+
+        segments = audio_preprocess.split(recording, ".wav", chunk_seconds=4)
+
+        assert len(segments) == 3
+        assert all(segment.startswith(b"OggS") for segment in segments)
+
+
+# Test parallel transcription of segments
+class TestChunkedTranscription:
+
+    # Test that segments are transcribed concurrently, bounded by the pool, and stitched in order
+    def test_segments_transcribed_in_parallel(self, client, segmented_whisper):
+        start = time.perf_counter()
+        response = upload(client, "/speech-to-text/")
+        elapsed = time.perf_counter() - start
+
+        assert response.json() == {
+            "text": "The first part. The second part. The third part.",
+            "status": "success",
+        }
+        assert segmented_whisper["calls"] == 3
+        assert segmented_whisper["max_running"] == 2
+        # Sequential calls would take 0.4 s
+        assert elapsed < 0.4
+
+    # Test that partial results stream as each segment completes, then the full transcript
+    def test_stream_partial_results(self, client, segmented_whisper):
+        lines = stream_lines(upload(client, "/speech-to-text/stream"))
+
+        partial = lines[:-1]
+        assert [line["segment"] for line in partial] == [1, 2, 0]
+        assert all(line["segments"] == 3 for line in partial)
+        assert lines[-1] == {"text": "The first part. The second part. The third part.", "status": "success"}
+
+    # Test that a cached transcript is streamed as a single final line
+    def test_stream_cache_hit(self, client, segmented_whisper):
+        upload(client, "/speech-to-text/stream")
+        response = upload(client, "/speech-to-text/stream")
+
+        assert response.headers["X-Transcription-Cache"] == "hit"
+        assert stream_lines(response) == [
+            {"text": "The first part. The second part. The third part.", "status": "success"}
+        ]
+        assert segmented_whisper["calls"] == 3
+
+    # Test that a rejected upload streams one error line
+    def test_stream_rejected_upload(self, client, segmented_whisper):
+        lines = stream_lines(upload(client, "/speech-to-text/stream", data=b""))
+
+        assert lines == [{"text": "", "status": "error", "error": "Empty audio upload"}]
+        assert segmented_whisper["calls"] == 0
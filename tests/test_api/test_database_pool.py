@@ -0,0 +1,92 @@
+"""
+Test cases for connection pool configuration, pool metrics and the async engine option
+"""
+
+import pytest
+import os
+import sys
+import tempfile
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+import metrics
+import database
+from database import (
+    Base, ChatMessage, engine_options, instrument_pool,
+    async_database_url, create_async_session_factory, get_async_db,
+)
+
+
+# Test pool settings and the metrics exported for them
+class TestConnectionPool:
+
+    # Test that the async URL mapping picks asyncpg for Postgres and aiosqlite for SQLite
+    def test_async_database_url_maps_drivers(self):
+        assert async_database_url("postgresql://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+        assert async_database_url("postgres://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+        assert async_database_url("sqlite:///chat.db") == "sqlite+aiosqlite:///chat.db"
+
+    # Test that checkouts, hold time and connection wait time are recorded by the instrumented pool
+    def test_pool_records_checkouts_and_wait_time(self):
+        db_fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(db_fd)
+        url = f"sqlite:///{db_path}"
+        engine = create_engine(url, **engine_options(url))
+        instrument_pool(engine, "test.pool")
+        try:
+            metrics.reset()
+            TestSessionLocal = sessionmaker(bind=engine)
+            for _ in range(3):
+                db = TestSessionLocal()
+                try:
+                    db.execute(text("SELECT 1"))
+                finally:
+                    db.close()
+
+            snapshot = metrics.snapshot()
+            assert snapshot["counters"]["test.pool.checkouts"] == 3
+            assert snapshot["timings"]["test.pool.held_seconds"]["count"] == 3
+            assert snapshot["timings"]["test.pool.wait_seconds"]["count"] == 3
+            assert "db.pool.wait_seconds" not in snapshot["timings"]
+            assert snapshot["gauges"]["test.pool.checked_out"] == 0
+        finally:
+            engine.dispose()
+            os.remove(db_path)
+
+    # Test that the async engine option works end to end with aiosqlite, through get_async_db
+    @pytest.mark.asyncio
+    async def test_async_engine_round_trip(self, monkeypatch):
+        pytest.importorskip("aiosqlite")
+        db_fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(db_fd)
+        async_engine, AsyncTestSessionLocal = create_async_session_factory(f"sqlite:///{db_path}", "test.async_pool")
+        monkeypatch.setattr(database, "AsyncSessionLocal", AsyncTestSessionLocal)
+        try:
+            metrics.reset()
+            async with async_engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+
+            async for db in get_async_db():
+                db.add(ChatMessage(session_id="async-session", role="user", content="hello"))
+                await db.commit()
+
+            async for db in get_async_db():
+                result = await db.execute(
+                    select(ChatMessage.content).where(ChatMessage.session_id == "async-session")
+                )
+                assert result.scalars().all() == ["hello"]
+
+            snapshot = metrics.snapshot()
+            assert snapshot["counters"]["test.async_pool.checkouts"] >= 2
+            assert snapshot["timings"]["test.async_pool.wait_seconds"]["count"] >= 2
+        finally:
+            await async_engine.dispose()
+            os.remove(db_path)
@@ -0,0 +1,182 @@
+"""
+Test cases for unchanged edits and replies kept for earlier wordings of an edited message
+"""
+
+import pytest
+import json
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from datetime import timedelta
+from conftest import client, test_session_id, fake_openai, temp_db
+from database import (
+    SessionLocal, ChatMessage, ReplyVariant, malaysia_now, edit_last_user_message, purge_reply_variants,
+)
+from message_writer import MessageWriter, message_writer
+
+
+def tokens(response):
+    lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    return "".join(line.get("token", "") for line in lines)
+
+
+def edit(client, session_id, message):
+    return client.post("/chat/edit/", json={"session_id": session_id, "message": message})
+
+
+def stored_messages(session_id):
+    message_writer.flush()
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id).all()
+        return [(m.id, m.role, m.content) for m in rows]
+    finally:
+        db.close()
+
+
+# Test the database helpers
+class TestReplyVariantStore:
+
+    # Test that a complete reply queued with a key is kept, for the message it answers, in the same batch
+    def test_writer_keeps_complete_replies(self, temp_db, test_session_id):
+        session_factory, _ = temp_db
+        writer = MessageWriter(session_factory, max_queue=100, batch_size=100, flush_interval=60)
+        writer.enqueue(test_session_id, "assistant", "Stopped halfway")
+        writer.enqueue(test_session_id, "assistant", "Joke reply", variant_key="joke", reply_to=7)
+        writer.close()
+
+        db = session_factory()
+        try:
+            assert db.query(ChatMessage).count() == 2
+            assert [(v.message_id, v.key, v.content) for v in db.query(ReplyVariant).all()] == [(7, "joke", "Joke reply")]
+        finally:
+            db.close()
+
+    # Test that the edit statement reads the newest kept reply for the message and key, ignoring expired ones
+    def test_edit_reads_kept_reply(self, temp_db, test_session_id):
+        session_factory, _ = temp_db
+        db = session_factory()
+        try:
+            start = malaysia_now()
+            message = ChatMessage(session_id=test_session_id, role="user", content="Tell me a story", created_at=start)
+            db.add(message)
+            db.flush()
+            db.add_all([
+                ReplyVariant(session_id=test_session_id, message_id=message.id, key="joke", content="Old joke",
+                             created_at=start - timedelta(days=2)),
+                ReplyVariant(session_id=test_session_id, message_id=message.id, key="joke", content="Joke reply",
+                             created_at=start),
+                ReplyVariant(session_id=test_session_id, message_id=message.id + 1, key="poem", content="Later poem",
+                             created_at=start),
+                ReplyVariant(session_id="other-session", message_id=message.id, key="poem", content="Poem reply",
+                             created_at=start),
+            ])
+            db.commit()
+
+            assert edit_last_user_message(db, test_session_id, "Tell me a joke", variant_key="joke")["variant"] == "Joke reply"
+            assert edit_last_user_message(db, test_session_id, "Tell me a poem", variant_key="poem")["variant"] is None
+
+            assert purge_reply_variants(db) == 1
+            assert db.query(ReplyVariant).count() == 3
+        finally:
+            db.close()
+
+    # Test that keeping the wording of a message whose reply is the kept one changes nothing, in the edit statement itself
+    def test_unchanged_edit_changes_nothing(self, temp_db, test_session_id):
+        session_factory, _ = temp_db
+        db = session_factory()
+        try:
+            start = malaysia_now()
+            message = ChatMessage(session_id=test_session_id, role="user", content="Tell me a joke", created_at=start)
+            db.add(message)
+            db.add(ChatMessage(session_id=test_session_id, role="assistant", content="Joke reply",
+                               created_at=start + timedelta(seconds=1)))
+            db.flush()
+            db.add(ReplyVariant(session_id=test_session_id, message_id=message.id, key="joke", content="Joke reply"))
+            db.commit()
+
+            unchanged = edit_last_user_message(db, test_session_id, "Tell me a joke", variant_key="joke")
+            assert unchanged["unchanged"] is True and unchanged["assistant_id"] is None
+            assert unchanged["variant"] == "Joke reply"
+            assert db.query(ChatMessage).filter(ChatMessage.session_id == test_session_id).count() == 2
+
+            # Without a kept reply (it was stopped or cut off) the same wording is regenerated
+            edited = edit_last_user_message(db, test_session_id, "Tell me a joke", variant_key="other")
+            assert edited["unchanged"] is False and edited["assistant_id"] is not None
+            assert edited["messages"] == [{"role": "user", "content": "Tell me a joke"}]
+        finally:
+            db.close()
+
+
+# Test edits through /chat/edit/
+class TestEditShortCircuits:
+
+    # Test that an edit that keeps the exact wording returns the reply without touching the database
+    def test_unchanged_edit(self, client, test_session_id, fake_openai):
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Tell me a joke"})
+        before = stored_messages(test_session_id)
+        fake_openai.reply = "Another reply"
+
+        unchanged = edit(client, test_session_id, "Tell me a joke")
+
+        assert tokens(unchanged) == "Stub reply from the fake model"
+        assert len(fake_openai.calls) == 1
+        assert stored_messages(test_session_id) == before
+
+    # Test that an edit changing only whitespace is a real edit
+    def test_whitespace_edit(self, client, test_session_id, fake_openai):
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Tell me a joke"})
+        fake_openai.reply = "Another reply"
+
+        assert tokens(edit(client, test_session_id, "Tell me a joke ")) == "Another reply"
+        assert [(role, content) for _, role, content in stored_messages(test_session_id)] == [
+            ("user", "Tell me a joke "), ("assistant", "Another reply"),
+        ]
+
+    # Test that a cut-off reply is neither kept as unchanged nor reused later
+    def test_cut_off_reply_is_not_reused(self, client, test_session_id, fake_openai, monkeypatch):
+        import api
+        limit = api.MAX_MODEL_RESPONSE_TOKENS
+        monkeypatch.setattr(api, "MAX_MODEL_RESPONSE_TOKENS", 2)
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Tell me a joke"})
+        monkeypatch.setattr(api, "MAX_MODEL_RESPONSE_TOKENS", limit)
+        fake_openai.reply = "Full reply"
+
+        assert tokens(edit(client, test_session_id, "Tell me a joke")) == "Full reply"
+        edit(client, test_session_id, "Tell me a story")
+        assert tokens(edit(client, test_session_id, "Tell me a joke")) == "Full reply"
+        assert len(fake_openai.calls) == 3
+
+    # Test that an edit back to an earlier wording reuses its reply
+    def test_flip_back_reuses_reply(self, client, test_session_id, fake_openai):
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Tell me a joke"})
+        fake_openai.reply = "Once upon a time"
+        assert tokens(edit(client, test_session_id, "Tell me a story")) == "Once upon a time"
+        fake_openai.reply = "Not used"
+
+        assert tokens(edit(client, test_session_id, "Tell me a joke")) == "Stub reply from the fake model"
+        assert tokens(edit(client, test_session_id, "Tell me a story")) == "Once upon a time"
+        assert len(fake_openai.calls) == 2
+        assert [(role, content) for _, role, content in stored_messages(test_session_id)] == [
+            ("user", "Tell me a story"), ("assistant", "Once upon a time"),
+        ]
+
+    # Test that the same wording after a different history is answered afresh
+    def test_reuse_needs_same_history(self, client, test_session_id, fake_openai):
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Tell me a joke"})
+        edit(client, test_session_id, "Thanks")
+        fake_openai.reply = "Once upon a time"
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Tell me a story"})
+        fake_openai.reply = "Fresh joke"
+
+        # "Tell me a joke" was answered as the first message, not after the story
+        assert tokens(edit(client, test_session_id, "Tell me a joke")) == "Fresh joke"
+        assert len(fake_openai.calls) == 4
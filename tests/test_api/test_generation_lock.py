@@ -0,0 +1,271 @@
+"""
+Test cases for per-session serialization of generations (generations.py)
+"""
+
+import pytest
+import json
+import threading
+import time
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, test_session_id, fake_openai
+from database import SessionLocal, ChatMessage
+from message_writer import message_writer
+from generations import GenerationRegistry, Generation, GenerationBusy, generations
+
+
+@pytest.fixture
+def tracked_openai(fake_openai, monkeypatch):
+    """fake_openai that records the most completions streaming at once"""
+    import api
+    state = {"streaming": 0, "max_streaming": 0}
+    lock = threading.Lock()
+    create = fake_openai.create
+
+    def tracked(**kwargs):
+        chunks = create(**kwargs)
+
+        def stream():
+            with lock:
+                state["streaming"] += 1
+                state["max_streaming"] = max(state["max_streaming"], state["streaming"])
+            try:
+                yield from chunks
+            finally:
+                with lock:
+                    state["streaming"] -= 1
+
+        return stream()
+
+    monkeypatch.setattr(api.client.chat.completions, "create", tracked)
+    fake_openai.state = state
+    return fake_openai
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    def set_policy(name, timeout=10):
+        monkeypatch.setattr(generations, "policy", name)
+        monkeypatch.setattr(generations, "timeout", timeout)
+    return set_policy
+
+
+def frames(response):
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+def tokens(response):
+    return "".join(frame.get("token", "") for frame in frames(response))
+
+
+def stored_roles(session_id):
+    message_writer.flush()
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id).all()
+        return [m.role for m in rows]
+    finally:
+        db.close()
+
+
+def run_concurrently(requests):
+    """Run the callables at the same time and return their results in order"""
+    results = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def run(i):
+        barrier.wait()
+        results[i] = requests[i]()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# Stress tests with concurrent requests on one session
+class TestConcurrentGenerations:
+
+    # Test that queued sends on one session run one at a time and all complete
+    def test_queue_policy_serializes_sends(self, client, test_session_id, tracked_openai, policy):
+        policy("queue")
+        tracked_openai.delay = 0.005
+
+        responses = run_concurrently([
+            lambda i=i: client.post("/chat/", json={"session_id": test_session_id, "message": f"Message {i}"})
+            for i in range(8)
+        ])
+
+        assert all(tokens(r) == "Stub reply from the fake model" for r in responses)
+        assert len({r.headers["X-Generation-Id"] for r in responses}) == 8
+        assert tracked_openai.state["max_streaming"] == 1
+        assert stored_roles(test_session_id) == ["user", "assistant"] * 8
+
+    # Test that mixed send / edit / retry requests never overlap and leave consistent history
+    def test_mixed_requests_leave_consistent_history(self, client, test_session_id, tracked_openai, policy):
+        policy("queue")
+        tracked_openai.delay = 0.002
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Start"})
+
+        def send(i):
+            return lambda: client.post("/chat/", json={"session_id": test_session_id, "message": f"Send {i}"})
+
+        def edit(i):
+            return lambda: client.post("/chat/edit/", json={"session_id": test_session_id, "message": f"Edit {i}"})
+
+        def retry():
+            return lambda: client.post("/chat/retry/", json={"session_id": test_session_id, "message": ""})
+
+        responses = run_concurrently([send(0), edit(1), retry(), send(2), edit(3), retry(), send(4), retry()])
+
+        assert not [f for r in responses for f in frames(r) if "error" in f]
+        assert tracked_openai.state["max_streaming"] == 1
+        # Edits and retries replace the last turn; each send adds one
+        assert stored_roles(test_session_id) == ["user", "assistant"] * 4
+
+    # Test that the reject policy fails the second request and leaves the first intact
+    def test_reject_policy(self, client, test_session_id, tracked_openai, policy):
+        policy("reject")
+        tracked_openai.delay = 0.02
+
+        first = [None]
+        thread = threading.Thread(target=lambda: first.__setitem__(0, client.post(
+            "/chat/", json={"session_id": test_session_id, "message": "First"})))
+        thread.start()
+        while generations.active(test_session_id) is None:
+            time.sleep(0.005)
+        second = client.post("/chat/", json={"session_id": test_session_id, "message": "Second"})
+        thread.join()
+
+        assert frames(second) == [{"error": "A response is already being generated for this session"}]
+        assert tokens(first[0]) == "Stub reply from the fake model"
+        assert stored_roles(test_session_id) == ["user", "assistant"]
+
+    # Test that an edit under the preempt policy stops the streaming reply and replaces it
+    def test_preempt_policy_edit_while_streaming(self, client, test_session_id, tracked_openai, policy):
+        policy("preempt")
+        tracked_openai.reply = " ".join(["word"] * 200)
+        tracked_openai.delay = 0.01
+
+        first = [None]
+        thread = threading.Thread(target=lambda: first.__setitem__(0, client.post(
+            "/chat/", json={"session_id": test_session_id, "message": "Long story please"})))
+        thread.start()
+        while generations.active(test_session_id) is None:
+            time.sleep(0.005)
+        time.sleep(0.05)
+
+        tracked_openai.reply = "Short answer"
+        tracked_openai.delay = 0.0
+        edit = client.post("/chat/edit/", json={"session_id": test_session_id, "message": "Short story please"})
+        thread.join()
+
+        assert any(f.get("stopped") for f in frames(first[0]))
+        assert tokens(edit) == "Short answer"
+        assert tracked_openai.state["max_streaming"] == 1
+        assert stored_roles(test_session_id) == ["user", "assistant"]
+
+    # Test that a stop naming a generation leaves the session's other generation running
+    def test_stop_by_generation_id(self, client, test_session_id, tracked_openai, policy):
+        policy("queue")
+        tracked_openai.delay = 0.02
+
+        first = [None]
+        thread = threading.Thread(target=lambda: first.__setitem__(0, client.post(
+            "/chat/", json={"session_id": test_session_id, "message": "First"})))
+        thread.start()
+        while generations.active(test_session_id) is None:
+            time.sleep(0.005)
+
+        stop = client.post(f"/chat/stop/{test_session_id}", params={"generation_id": "not-this-one"})
+        thread.join()
+
+        assert stop.json()["success"] is False
+        assert tokens(first[0]) == "Stub reply from the fake model"
+
+
+# Test the registry itself
+class TestGenerationRegistry:
+
+    # Test that a finishing generation cannot clear the one that replaced it
+    def test_release_only_clears_own_generation(self):
+        registry = GenerationRegistry(policy="preempt", timeout=1)
+        first = Generation("s")
+        registry.acquire(first)
+
+        second = Generation("s")
+        acquired = threading.Thread(target=registry.acquire, args=(second,))
+        acquired.start()
+        while not first.stop_event.is_set():
+            time.sleep(0.001)
+        registry.release(first)
+        acquired.join()
+
+        registry.release(first)
+        assert registry.active("s") is second
+        assert registry.stop("s") is True
+        assert second.stop_event.is_set()
+
+    # Test that a queued generation can be stopped by id before it starts
+    def test_stop_waiting_generation(self):
+        registry = GenerationRegistry(policy="queue", timeout=1)
+        running = Generation("s")
+        registry.acquire(running)
+
+        waiting = Generation("s")
+        thread = threading.Thread(target=registry.acquire, args=(waiting,))
+        thread.start()
+        time.sleep(0.05)
+        assert registry.stop("s", waiting.id) is True
+        thread.join()
+
+        assert waiting.started is False
+        assert registry.active("s") is running
+        assert not running.stop_event.is_set()
+
+    # Test that queued generations start in arrival order
+    def test_queue_is_fifo(self):
+        registry = GenerationRegistry(policy="queue", timeout=2)
+        running = Generation("s")
+        registry.acquire(running)
+        order = []
+
+        def worker(generation):
+            registry.acquire(generation)
+            order.append(generation)
+            registry.release(generation)
+
+        waiting = [Generation("s") for _ in range(4)]
+        threads = []
+        for generation in waiting:
+            threads.append(threading.Thread(target=worker, args=(generation,)))
+            threads[-1].start()
+            time.sleep(0.02)
+        registry.release(running)
+        for thread in threads:
+            thread.join()
+
+        assert order == waiting
+
+    # Test that waiting too long raises
+    def test_queue_timeout(self):
+        registry = GenerationRegistry(policy="queue", timeout=0.05)
+        registry.acquire(Generation("s"))
+        with pytest.raises(GenerationBusy):
+            registry.acquire(Generation("s"))
+
+    # Test that an unknown policy is refused
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            GenerationRegistry(policy="sometimes")
@@ -0,0 +1,263 @@
+"""
+Test cases for Idempotency-Key handling on /chat/, /chat/edit/ and /chat/retry/
+"""
+
+import pytest
+import json
+import threading
+from types import SimpleNamespace
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, test_session_id, fake_openai
+from database import SessionLocal, ChatMessage
+from message_writer import message_writer
+from idempotency import IdempotencyStore, IdempotencyConflict, Flight, request_fingerprint
+
+
+def post(client, path, session_id, message="Hello there", key="key-1"):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(path, json={"session_id": session_id, "message": message}, headers=headers)
+
+
+def tokens(response):
+    lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    return "".join(line.get("token", "") for line in lines)
+
+
+def stored_messages(session_id):
+    message_writer.flush()
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id).all()
+        return [(m.role, m.content) for m in rows]
+    finally:
+        db.close()
+
+
+# Test duplicate chat submissions
+class TestIdempotentChat:
+
+    # Test that concurrent duplicates share one completion and one pair of rows
+    def test_concurrent_duplicates_share_one_stream(self, client, test_session_id, fake_openai):
+        fake_openai.delay = 0.02
+        responses = [None, None]
+
+        def submit(i):
+            responses[i] = post(client, "/chat/", test_session_id)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert tokens(responses[0]) == tokens(responses[1]) == "Stub reply from the fake model"
+        assert len(fake_openai.calls) == 1
+        assert stored_messages(test_session_id) == [
+            ("user", "Hello there"), ("assistant", "Stub reply from the fake model"),
+        ]
+
+    # Test that a repeat of a finished turn replays its result without a new completion
+    def test_completed_key_replays_result(self, client, test_session_id, fake_openai):
+        first = post(client, "/chat/", test_session_id)
+        fake_openai.reply = "A different reply"
+        second = post(client, "/chat/", test_session_id)
+
+        assert second.text == first.text
+        assert len(fake_openai.calls) == 1
+        assert len(stored_messages(test_session_id)) == 2
+
+    # Test that a new key starts a new turn, as does a request without a key
+    def test_new_key_is_a_new_turn(self, client, test_session_id, fake_openai):
+        post(client, "/chat/", test_session_id, key="key-1")
+        post(client, "/chat/", test_session_id, key="key-2")
+        post(client, "/chat/", test_session_id, key=None)
+
+        assert len(fake_openai.calls) == 3
+        assert len(stored_messages(test_session_id)) == 6
+
+    # Test that reusing a key for a different message is rejected
+    def test_key_reused_for_different_message(self, client, test_session_id, fake_openai):
+        post(client, "/chat/", test_session_id, message="First")
+        response = post(client, "/chat/", test_session_id, message="Second")
+
+        assert response.status_code == 422
+        assert response.json() == {"error": "Idempotency-Key was already used for a different request"}
+        assert len(fake_openai.calls) == 1
+
+    # Test that a turn that failed after saving the user row replays its error instead of saving the row again
+    def test_failed_turn_after_user_row_is_replayed(self, client, test_session_id, fake_openai, monkeypatch):
+        import api
+
+        def unavailable(**kwargs):
+            raise Exception("Connection error.")
+
+        monkeypatch.setattr(api.client.chat.completions, "create", unavailable)
+        first = post(client, "/chat/", test_session_id)
+        assert "error" in first.text
+
+        monkeypatch.setattr(api.client.chat.completions, "create", fake_openai.create)
+        second = post(client, "/chat/", test_session_id)
+
+        assert second.text == first.text
+        assert len(fake_openai.calls) == 0
+        assert stored_messages(test_session_id) == [("user", "Hello there")]
+
+    # Test that a message rejected as too long is stored once when its key is retried
+    def test_too_long_message_is_replayed(self, client, test_session_id, fake_openai):
+        from api import MAX_USER_MESSAGE_TOKENS
+        message = "word " * (MAX_USER_MESSAGE_TOKENS + 10)
+
+        first = post(client, "/chat/", test_session_id, message=message)
+        second = post(client, "/chat/", test_session_id, message=message)
+
+        assert "too long" in first.text and second.text == first.text
+        assert stored_messages(test_session_id) == [("user", message)]
+
+    # Test that a repeated retry request regenerates the reply only once
+    def test_duplicate_retry(self, client, test_session_id, fake_openai):
+        post(client, "/chat/", test_session_id, key=None)
+        fake_openai.reply = "Retried reply"
+
+        first = post(client, "/chat/retry/", test_session_id, message="", key="retry-1")
+        second = post(client, "/chat/retry/", test_session_id, message="", key="retry-1")
+
+        assert tokens(first) == tokens(second) == "Retried reply"
+        assert len(fake_openai.calls) == 2
+        assert stored_messages(test_session_id) == [("user", "Hello there"), ("assistant", "Retried reply")]
+
+    # Test that a duplicate edit sent over the WebSocket replays the HTTP edit
+    def test_duplicate_edit_over_socket(self, client, test_session_id, fake_openai):
+        post(client, "/chat/", test_session_id, key=None)
+        fake_openai.reply = "Edited reply"
+        post(client, "/chat/edit/", test_session_id, message="Edited", key="edit-1")
+
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "edit", "message": "Edited", "turn": 1, "idempotency_key": "edit-1"})
+            frames = []
+            while not frames or not frames[-1].get("done"):
+                frames.append(socket.receive_json())
+
+        assert "".join(frame.get("token", "") for frame in frames) == "Edited reply"
+        assert len(fake_openai.calls) == 2
+
+
+# Test the store itself
+class TestIdempotencyStore:
+
+    # Test that finished keys expire after the TTL
+    def test_ttl(self, monkeypatch):
+        import idempotency
+        now = [1000.0]
+        monkeypatch.setattr(idempotency.time, "time", lambda: now[0])
+        store = IdempotencyStore(ttl_seconds=60)
+
+        flight, started = store.begin("k", "fp")
+        store.complete("k", flight)
+        now[0] += 59
+        assert store.begin("k", "fp") == (flight, False)
+        now[0] += 2
+        assert store.begin("k", "fp")[1] is True
+
+    # Test that the oldest finished keys are evicted first and running ones are kept
+    def test_max_keys(self):
+        store = IdempotencyStore(max_keys=2)
+        running, _ = store.begin("running", "fp")
+        for key in ["a", "b", "c"]:
+            flight, _ = store.begin(key, "fp")
+            store.complete(key, flight)
+
+        assert store.begin("running", "fp") == (running, False)
+        assert store.begin("c", "fp")[1] is False
+        assert store.begin("a", "fp")[1] is True
+
+    # Test that a different fingerprint for a known key is a conflict
+    def test_conflict(self):
+        store = IdempotencyStore()
+        store.begin("k", request_fingerprint("one"))
+        with pytest.raises(IdempotencyConflict):
+            store.begin("k", request_fingerprint("two"))
+
+    # Test that a failed flight is dropped only while the turn is still retryable
+    def test_failed_flight_kept_unless_retryable(self):
+        store = IdempotencyStore(ttl_seconds=60, max_keys=10)
+        for key, retryable in (("a", True), ("b", False)):
+            flight, _ = store.begin(key, "fp")
+            flight.append(json.dumps({"error": "boom"}) + "\n")
+            store.complete(key, flight, retryable)
+
+        assert store.begin("a", "fp")[1] is True
+        flight, started = store.begin("b", "fp")
+        assert started is False and list(flight.replay()) == [json.dumps({"error": "boom"}) + "\n"]
+
+    # Test that a reader attached mid-stream sees every line from the start
+    def test_replay_from_start(self):
+        flight = Flight("fp")
+        flight.append('{"token": "a"}\n')
+        reader = flight.replay()
+        assert next(reader) == '{"token": "a"}\n'
+
+        flight.append('{"token": "b"}\n')
+        flight.finish()
+        assert list(reader) == ['{"token": "b"}\n']
+        assert list(flight.replay()) == ['{"token": "a"}\n', '{"token": "b"}\n']
+
+
+# Test the keys the Gradio frontend sends (main.py)
+class TestFrontendTurnKeys:
+
+    @pytest.fixture
+    def frontend(self, client, monkeypatch):
+        """Route the frontend's chat requests to the FastAPI test client, recording their keys"""
+        import main
+        sent = []
+
+        def post(url, json=None, headers=None, stream=None, timeout=None):
+            sent.append(headers["Idempotency-Key"])
+            response = client.post(url[len(main.BASE_API_URL):], json=json, headers=headers)
+            lines = response.content.splitlines()
+            return SimpleNamespace(status_code=response.status_code, headers=response.headers,
+                                   iter_lines=lambda decode_unicode=False: iter(lines), close=lambda: None)
+
+        monkeypatch.setattr(main.requests, "post", post)
+        return main, sent
+
+    # Test that sending the same text twice in a row, after the same reply, stores both turns
+    def test_same_message_twice(self, frontend, test_session_id, fake_openai):
+        main, sent = frontend
+        loading = {"role": "assistant", "content": "..."}
+        first = [{"role": "user", "content": "hi"}, loading]
+        list(main.chat_with_llm("hi", first, test_session_id))
+        second = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "Stub reply from the fake model"},
+                  {"role": "user", "content": "hi"}, loading]
+        list(main.chat_with_llm("hi", second, test_session_id))
+
+        assert sent[0] != sent[1]
+        assert len(fake_openai.calls) == 2
+        assert stored_messages(test_session_id) == [("user", "hi"), ("assistant", "Stub reply from the fake model")] * 2
+
+    # Test that a request whose connection failed is re-submitted with the same key
+    def test_resubmit_reuses_key(self, frontend, test_session_id, fake_openai, monkeypatch):
+        main, sent = frontend
+        deliver = main.requests.post
+
+        def dropped_once(url, **kwargs):
+            if not sent:
+                sent.append(kwargs["headers"]["Idempotency-Key"])
+                raise main.requests.exceptions.ConnectionError("connection reset")
+            return deliver(url, **kwargs)
+
+        monkeypatch.setattr(main.requests, "post", dropped_once)
+        list(main.chat_with_llm("hi", [{"role": "user", "content": "hi"}], test_session_id))
+
+        assert sent[0] == sent[1]
+        assert stored_messages(test_session_id) == [("user", "hi"), ("assistant", "Stub reply from the fake model")]
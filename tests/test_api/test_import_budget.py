@@ -0,0 +1,87 @@
+"""
+Test the cold-import cost of api.py and main.py (python -X importtime budget)
+"""
+
+import pytest
+import subprocess
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Cumulative import budgets in milliseconds (override on slow CI machines)
+API_IMPORT_BUDGET_MS = int(os.getenv("API_IMPORT_BUDGET_MS", "1500"))
+MAIN_IMPORT_BUDGET_MS = int(os.getenv("MAIN_IMPORT_BUDGET_MS", "1000"))
+
+# Modules that must only be imported on first use
+DEFERRED_MODULES = ["openai", "tiktoken", "gradio"]
+
+IMPORT_AND_LIST_DEFERRED = """
+import sys
+import {module}
+print(",".join(name for name in {deferred!r} if name in sys.modules))
+"""
+
+
+def cold_import(module):
+    """Import a module in a fresh interpreter, returning (cumulative ms, deferred modules that were loaded)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         IMPORT_AND_LIST_DEFERRED.format(module=module, deferred=DEFERRED_MODULES)],
+        cwd=project_root,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+
+    # Lines look like "import time:  self [us] | cumulative | module"
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1])
+    assert cumulative_us is not None, f"No importtime entry for {module}"
+
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return cumulative_us / 1000, loaded
+
+
+def best_cold_import(module, runs=3):
+    """Fastest of a few runs, so one noisy run does not fail the budget"""
+    results = [cold_import(module) for _ in range(runs)]
+    return min(ms for ms, _ in results), results[0][1]
+
+
+class TestImportBudget:
+
+    # Test that importing api stays within budget and does not load the OpenAI SDK or tokenizer
+    def test_api_import_budget(self):
+        elapsed_ms, loaded = best_cold_import("api")
+        print(f"⏱️ import api: {elapsed_ms:.0f} ms (budget {API_IMPORT_BUDGET_MS} ms)")
+        assert loaded == [], f"api should not import {loaded} at import time"
+        assert elapsed_ms <= API_IMPORT_BUDGET_MS, (
+            f"import api took {elapsed_ms:.0f} ms, over the {API_IMPORT_BUDGET_MS} ms budget"
+        )
+
+    # Test that importing main does not build the Gradio UI
+    def test_main_import_budget(self):
+        elapsed_ms, loaded = best_cold_import("main")
+        print(f"⏱️ import main: {elapsed_ms:.0f} ms (budget {MAIN_IMPORT_BUDGET_MS} ms)")
+        assert loaded == [], f"main should not import {loaded} at import time"
+        assert elapsed_ms <= MAIN_IMPORT_BUDGET_MS, (
+            f"import main took {elapsed_ms:.0f} ms, over the {MAIN_IMPORT_BUDGET_MS} ms budget"
+        )
+
+    # Test that the app factory builds a working app on demand
+    def test_app_factory_builds_app(self):
+        import api
+        from fastapi.testclient import TestClient
+
+        client = TestClient(api.create_app())
+        assert client.get("/").json() == {"status": "running"}
+        assert client.post("/chat/stop/unknown-session").status_code == 200
@@ -0,0 +1,169 @@
+"""
+Test cases for live speech-to-text over /ws/speech
+"""
+
+import pytest
+import threading
+import time
+import sys
+import os
+from types import SimpleNamespace
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client
+from transcription_cache import transcription_cache
+import audio_preprocess
+
+
+class FakeTranscriber:
+    """Stand-in for Whisper: the transcript of a clip is its bytes as text, after `delay` seconds"""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.clips = []
+        self.blocked = {}  # Clip bytes -> Event that must be set before it is transcribed
+
+    def create(self, model, file):
+        clip = file.read()
+        self.clips.append(clip)
+        if clip in self.blocked:
+            self.blocked[clip].wait(timeout=5)
+        time.sleep(self.delay)
+        return SimpleNamespace(text=clip.decode())
+
+
+@pytest.fixture
+def fake_transcriber(monkeypatch):
+    import api
+    transcription_cache.clear()
+    transcriber = FakeTranscriber()
+    monkeypatch.setattr(audio_preprocess, "AUDIO_NORMALIZE", "false")
+    monkeypatch.setattr(api.client.audio.transcriptions, "create", transcriber.create)
+    return transcriber
+
+
+def receive_until_final(socket):
+    """Return (interim frames, final frame)"""
+    interim = []
+    while True:
+        frame = socket.receive_json()
+        if "status" in frame:
+            return interim, frame
+        interim.append(frame)
+
+
+# Test live transcription
+class TestLiveTranscription:
+
+    # Test that a segment is transcribed and pushed while the recording continues
+    def test_interim_text_before_stop(self, client, fake_transcriber):
+        with client.websocket_connect("/ws/speech") as socket:
+            socket.send_bytes(b"Hello ")
+            socket.send_bytes(b"there.")
+            socket.send_json({"type": "segment", "duration_ms": 1500})
+
+            # Still recording: the first segment's text arrives anyway
+            assert socket.receive_json() == {"segment": 0, "text": "Hello there."}
+
+            socket.send_bytes(b"How are you?")
+            socket.send_json({"type": "stop", "duration_ms": 1000})
+            interim, final = receive_until_final(socket)
+
+        assert interim == [{"segment": 1, "text": "How are you?"}]
+        assert final == {"text": "Hello there. How are you?", "status": "success"}
+        assert fake_transcriber.clips == [b"Hello there.", b"How are you?"]
+
+    # Test that after stop only the last segment is waited for
+    def test_final_text_follows_stop_quickly(self, client, fake_transcriber):
+        fake_transcriber.delay = 0.3
+
+        with client.websocket_connect("/ws/speech") as socket:
+            for word in ["one", "two", "three"]:
+                socket.send_bytes(word.encode())
+                socket.send_json({"type": "segment"})
+            # The user keeps talking while the earlier segments are transcribed
+            time.sleep(0.4)
+
+            socket.send_bytes(b"four")
+            start = time.perf_counter()
+            socket.send_json({"type": "stop"})
+            _, final = receive_until_final(socket)
+            elapsed = time.perf_counter() - start
+
+        assert final["text"] == "one two three four"
+        # Record-then-upload would wait for all four clips after stop
+        assert elapsed < 0.6
+
+    # Test that segments finishing out of order are joined in recording order
+    def test_segments_joined_in_order(self, client, fake_transcriber):
+        release = threading.Event()
+        fake_transcriber.blocked[b"first"] = release
+
+        with client.websocket_connect("/ws/speech") as socket:
+            socket.send_bytes(b"first")
+            socket.send_json({"type": "segment"})
+            socket.send_bytes(b"second")
+            socket.send_json({"type": "segment"})
+            assert socket.receive_json() == {"segment": 1, "text": "second"}
+
+            release.set()
+            socket.send_json({"type": "stop"})
+            _, final = receive_until_final(socket)
+
+        assert final["text"] == "first second"
+
+    # Test that zero-length frames (a recorder flushing before it has audio) are ignored
+    def test_empty_frames_ignored(self, client, fake_transcriber):
+        with client.websocket_connect("/ws/speech") as socket:
+            socket.send_bytes(b"")
+            socket.send_bytes(b"Hello")
+            socket.send_bytes(b"")
+            socket.send_json({"type": "stop"})
+            _, final = receive_until_final(socket)
+
+        assert final == {"text": "Hello", "status": "success"}
+        assert fake_transcriber.clips == [b"Hello"]
+
+    # Test that a recording over the size limit is rejected
+    def test_oversized_recording_rejected(self, client, fake_transcriber, monkeypatch):
+        import api
+        monkeypatch.setattr(api, "MAX_AUDIO_UPLOAD_BYTES", 10)
+
+        with client.websocket_connect("/ws/speech") as socket:
+            socket.send_bytes(b"x" * 11)
+            _, final = receive_until_final(socket)
+
+        assert final == {"text": "", "status": "error", "error": "Audio upload exceeds 10 bytes"}
+        assert fake_transcriber.clips == []
+
+    # Test that the recording is rejected once its segments add up to more than the duration limit
+    def test_overlong_recording_rejected(self, client, fake_transcriber, monkeypatch):
+        import api
+        monkeypatch.setattr(api, "MAX_AUDIO_DURATION_SECONDS", 2)
+
+        with client.websocket_connect("/ws/speech") as socket:
+            socket.send_bytes(b"first")
+            socket.send_json({"type": "segment", "duration_ms": 1500})
+            socket.send_bytes(b"second")
+            socket.send_json({"type": "segment", "duration_ms": 1500})
+            _, final = receive_until_final(socket)
+
+        assert final == {"text": "", "status": "error", "error": "Recording exceeds 2 seconds"}
+        assert fake_transcriber.clips == [b"first"]
+
+    # Test that stopping without any audio is an error, not a Whisper call
+    def test_stop_without_audio(self, client, fake_transcriber):
+        with client.websocket_connect("/ws/speech") as socket:
+            socket.send_json({"type": "segment"})
+            socket.send_json({"type": "stop"})
+            _, final = receive_until_final(socket)
+
+        assert final == {"text": "", "status": "error", "error": "Empty audio upload"}
+        assert fake_transcriber.clips == []
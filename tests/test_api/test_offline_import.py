@@ -0,0 +1,90 @@
+"""
+Test that the backend can be imported without network access (tokenizer is loaded lazily),
+and that the tokenizer then loads from the bundled BPE cache with the network still off
+"""
+
+import pytest
+import subprocess
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Where the Dockerfile bundles the tiktoken BPE file (its TIKTOKEN_CACHE_DIR)
+BUNDLED_CACHE_DIR = "/app/.tiktoken_cache"
+
+# Runs in a fresh interpreter with every outbound connection attempt failing
+NO_NETWORK = """
+import socket
+
+def no_network(*args, **kwargs):
+    raise OSError("network access disabled for this test")
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+socket.getaddrinfo = no_network
+"""
+
+OFFLINE_IMPORT = NO_NETWORK + """
+import api
+assert api._encoding is None, "The tokenizer should not be loaded at import time"
+print("imported")
+"""
+
+OFFLINE_ENCODE = NO_NETWORK + """
+import api
+tokens = api.count_tokens("Hello, offline world")
+assert tokens > 0, tokens
+print(f"encoded {tokens} tokens with {api.get_encoding().name}")
+"""
+
+
+@pytest.fixture(scope="module")
+def tiktoken_cache(tmp_path_factory):
+    """The bundled tiktoken cache, or one filled the way the Dockerfile does when running outside the image"""
+    bundled = os.environ.get("TIKTOKEN_CACHE_DIR", BUNDLED_CACHE_DIR)
+    if os.path.isdir(bundled) and os.listdir(bundled):
+        return bundled
+    cache_dir = str(tmp_path_factory.mktemp("tiktoken_cache"))
+    result = subprocess.run(
+        [sys.executable, "-c", "import tiktoken; tiktoken.get_encoding('cl100k_base')"],
+        env={**os.environ, "TIKTOKEN_CACHE_DIR": cache_dir},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if result.returncode != 0:
+        pytest.skip(f"No tiktoken cache in {bundled} and the BPE file could not be downloaded")
+    return cache_dir
+
+
+class TestOfflineImport:
+
+    # Test that importing api works with no network and does not load the tokenizer
+    def test_import_api_without_network(self):
+        result = subprocess.run(
+            [sys.executable, "-c", OFFLINE_IMPORT],
+            cwd=project_root,
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        assert result.returncode == 0, result.stderr
+        assert "imported" in result.stdout
+
+    # Test that the tokenizer loads from the bundled cache and encodes with no network
+    def test_encode_from_bundled_cache_without_network(self, tiktoken_cache):
+        result = subprocess.run(
+            [sys.executable, "-c", OFFLINE_ENCODE],
+            cwd=project_root,
+            env={**os.environ, "TIKTOKEN_CACHE_DIR": tiktoken_cache},
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        assert result.returncode == 0, result.stderr
+        assert "encoded" in result.stdout
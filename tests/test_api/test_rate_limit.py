@@ -0,0 +1,201 @@
+"""
+Test cases for token-bucket rate limiting of chat turns (ratelimit.py)
+"""
+
+import pytest
+import asyncio
+import gc
+import uuid
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, test_session_id, fake_openai, temp_db
+from ratelimit import RateLimiter, RateLimited, MemoryBuckets, DatabaseBuckets, rate_limiter
+from admission import admission
+from generations import Generation
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time() for the buckets, advanced by hand"""
+    import ratelimit
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    def set_budget(session_tpm, ip_tpm=0, reply_estimate=100):
+        monkeypatch.setattr(rate_limiter, "session_tpm", session_tpm)
+        monkeypatch.setattr(rate_limiter, "ip_tpm", ip_tpm)
+        monkeypatch.setattr(rate_limiter, "reply_estimate", reply_estimate)
+    return set_budget
+
+
+def level(limiter, key, per_minute):
+    """Tokens left in a bucket (taking nothing)"""
+    limiter.backend.take(key, 0, per_minute, per_minute / 60, None)
+    return limiter.backend._buckets[key][0]
+
+
+# Test the buckets and the limiter
+class TestTokenBuckets:
+
+    # Test that a bucket refuses a charge it cannot cover and refills over time
+    @pytest.mark.parametrize("backend", ["memory", "db"])
+    def test_refill(self, clock, temp_db, backend):
+        buckets = MemoryBuckets() if backend == "memory" else DatabaseBuckets(temp_db[0])
+
+        assert buckets.take("k", 600, 600, 10, 600) == 0
+        assert buckets.take("k", 100, 600, 10, 100) == pytest.approx(10)
+        clock[0] += 10
+        assert buckets.take("k", 100, 600, 10, 100) == 0
+
+    # Test that a worker sees the tokens another worker took from a shared bucket
+    def test_db_buckets_are_shared(self, clock, temp_db):
+        first, second = DatabaseBuckets(temp_db[0]), DatabaseBuckets(temp_db[0])
+        first.take("k", 500, 600, 10, 500)
+        assert second.take("k", 500, 600, 10, 500) == pytest.approx(40)
+
+    # Test that a turn larger than the whole budget runs once, then waits for the debt to clear
+    def test_turn_bigger_than_budget(self, clock):
+        limiter = RateLimiter(session_tpm=1000, ip_tpm=0, reply_estimate=500, backend="memory")
+        limiter.charge("s", None, 1200)
+        with pytest.raises(RateLimited) as limited:
+            limiter.charge("s", None, 10)
+        assert limited.value.status_code == 429
+        assert limited.value.retry_after == 73
+
+    # Test that a turn refused by the IP bucket gives back what the session bucket took
+    def test_ip_rejection_refunds_session(self, clock):
+        limiter = RateLimiter(session_tpm=6000, ip_tpm=1000, reply_estimate=400, backend="memory")
+        limiter.charge("a", "1.2.3.4", 100)
+        limiter.charge("b", "1.2.3.4", 100)
+        with pytest.raises(RateLimited):
+            limiter.charge("c", "1.2.3.4", 100)
+
+        assert level(limiter, "session:c", 6000) == 6000
+        limiter.charge("c", "5.6.7.8", 100)
+
+    # Test that settling charges what the turn really used
+    def test_settle_charges_real_usage(self, clock):
+        limiter = RateLimiter(session_tpm=6000, ip_tpm=0, reply_estimate=500, backend="memory")
+        reservation = limiter.charge("s", None, 100)
+        assert level(limiter, "session:s", 6000) == 5400
+
+        reservation.settle(3000)
+        reservation.settle(3000)
+        assert level(limiter, "session:s", 6000) == 3000
+
+        limiter.charge("s", None, 100).cancel()
+        assert level(limiter, "session:s", 6000) == 3000
+
+    # Test that an unknown backend is refused
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            RateLimiter(backend="redis")
+
+
+# Test the 429 responses of the chat endpoints
+class TestRateLimitedEndpoints:
+
+    # Test that a session over its budget gets 429 with Retry-After and no upstream call
+    def test_session_over_budget(self, client, test_session_id, fake_openai, budget, clock):
+        budget(session_tpm=100, reply_estimate=100)
+        first = client.post("/chat/", json={"session_id": test_session_id, "message": "Hello"})
+        assert first.status_code == 200
+
+        second = client.post("/chat/", json={"session_id": test_session_id, "message": "Hello again"})
+        assert second.status_code == 429
+        assert second.json()["error"] == "Rate limit exceeded. Please try again in a moment."
+        assert int(second.headers["Retry-After"]) >= 1
+        assert len(fake_openai.calls) == 1
+
+        # Another session is not affected
+        other = client.post("/chat/", json={"session_id": str(uuid.uuid4()), "message": "Hello"})
+        assert other.status_code == 200
+
+    # Test that one client is limited across sessions by its IP bucket
+    def test_ip_over_budget(self, client, fake_openai, budget, clock):
+        budget(session_tpm=0, ip_tpm=20, reply_estimate=100)
+        responses = [client.post("/chat/", json={"session_id": str(uuid.uuid4()), "message": "Hi"}) for _ in range(2)]
+
+        assert [r.status_code for r in responses] == [200, 429]
+
+    # Test that the charge is settled against the prompt and reply tokens of the turn
+    def test_turn_is_settled(self, client, test_session_id, fake_openai, budget, clock):
+        budget(session_tpm=6000, reply_estimate=1000)
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Hello"})
+
+        used = 6000 - level(rate_limiter, f"session:{test_session_id}", 6000)
+        # "Hello" with its role overhead, plus the six-word stub reply: far less than the estimate
+        assert 0 < used < 50
+
+    # Test that a turn whose client went away before its stream was read gets its charge back
+    def test_unread_turn_is_refunded(self, test_session_id, budget, clock):
+        import api
+        budget(session_tpm=6000, reply_estimate=1000)
+        in_flight = admission.in_flight
+        stream = asyncio.run(api.admit(Generation(test_session_id), lambda generation: iter(["line\n"]), None, "Hello"))
+        assert level(rate_limiter, f"session:{test_session_id}", 6000) < 5000
+
+        del stream
+        gc.collect()
+        assert level(rate_limiter, f"session:{test_session_id}", 6000) == 6000
+        assert admission.in_flight == in_flight
+
+    # Test that the message is tokenized off the event loop thread
+    def test_message_tokenized_off_event_loop(self, test_session_id, budget, clock, monkeypatch):
+        import api
+        import threading
+        budget(session_tpm=6000, reply_estimate=1000)
+        threads = []
+        count_tokens = api.count_tokens
+
+        def recording_count_tokens(text):
+            threads.append(threading.current_thread())
+            return count_tokens(text)
+
+        monkeypatch.setattr(api, "count_tokens", recording_count_tokens)
+        stream = asyncio.run(api.admit(Generation(test_session_id), lambda generation: iter(["line\n"]), None, "Hello"))
+        list(stream)
+
+        assert threads and threading.main_thread() not in threads
+
+    # Test that a client disconnecting mid-stream settles the tokens used so far
+    def test_disconnect_settles_usage(self, test_session_id, budget, clock):
+        import api
+        budget(session_tpm=6000, reply_estimate=1000)
+        generation = Generation(test_session_id)
+
+        def make_stream(generation):
+            generation.prompt_tokens = 20
+            for _ in range(3):
+                generation.completion_tokens += 5
+                yield '{"token": "word"}\n'
+
+        stream = asyncio.run(api.admit(generation, make_stream, None, "Hello"))
+        next(stream)
+        stream.close()  # What the server does when the client disconnects
+        assert 6000 - level(rate_limiter, f"session:{test_session_id}", 6000) == 25
+
+    # Test that a WebSocket turn over the budget gets an error frame with retry_after
+    def test_socket_turn_over_budget(self, client, test_session_id, fake_openai, budget, clock):
+        budget(session_tpm=60, reply_estimate=100)
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Hello"})
+
+        with client.websocket_connect(f"/ws/chat/{test_session_id}") as socket:
+            socket.send_json({"type": "retry", "turn": 1})
+            frame = socket.receive_json()
+
+        assert frame["error"] == "Rate limit exceeded. Please try again in a moment."
+        assert frame["retry_after"] >= 1 and frame["done"] is True
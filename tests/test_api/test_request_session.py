@@ -0,0 +1,128 @@
+"""
+Test that streaming endpoints use one lazily connected, request-scoped DB session,
+checking out one pooled connection per turn
+"""
+
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+import metrics  # noqa: E402
+from conftest import client, test_session_id, fake_openai  # noqa: E402
+from database import RequestSession, SessionLocal  # noqa: E402
+from message_writer import MessageWriter, message_writer  # noqa: E402
+
+
+def fake_stream(text):
+    """Mimic OpenAI streaming chunks for the given text, one word per chunk"""
+    words = text.split(" ")
+    return [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=w if i == 0 else " " + w))])
+        for i, w in enumerate(words)
+    ]
+
+
+@pytest.fixture
+def pool_checkouts(client, monkeypatch):
+    """
+    Run a request and return how many connections it took from the pool (the db.pool.checkouts
+    counter kept by instrument_pool). The shared write-behind queue is drained and swapped for
+    one that only flushes when closed, so background batches are not counted against the request.
+    """
+    import api
+    message_writer.close()
+    writer = MessageWriter(SessionLocal, flush_interval=3600)
+    monkeypatch.setattr(api, "message_writer", writer)
+
+    def measure(path, session_id, message=""):
+        before = metrics.snapshot()["counters"].get("db.pool.checkouts", 0)
+        response = client.post(path, json={"session_id": session_id, "message": message})
+        assert response.status_code == 200
+        assert "error" not in response.text
+        return metrics.snapshot()["counters"].get("db.pool.checkouts", 0) - before
+
+    yield measure
+    writer.close()
+    message_writer.open()
+
+
+class TestRequestSession:
+
+    # Test that creating a RequestSession does not create a Session or take a connection
+    def test_request_session_is_lazy(self):
+        db = RequestSession()
+        assert db._session is None
+        assert db.checkouts == 0
+        db.close()
+        assert db.checkouts == 0
+
+    # Test that a chat turn takes exactly one connection from the pool for its own session,
+    # and still sees the previous (write-behind queued) assistant reply in its history
+    def test_chat_turn_uses_one_checkout(self, client, test_session_id, monkeypatch):
+        import api
+
+        created = []
+
+        class RecordingRequestSession(RequestSession):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                created.append(self)
+
+        captured = []
+
+        def fake_create(model, messages, stream, max_tokens):
+            captured.append(list(messages))
+            return iter(fake_stream("Stub reply from the fake model"))
+
+        monkeypatch.setattr(api, "RequestSession", RecordingRequestSession)
+        monkeypatch.setattr(api.client.chat.completions, "create", fake_create)
+
+        for message in ["First question", "Second question"]:
+            response = client.post("/chat/", json={"session_id": test_session_id, "message": message})
+            assert response.status_code == 200
+            for _ in response.iter_bytes():
+                pass
+
+        assert len(created) == 2, "Each turn should create exactly one request session"
+        assert [db.checkouts for db in created] == [1, 1], "Each turn should run one transaction"
+
+        # The second turn must see the first reply even though it was written behind
+        assert captured[1] == [
+            {"role": "user", "content": "First question"},
+            {"role": "assistant", "content": "Stub reply from the fake model"},
+            {"role": "user", "content": "Second question"},
+        ]
+
+
+# Test the pool checkouts of each chat endpoint
+class TestPoolCheckouts:
+
+    # Test that sending a message checks out one connection, also when earlier replies are still queued
+    def test_send(self, pool_checkouts, test_session_id, fake_openai):
+        assert pool_checkouts("/chat/", test_session_id, "First question") == 1
+        assert pool_checkouts("/chat/", test_session_id, "Second question") == 1
+
+    # Test that an edit checks out one connection whether it regenerates, reuses a kept reply or changes nothing
+    def test_edit(self, pool_checkouts, test_session_id, fake_openai):
+        pool_checkouts("/chat/", test_session_id, "Tell me a joke")
+
+        assert pool_checkouts("/chat/edit/", test_session_id, "Tell me a story") == 1
+        assert pool_checkouts("/chat/edit/", test_session_id, "Tell me a story") == 1
+        assert pool_checkouts("/chat/edit/", test_session_id, "Tell me a joke") == 1
+        assert len(fake_openai.calls) == 2
+
+    # Test that a retry checks out one connection
+    def test_retry(self, pool_checkouts, test_session_id, fake_openai):
+        pool_checkouts("/chat/", test_session_id, "Tell me a joke")
+
+        assert pool_checkouts("/chat/retry/", test_session_id) == 1
+        assert pool_checkouts("/chat/retry/", test_session_id) == 1
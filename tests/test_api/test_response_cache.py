@@ -0,0 +1,198 @@
+"""
+Test cases for the exact-context response cache (response_cache.py)
+"""
+
+import pytest
+import json
+import time
+import uuid
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, test_session_id, fake_openai, temp_db
+from datetime import timedelta
+from database import SessionLocal, ChatMessage, ResponseCacheEntry, malaysia_now
+from message_writer import MessageWriter, message_writer
+from response_cache import ResponseCache, context_key, chunk_event, response_cache
+import metrics
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Turn the shared response cache on (it is off by default) with instant replay"""
+    monkeypatch.setattr(response_cache, "max_entries", 16)
+    monkeypatch.setattr(response_cache, "replay_rate", 0)
+    response_cache.clear()
+    yield response_cache
+    response_cache.clear()
+
+
+def tokens(response):
+    lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    return "".join(line.get("token", "") for line in lines)
+
+
+def send(client, session_id, message):
+    return client.post("/chat/", json={"session_id": session_id, "message": message})
+
+
+def stored_messages(session_id):
+    message_writer.flush()
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id).all()
+        return [(m.role, m.content) for m in rows]
+    finally:
+        db.close()
+
+
+# Test the cache itself
+class TestResponseCache:
+
+    # Test that the key covers the model, the parameters and every message
+    def test_context_key(self):
+        messages = [{"role": "user", "content": "hi"}]
+        key = context_key("gpt-3.5-turbo", messages, max_tokens=4096)
+
+        assert key == context_key("gpt-3.5-turbo", [{"content": "hi", "role": "user"}], max_tokens=4096)
+        assert key != context_key("gpt-4o", messages, max_tokens=4096)
+        assert key != context_key("gpt-3.5-turbo", messages, max_tokens=100)
+        assert key != context_key("gpt-3.5-turbo", [{"role": "user", "content": "hi!"}], max_tokens=4096)
+
+    # Test that the cache is off unless it is given a size or persistence
+    def test_disabled_by_default(self):
+        assert ResponseCache(max_entries=0, persist=False).enabled is False
+
+    # Test that entries expire after the TTL and the least recently used is evicted
+    def test_ttl_and_lru(self, monkeypatch):
+        import response_cache as module
+        now = [1000.0]
+        monkeypatch.setattr(module.time, "time", lambda: now[0])
+        cache = ResponseCache(max_entries=2, ttl_seconds=60, persist=False)
+
+        cache.put("a", ["A"], 10)
+        cache.put("b", ["B"], 10)
+        cache.get("a")
+        cache.put("c", ["C"], 10)
+        assert cache.get("b") is None
+        assert cache.get("a") == (["A"], 10)
+
+        now[0] += 61
+        assert cache.get("c") is None
+        assert cache.hits == 2 and cache.misses == 2
+
+    # Test that only replies streamed to the end are stored
+    def test_records_complete_replies_only(self):
+        cache = ResponseCache(max_entries=4, persist=False)
+        events = [chunk_event("Hello"), chunk_event(None), chunk_event(" world")]
+
+        assert [e.choices[0].delta.content for e in cache.record("full", iter(events), lambda: 7)] == ["Hello", None, " world"]
+        partial = cache.record("partial", iter(events), lambda: 7)
+        next(partial)
+        partial.close()
+        list(cache.record("blank", iter([chunk_event(" ")]), lambda: 1))
+
+        assert cache.get("full") == (["Hello", " world"], 7)
+        assert cache.get("partial") is None
+        assert cache.get("blank") is None
+
+    # Test that replay is paced at the configured rate
+    def test_replay_rate(self):
+        cache = ResponseCache(max_entries=4, persist=False, replay_rate=50)
+        start = time.perf_counter()
+        replayed = [event.choices[0].delta.content for event in cache.replay(["a", "b", "c", "d", "e"])]
+
+        assert replayed == ["a", "b", "c", "d", "e"]
+        assert time.perf_counter() - start >= 0.08
+
+    # Test that persisted replies are found by a new process
+    def test_persisted_entries(self, temp_db):
+        session_factory, _ = temp_db
+        ResponseCache(max_entries=4, persist=True, session_factory=session_factory).put("k", ["Hi", " there"], 12)
+
+        restarted = ResponseCache(max_entries=4, persist=True, session_factory=session_factory)
+        assert restarted.get("k") == (["Hi", " there"], 12)
+        assert len(restarted) == 1
+
+    # Test that the write-behind thread's purge deletes expired persisted rows and keeps fresh ones
+    def test_background_purge_removes_expired_rows(self, temp_db, test_session_id, monkeypatch):
+        session_factory, _ = temp_db
+        cache = ResponseCache(max_entries=0, ttl_seconds=60, persist=True, session_factory=session_factory)
+        cache.put("old", ["Old"], 1)
+        cache.put("new", ["New"], 1)
+        db = session_factory()
+        try:
+            db.query(ResponseCacheEntry).filter(ResponseCacheEntry.key == "old").update(
+                {ResponseCacheEntry.created_at: malaysia_now() - timedelta(seconds=120)})
+            db.commit()
+        finally:
+            db.close()
+        monkeypatch.setattr("message_writer.response_cache", cache)
+
+        writer = MessageWriter(session_factory, flush_interval=0.05)
+        writer.enqueue(test_session_id, "assistant", "Hi")  # Starts the background thread
+        try:
+            deadline = time.time() + 5
+            while time.time() < deadline:
+                db = session_factory()
+                try:
+                    keys = [row.key for row in db.query(ResponseCacheEntry).all()]
+                finally:
+                    db.close()
+                if keys == ["new"]:
+                    break
+                time.sleep(0.05)
+            assert keys == ["new"]
+        finally:
+            writer.close()
+
+
+# Test cached replies through the chat endpoints
+class TestResponseCacheEndpoints:
+
+    # Test that the same first message in a new session is answered from the cache
+    def test_same_first_message_across_sessions(self, client, fake_openai, cache):
+        metrics.reset()
+        first_session, second_session = str(uuid.uuid4()), str(uuid.uuid4())
+
+        first = send(client, first_session, "hi")
+        fake_openai.reply = "A different reply"
+        second = send(client, second_session, "hi")
+
+        assert tokens(first) == tokens(second) == "Stub reply from the fake model"
+        assert len(fake_openai.calls) == 1
+        assert stored_messages(second_session) == [("user", "hi"), ("assistant", "Stub reply from the fake model")]
+        counters = metrics.snapshot()["counters"]
+        assert counters["response_cache.hits"] == 1
+        assert counters["response_cache.saved_tokens"] > 0
+
+    # Test that an edit back to an earlier wording replays the earlier reply
+    def test_edit_restoring_previous_wording(self, client, test_session_id, fake_openai, cache):
+        send(client, test_session_id, "Tell me a joke")
+        fake_openai.reply = "Second reply"
+        client.post("/chat/edit/", json={"session_id": test_session_id, "message": "Tell me a story"})
+        fake_openai.reply = "Third reply"
+        restored = client.post("/chat/edit/", json={"session_id": test_session_id, "message": "Tell me a joke"})
+
+        assert tokens(restored) == "Stub reply from the fake model"
+        assert len(fake_openai.calls) == 2
+
+    # Test that retry bypasses the cache and does not replace the cached reply
+    def test_retry_bypasses_cache(self, client, fake_openai, cache):
+        session_id = str(uuid.uuid4())
+        send(client, session_id, "hi")
+        fake_openai.reply = "Fresh reply"
+        retried = client.post("/chat/retry/", json={"session_id": session_id, "message": ""})
+
+        assert tokens(retried) == "Fresh reply"
+        assert len(fake_openai.calls) == 2
+        assert tokens(send(client, str(uuid.uuid4()), "hi")) == "Stub reply from the fake model"
+        assert len(fake_openai.calls) == 2
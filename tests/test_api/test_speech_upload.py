@@ -0,0 +1,75 @@
+"""
+Test cases for the upload limits on POST /speech-to-text/
+"""
+
+import pytest
+import io
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, fake_whisper
+
+
+@pytest.fixture(autouse=True)
+def no_normalization(monkeypatch):
+    """Send uploads to the fake Whisper unchanged, whether or not ffmpeg is installed"""
+    import audio_preprocess
+    monkeypatch.setattr(audio_preprocess, "AUDIO_NORMALIZE", "false")
+
+
+def upload(client, data, duration_ms=None):
+    form = {} if duration_ms is None else {"duration_ms": str(duration_ms)}
+    return client.post(
+        "/speech-to-text/",
+        files={"audio": ("recording.webm", io.BytesIO(data), "audio/webm")},
+        data=form,
+    )
+
+
+# Test validation of speech-to-text uploads
+class TestSpeechUpload:
+
+    # Test that an upload within the limits is forwarded to Whisper unchanged
+    def test_valid_upload_is_transcribed(self, client, fake_whisper):
+        response = upload(client, b"opus audio", duration_ms=1500)
+
+        assert response.json() == {"text": "hello world", "status": "success"}
+        assert fake_whisper == [(".webm", b"opus audio")]
+
+    # Test that an upload over the byte limit is rejected without calling Whisper
+    def test_oversized_upload_is_rejected(self, client, fake_whisper, monkeypatch):
+        import api
+        monkeypatch.setattr(api, "MAX_AUDIO_UPLOAD_BYTES", 16)
+
+        data = upload(client, b"x" * 17).json()
+
+        assert data["status"] == "error"
+        assert data["text"] == ""
+        assert "16 bytes" in data["error"]
+        assert fake_whisper == []
+
+    # Test that a recording longer than the duration limit is rejected
+    def test_long_recording_is_rejected(self, client, fake_whisper, monkeypatch):
+        import api
+        monkeypatch.setattr(api, "MAX_AUDIO_DURATION_SECONDS", 60)
+
+        data = upload(client, b"opus audio", duration_ms=61000).json()
+
+        assert data["status"] == "error"
+        assert "60 seconds" in data["error"]
+        assert fake_whisper == []
+
+    # Test that an empty upload is rejected
+    def test_empty_upload_is_rejected(self, client, fake_whisper):
+        data = upload(client, b"").json()
+
+        assert data == {"text": "", "status": "error", "error": "Empty audio upload"}
+        assert fake_whisper == []
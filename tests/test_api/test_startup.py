@@ -0,0 +1,112 @@
+"""
+Test cases for startup warm-up and the liveness / readiness endpoints
+"""
+
+import pytest
+import time
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from fastapi.testclient import TestClient
+from api import app
+
+
+def wait_for_warmup(client, timeout=10):
+    """Poll GET /ready until warm-up has finished (ready or degraded)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = client.get("/ready")
+        if response.json()["status"] != "starting":
+            return response
+        time.sleep(0.05)
+    pytest.fail("Warm-up did not finish in time")
+
+
+# Test the lifespan warm-up phase
+class TestStartup:
+
+    # Test that the app reports ready once the tokenizer and DB pool are warm
+    def test_ready_after_warmup(self):
+        with TestClient(app) as client:
+            # Liveness does not depend on warm-up
+            assert client.get("/").json() == {"status": "running"}
+
+            response = wait_for_warmup(client)
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == "ready"
+            assert "tokenizer" in data["steps"]
+            assert "database" in data["steps"]
+
+    # Test that a failed upstream keep-alive does not block readiness
+    def test_upstream_warmup_failure_is_not_fatal(self, monkeypatch):
+        import api
+
+        def failing_list():
+            raise RuntimeError("upstream unreachable")
+
+        monkeypatch.setattr(api, "WARMUP_UPSTREAM", True)
+        monkeypatch.setattr(api.client.models, "list", failing_list)
+
+        with TestClient(app) as client:
+            response = wait_for_warmup(client)
+            assert response.status_code == 200
+            assert "upstream" in response.json()["errors"]
+
+    # Test that the app is not ready while the database cannot be reached
+    def test_not_ready_when_database_unreachable(self, monkeypatch):
+        import api
+
+        def failing_warm_pool(connections):
+            raise RuntimeError("database unreachable")
+
+        monkeypatch.setattr(api, "warm_pool", failing_warm_pool)
+
+        with TestClient(app) as client:
+            response = wait_for_warmup(client)
+            assert response.status_code == 503
+            assert response.json()["status"] == "degraded"
+            # Liveness still answers
+            assert client.get("/").status_code == 200
+
+    # Test that missing tables are created before the app accepts requests
+    def test_tables_created_at_startup(self, monkeypatch):
+        import api
+        calls = []
+        monkeypatch.setattr(api, "init_db", lambda: calls.append("init_db"))
+
+        with TestClient(app) as client:
+            assert calls == ["init_db"]
+            assert client.get("/").status_code == 200
+
+    # Test that a failed attempt (another worker creating the same tables) is retried once
+    def test_table_creation_retried(self, monkeypatch):
+        import api
+        calls = []
+
+        def racing_init_db():
+            calls.append("init_db")
+            if len(calls) == 1:
+                raise RuntimeError("duplicate key value violates unique constraint")
+
+        monkeypatch.setattr(api, "init_db", racing_init_db)
+        api.create_tables()
+        assert calls == ["init_db", "init_db"]
+
+    # Test that table creation is skipped when migrations run on deploy instead
+    def test_table_creation_disabled(self, monkeypatch):
+        import api
+        calls = []
+        monkeypatch.setattr(api, "init_db", lambda: calls.append("init_db"))
+        monkeypatch.setattr(api, "DB_CREATE_TABLES", False)
+
+        with TestClient(app):
+            assert calls == []
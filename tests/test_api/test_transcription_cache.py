@@ -0,0 +1,137 @@
+"""
+Test cases for the content-addressed transcription cache used by POST /speech-to-text/
+"""
+
+import pytest
+import io
+import uuid
+import sys
+import os
+from datetime import timedelta
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, fake_whisper
+from database import SessionLocal, TranscriptionCacheEntry, malaysia_now
+from transcription_cache import TranscriptionCache, transcription_cache, cache_key
+import audio_preprocess
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def no_normalization(monkeypatch):
+    """Key the cache on the raw test bytes, whether or not ffmpeg is installed"""
+    monkeypatch.setattr(audio_preprocess, "AUDIO_NORMALIZE", "false")
+
+
+def upload(client, data, headers=None):
+    return client.post(
+        "/speech-to-text/",
+        files={"audio": ("recording.webm", io.BytesIO(data), "audio/webm")},
+        headers=headers or {},
+    )
+
+
+def unique_key():
+    return cache_key(uuid.uuid4().bytes, "whisper-1")
+
+
+# Test the transcription cache on the endpoint
+class TestTranscriptionCacheEndpoint:
+
+    # Test that re-submitting the same clip is answered from the cache
+    def test_repeat_upload_is_a_hit(self, client, fake_whisper):
+        first = upload(client, b"same clip")
+        second = upload(client, b"same clip")
+
+        assert first.headers["X-Transcription-Cache"] == "miss"
+        assert second.headers["X-Transcription-Cache"] == "hit"
+        assert second.json() == {"text": "hello world", "status": "success"}
+        assert len(fake_whisper) == 1
+        assert metrics.snapshot()["gauges"]["speech.cache.hit_rate"] == 0.5
+
+    # Test that a different clip is transcribed separately
+    def test_different_clip_is_a_miss(self, client, fake_whisper):
+        upload(client, b"first clip")
+        response = upload(client, b"second clip")
+
+        assert response.headers["X-Transcription-Cache"] == "miss"
+        assert len(fake_whisper) == 2
+
+    # Test that Cache-Control: no-cache forces a fresh transcription
+    def test_no_cache_header_bypasses_cache(self, client, fake_whisper):
+        upload(client, b"same clip")
+        response = upload(client, b"same clip", headers={"Cache-Control": "no-cache"})
+
+        assert response.headers["X-Transcription-Cache"] == "bypass"
+        assert len(fake_whisper) == 2
+
+
+# Test the cache itself
+class TestTranscriptionCache:
+
+    # Test that the least recently used transcript is evicted first
+    def test_lru_eviction(self):
+        cache = TranscriptionCache(max_entries=2, persist=False)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        cache.get("a")
+        cache.put("c", "C")
+
+        assert cache.get("a") == "A"
+        assert cache.get("b") is None
+        assert cache.get("c") == "C"
+
+    # Test that in-memory entries expire after the TTL
+    def test_memory_ttl(self, monkeypatch):
+        import transcription_cache as module
+        now = [1000.0]
+        monkeypatch.setattr(module.time, "time", lambda: now[0])
+        cache = TranscriptionCache(max_entries=10, ttl_seconds=60, persist=False)
+        cache.put("a", "A")
+
+        now[0] += 59
+        assert cache.get("a") == "A"
+        now[0] += 2
+        assert cache.get("a") is None
+
+    # Test that empty transcripts are not cached
+    def test_empty_transcript_not_cached(self):
+        cache = TranscriptionCache(max_entries=10, persist=False)
+        cache.put("a", "")
+        assert cache.get("a") is None
+
+    # Test that persisted transcripts are shared by a fresh cache (e.g. after a restart)
+    def test_persisted_entry_survives_restart(self):
+        key = unique_key()
+        TranscriptionCache(max_entries=10, persist=True).put(key, "from the database")
+
+        restarted = TranscriptionCache(max_entries=10, persist=True)
+        assert restarted.get(key) == "from the database"
+        assert restarted.hit_rate == 1.0
+
+    # Test that expired rows are ignored and purged
+    def test_expired_rows_ignored_and_purged(self):
+        key = unique_key()
+        db = SessionLocal()
+        db.add(TranscriptionCacheEntry(key=key, text="stale", created_at=malaysia_now() - timedelta(hours=2)))
+        db.commit()
+        db.close()
+
+        cache = TranscriptionCache(max_entries=0, ttl_seconds=3600, persist=True)
+        assert cache.get(key) is None
+        assert cache.purge_expired() >= 1
+
+        db = SessionLocal()
+        assert db.get(TranscriptionCacheEntry, key) is None
+        db.close()
+
+        # A fresh transcript for the same clip can be stored again
+        cache.put(key, "fresh")
+        assert cache.get(key) == "fresh"
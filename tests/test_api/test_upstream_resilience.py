@@ -0,0 +1,258 @@
+"""
+Test cases for retries and hedging of chat completion requests (upstream.py)
+"""
+
+import pytest
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from conftest import client, test_session_id, fake_openai
+from upstream import UpstreamPolicy, is_retryable, upstream
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class ScriptedUpstream:
+    """create() that fails, stalls or streams according to a script of one entry per call"""
+
+    def __init__(self, *script, words=("Hello", " there")):
+        self.script = list(script)
+        self.words = words
+        self.calls = 0
+        self.closed = []  # Call numbers whose stream was closed before it finished
+
+    def create(self):
+        self.calls += 1
+        step = self.script.pop(0) if self.script else 0.0
+        if isinstance(step, Exception):
+            raise step
+        return self.stream(self.calls, step)
+
+    def stream(self, call, first_token_delay):
+        finished = False
+        try:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))])
+            time.sleep(first_token_delay)
+            for word in self.words:
+                yield chunk(word)
+            finished = True
+        finally:
+            if not finished:
+                self.closed.append(call)
+
+
+def text(events):
+    return "".join(event.choices[0].delta.content or "" for event in events)
+
+
+def policy(**options):
+    return UpstreamPolicy(**{"max_attempts": 3, "backoff_base": 0.0, "hedge": False, "hedge_delay": 1.0, **options})
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+# Test retries before the first token
+class TestUpstreamRetries:
+
+    # Test which errors are worth another try
+    def test_retryable_errors(self):
+        assert is_retryable(Exception("Connection error."))
+        assert is_retryable(type("RateLimitError", (Exception,), {})("Error code: 429 - rate_limit_exceeded"))
+        assert is_retryable(SimpleNamespace(status_code=503))
+        assert not is_retryable(Exception("Error code: 429 - insufficient_quota"))
+        assert not is_retryable(Exception("This model's maximum context length is 16385 tokens"))
+        assert not is_retryable(type("BadRequestError", (Exception,), {"status_code": 400})("bad request"))
+
+    # Test that transient errors are retried until a stream opens
+    def test_retries_transient_errors(self):
+        fake = ScriptedUpstream(Exception("Connection error."), Exception("Request timed out."), 0.0)
+        events = policy().open_stream(fake.create)
+
+        assert text(events) == "Hello there"
+        assert fake.calls == 3
+
+    # Test that an error raised while waiting for the first token is retried too
+    def test_retries_error_before_first_token(self):
+        def broken():
+            yield chunk(None)
+            raise Exception("Connection error.")
+
+        fake = ScriptedUpstream()
+        calls = iter([broken, fake.create])
+        events = policy().open_stream(lambda: next(calls)())
+
+        assert text(events) == "Hello there"
+
+    # Test that fatal errors and the last failed attempt are raised
+    def test_gives_up(self):
+        quota = ScriptedUpstream(Exception("insufficient_quota"))
+        with pytest.raises(Exception, match="insufficient_quota"):
+            policy().open_stream(quota.create)
+        assert quota.calls == 1
+
+        down = ScriptedUpstream(*[Exception("Connection error.")] * 5)
+        with pytest.raises(Exception, match="Connection error"):
+            policy().open_stream(down.create)
+        assert down.calls == 3
+
+    # Test that the backoff is jittered and grows up to the cap
+    def test_backoff_is_jittered(self):
+        retries = policy(backoff_base=0.5, backoff_max=2.0)
+        waits = [retries.backoff(n) for n in range(6) for _ in range(50)]
+
+        assert all(0 <= wait <= 2.0 for wait in waits)
+        assert len(set(waits)) > 100
+        assert max(retries.backoff(0) for _ in range(50)) <= 0.5
+
+    # Test that a stop during the backoff ends the wait and starts no new request
+    def test_stop_during_backoff(self):
+        fake = ScriptedUpstream(Exception("Connection error."), 0.0)
+        stop_event = threading.Event()
+        stop_event.set()
+
+        assert list(policy(backoff_base=10).open_stream(fake.create, stop_event)) == [None]
+        assert fake.calls == 1
+
+    # Test that the backoff still waits when there is no stop event to wait on
+    def test_backoff_without_stop_event(self, monkeypatch):
+        retries = policy()
+        monkeypatch.setattr(retries, "backoff", lambda retry: 0.2)
+        fake = ScriptedUpstream(Exception("Connection error."), 0.0)
+        start = time.perf_counter()
+
+        assert text(retries.open_stream(fake.create)) == "Hello there"
+        assert time.perf_counter() - start >= 0.2
+
+    # Test that a stop while waiting for the first token ends the wait and closes the request
+    def test_stop_before_first_token(self):
+        fake = ScriptedUpstream(0.5)
+        stop_event = threading.Event()
+        threading.Timer(0.05, stop_event.set).start()
+        start = time.perf_counter()
+
+        assert list(policy().open_stream(fake.create, stop_event)) == [None]
+        assert time.perf_counter() - start < 0.3
+        assert fake.calls == 1
+        time.sleep(0.6)
+        assert fake.closed == [1]
+
+    # Test that a chat turn survives two failed attempts and is saved once
+    def test_chat_endpoint_retries(self, client, test_session_id, fake_openai, monkeypatch):
+        import api
+        failures = [Exception("Connection error."), type("InternalServerError", (Exception,), {"status_code": 502})("Bad gateway")]
+
+        def flaky(**kwargs):
+            if failures:
+                raise failures.pop(0)
+            return fake_openai.create(**kwargs)
+
+        monkeypatch.setattr(api.client.chat.completions, "create", flaky)
+        monkeypatch.setattr(upstream, "backoff_base", 0.0)
+        response = client.post("/chat/", json={"session_id": test_session_id, "message": "Hello"})
+
+        frames = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+        assert "".join(frame.get("token", "") for frame in frames) == "Stub reply from the fake model"
+        assert len(fake_openai.calls) == 1
+
+
+# Test hedged requests
+class TestUpstreamHedging:
+
+    # Test that a slow first token is raced by a hedge and the loser is closed
+    def test_hedge_wins_over_stalled_request(self):
+        fake = ScriptedUpstream(0.5, 0.0)
+        start = time.perf_counter()
+        events = policy(hedge=True, hedge_delay=0.05).open_stream(fake.create)
+        elapsed = time.perf_counter() - start
+
+        assert text(events) == "Hello there"
+        assert fake.calls == 2
+        assert elapsed < 0.3
+        time.sleep(0.6)
+        assert fake.closed == [1]
+
+    # Test that a stop during a hedged race closes both requests
+    def test_stop_closes_both_racers(self):
+        fake = ScriptedUpstream(0.5, 0.5)
+        stop_event = threading.Event()
+        threading.Timer(0.1, stop_event.set).start()
+        start = time.perf_counter()
+
+        assert list(policy(hedge=True, hedge_delay=0.02).open_stream(fake.create, stop_event)) == [None]
+        assert time.perf_counter() - start < 0.3
+        assert fake.calls == 2
+        time.sleep(0.6)
+        assert sorted(fake.closed) == [1, 2]
+
+    # Test that a fast request is not hedged
+    def test_fast_request_is_not_hedged(self):
+        fake = ScriptedUpstream(0.0)
+        assert text(policy(hedge=True, hedge_delay=0.2).open_stream(fake.create)) == "Hello there"
+        assert fake.calls == 1
+
+    # Test that the hedge threshold follows the p95 of recent first-token times
+    def test_threshold_is_p95(self):
+        hedging = policy(hedge=True, hedge_delay=3.0)
+        for ms in range(1, 20):
+            hedging.record_ttft(ms / 1000)
+        assert hedging.hedge_after() == 3.0
+
+        for ms in range(20, 101):
+            hedging.record_ttft(ms / 1000)
+        assert hedging.hedge_after() == pytest.approx(0.096)
+
+
+# Benchmark p99 time to first token with a fake provider that sometimes stalls
+class TestHedgingBenchmark:
+
+    # Test that hedging cuts the p99 time to first token for a slow tail
+    def test_p99_ttft(self):
+        def measure(hedge):
+            rng = random.Random(7)
+            # 95% of requests answer in 10-30 ms, 5% stall for 300 ms
+            delays = [0.3 if rng.random() < 0.05 else rng.uniform(0.01, 0.03) for _ in range(400)]
+            fake = ScriptedUpstream(*delays)
+            lock = threading.Lock()
+
+            def create():
+                with lock:
+                    return fake.create()
+
+            measured = policy(hedge=hedge, hedge_delay=0.06)
+
+            def turn(_):
+                start = time.perf_counter()
+                next(iter(measured.open_stream(create)))
+                return time.perf_counter() - start
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                ttfts = list(pool.map(turn, range(200)))
+            return ttfts, fake.calls
+
+        plain, plain_calls = measure(hedge=False)
+        hedged, hedged_calls = measure(hedge=True)
+        for name, ttfts, calls in [("no hedging", plain, plain_calls), ("hedging", hedged, hedged_calls)]:
+            print(f"⏱️ {name}: p50 {percentile(ttfts, 0.5) * 1000:.0f} ms, p99 {percentile(ttfts, 0.99) * 1000:.0f} ms, "
+                  f"{calls} requests for 200 turns")
+
+        assert percentile(hedged, 0.99) < percentile(plain, 0.99) / 2
+        assert hedged_calls <= 200 * 1.15
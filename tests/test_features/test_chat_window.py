@@ -0,0 +1,88 @@
+"""
+Test the virtualized chat window: older messages are unmounted and loaded back from the backend
+"""
+
+import pytest
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from datetime import timedelta
+from conftest import client, test_session_id
+from database import SessionLocal, ChatMessage, malaysia_now
+
+import main
+
+
+@pytest.fixture
+def backend(client, monkeypatch):
+    """Route the frontend's history requests to the FastAPI test client"""
+    def get(url, params=None, timeout=None):
+        return client.get(url[len(main.BASE_API_URL):], params=params)
+
+    monkeypatch.setattr(main.requests, "get", get)
+    monkeypatch.setattr(main, "CHAT_WINDOW_MESSAGES", 10)
+    monkeypatch.setattr(main, "CHAT_HISTORY_PAGE_SIZE", 8)
+    return client
+
+
+def seed_conversation(session_id, count):
+    """Store `count` messages and return them as Chatbot history"""
+    db = SessionLocal()
+    history = []
+    try:
+        start = malaysia_now()
+        for i in range(count):
+            role = "user" if i % 2 == 0 else "assistant"
+            db.add(ChatMessage(session_id=session_id, role=role, content=f"message {i}",
+                               created_at=start + timedelta(seconds=i)))
+            history.append({"role": role, "content": f"message {i}"})
+        db.commit()
+    finally:
+        db.close()
+    return history
+
+
+# Test the windowed Chatbot history
+class TestChatWindow:
+
+    # Test that a short conversation stays fully mounted without calling the backend
+    def test_short_history_is_untouched(self, backend, test_session_id, monkeypatch):
+        history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        monkeypatch.setattr(main.requests, "get", lambda *a, **k: pytest.fail("backend should not be called"))
+
+        mounted, cursor = main.window_history(history, test_session_id)
+        assert mounted is history
+        assert cursor is None
+
+    # Test that a long conversation is cut to the window and scrolling up restores it in order
+    def test_long_history_is_windowed_and_rehydrated(self, backend, test_session_id):
+        history = seed_conversation(test_session_id, 40)
+
+        mounted, cursor = main.window_history(list(history), test_session_id)
+        assert mounted == history[-10:]
+
+        # Scroll to the top until everything is mounted again
+        while cursor is not None:
+            mounted, cursor = main.load_earlier_messages(mounted, test_session_id, cursor)
+        assert mounted == history
+
+        # Nothing older: loading again changes nothing
+        assert main.load_earlier_messages(mounted, test_session_id, cursor) == (history, None)
+
+    # Test that a backend failure keeps the current history mounted
+    def test_backend_failure_keeps_history(self, backend, test_session_id, monkeypatch):
+        history = [{"role": "user", "content": f"message {i}"} for i in range(20)]
+
+        def failing_get(*args, **kwargs):
+            raise main.requests.exceptions.ConnectionError("backend down")
+
+        monkeypatch.setattr(main.requests, "get", failing_get)
+        assert main.window_history(history, test_session_id, 7) == (history, 7)
@@ -0,0 +1,58 @@
+"""
+Benchmark the edit-button MutationObserver in js/edit_user_messages.js (runs in jsdom)
+"""
+
+import pytest
+import json
+import shutil
+import subprocess
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+JS_BENCH_DIR = os.path.join(tests_dir, "js")
+
+# Manual: needs node and `npm install` in tests/js, then `pytest --run-manual`
+pytestmark = pytest.mark.manual
+
+
+@pytest.fixture(autouse=True)
+def jsdom():
+    """Fail, rather than skip, when the benchmark was asked for but cannot run"""
+    if shutil.which("node") is None or not os.path.isdir(os.path.join(JS_BENCH_DIR, "node_modules", "jsdom")):
+        pytest.fail("node and jsdom are required (cd tests/js && npm install)")
+
+
+def run_bench(script):
+    result = subprocess.run(
+        ["node", os.path.join(JS_BENCH_DIR, script)],
+        cwd=JS_BENCH_DIR,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Test the per-mutation cost of the edit-button observer
+class TestEditObserverBenchmark:
+
+    # Test that the observer cost per streamed token stays flat as the chat grows
+    def test_observer_cost_is_flat(self):
+        results = run_bench("bench_edit_observer.js")
+        for row in results:
+            print(f"⏱️ {row['pairs']} message pairs: {row['us_per_batch']:.1f} µs per mutation batch")
+
+        smallest, largest = results[0], results[-1]
+        # Every chat still gets exactly one edit button
+        assert all(row["edit_buttons"] == 1 for row in results)
+        # 50x more messages must not make each streamed token noticeably more expensive
+        assert largest["us_per_batch"] <= 3 * smallest["us_per_batch"] + 20
@@ -0,0 +1,57 @@
+"""
+Check the work the edit-button MutationObserver in js/edit_user_messages.js does as the chat grows
+(runs under plain node on the minimal DOM in tests/js/minidom.js, no npm install)
+"""
+
+import pytest
+import json
+import shutil
+import subprocess
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+JS_CHECK_DIR = os.path.join(tests_dir, "js")
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+@pytest.fixture(scope="module")
+def results():
+    result = subprocess.run(
+        ["node", os.path.join(JS_CHECK_DIR, "check_edit_observer.js")],
+        cwd=JS_CHECK_DIR,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Test the elements the observer examines per mutation, for chats of 10 to 500 message pairs
+class TestEditObserverWork:
+
+    # Test that the button is on the newest user message only, also after a new turn and after loading earlier messages
+    def test_button_on_latest_user_message(self, results):
+        assert all(row["button_on_latest"] for row in results)
+
+    # Test that a streamed token costs the same whatever the size of the chat
+    def test_streamed_token_cost_is_flat(self, results):
+        for row in results:
+            print(f"🔍 {row['pairs']} message pairs: {row['visited_per_token']} elements examined per streamed token")
+        assert len({row["visited_per_token"] for row in results}) == 1
+
+    # Test that a new turn only looks at the added nodes, not at every user message in the chat
+    def test_new_turn_cost_is_flat(self, results):
+        for row in results:
+            print(f"🔍 {row['pairs']} message pairs: {row['visited_per_new_turn']} elements examined for a new turn")
+        assert len({row["visited_per_new_turn"] for row in results}) == 1
+        assert results[0]["visited_per_new_turn"] < results[0]["pairs"]
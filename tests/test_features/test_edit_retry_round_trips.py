@@ -0,0 +1,164 @@
+"""
+Test that edit and retry mutate the database in a single transaction with few round trips
+"""
+
+import pytest
+import time
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from datetime import timedelta
+from sqlalchemy import event
+from conftest import client, temp_db, test_session_id, fake_openai
+from database import (
+    ChatMessage, SessionLocal, engine, malaysia_now, edit_last_user_message, delete_last_assistant_message,
+)
+from message_writer import MessageWriter, message_writer
+
+# Simulated network latency added to every statement
+INJECTED_LATENCY = 0.02
+
+
+def seed_conversation(session_factory, session_id):
+    """Store a two-turn conversation with strictly increasing timestamps"""
+    db = session_factory()
+    try:
+        start = malaysia_now()
+        for i, (role, content) in enumerate([
+            ("user", "first question"),
+            ("assistant", "first answer"),
+            ("user", "second question"),
+            ("assistant", "second answer"),
+        ]):
+            db.add(ChatMessage(session_id=session_id, role=role, content=content,
+                               created_at=start + timedelta(seconds=i)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def inject_latency(session_factory):
+    """Delay every statement and record it, returning the list of executed statements"""
+    statements = []
+    engine = session_factory.kw["bind"]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def delay(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+        time.sleep(INJECTED_LATENCY)
+
+    return statements
+
+
+@pytest.fixture
+def endpoint_statements(client, monkeypatch):
+    """
+    Post to an endpoint and return the statements it ran on the shared engine. The shared
+    write-behind queue is drained and swapped for one that only flushes when closed, so
+    background batches and purges are not counted against the request.
+    """
+    import api
+    message_writer.close()
+    writer = MessageWriter(SessionLocal, flush_interval=3600)
+    monkeypatch.setattr(api, "message_writer", writer)
+
+    def measure(path, session_id, message):
+        writer.flush()  # Replies queued by earlier requests are not this request's writes
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.post(path, json={"session_id": session_id, "message": message})
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert response.status_code == 200
+        assert "error" not in response.text
+        return [s for s in statements if s.split()[0].upper() in ("INSERT", "UPDATE", "DELETE", "SELECT", "WITH")]
+
+    yield measure
+    writer.close()
+    message_writer.open()
+
+
+# Test the round trips spent before the model call for edit and retry
+class TestEditRetryRoundTrips:
+
+    # Test that edit updates the last user message, deletes the last reply and returns the context
+    def test_edit_is_single_transaction(self, temp_db, test_session_id):
+        TestSessionLocal, _ = temp_db
+        seed_conversation(TestSessionLocal, test_session_id)
+        statements = inject_latency(TestSessionLocal)
+
+        db = TestSessionLocal()
+        try:
+            start = time.perf_counter()
+            result = edit_last_user_message(db, test_session_id, "second question, edited")
+            elapsed = time.perf_counter() - start
+        finally:
+            db.close()
+
+        assert result["messages"] == [
+            {"role": "user", "content": "first question"},
+            {"role": "assistant", "content": "first answer"},
+            {"role": "user", "content": "second question, edited"},
+        ]
+        assert result["assistant_id"] is not None
+        # UPDATE ... RETURNING, DELETE ... RETURNING and SELECT (one statement on Postgres)
+        dml = [s for s in statements if s.split()[0].upper() in ("UPDATE", "DELETE", "SELECT", "WITH")]
+        assert len(dml) <= 3, f"Edit should need at most 3 statements before the model call, got {len(dml)}"
+        print(f"⏱️ Edit pre-TTFT DB time with {INJECTED_LATENCY * 1000:.0f} ms latency: {elapsed * 1000:.0f} ms")
+
+    # Test that retry deletes the last reply and returns the context in one transaction
+    def test_retry_is_single_transaction(self, temp_db, test_session_id):
+        TestSessionLocal, _ = temp_db
+        seed_conversation(TestSessionLocal, test_session_id)
+        statements = inject_latency(TestSessionLocal)
+
+        db = TestSessionLocal()
+        try:
+            result = delete_last_assistant_message(db, test_session_id)
+        finally:
+            db.close()
+
+        assert result["messages"] == [
+            {"role": "user", "content": "first question"},
+            {"role": "assistant", "content": "first answer"},
+            {"role": "user", "content": "second question"},
+        ]
+        dml = [s for s in statements if s.split()[0].upper() in ("UPDATE", "DELETE", "SELECT", "WITH")]
+        assert len(dml) <= 2, f"Retry should need at most 2 statements before the model call, got {len(dml)}"
+
+    # Test that nothing is changed when there is no user message to edit
+    def test_edit_without_user_message_changes_nothing(self, temp_db, test_session_id):
+        TestSessionLocal, _ = temp_db
+
+        db = TestSessionLocal()
+        try:
+            assert edit_last_user_message(db, test_session_id, "edited") is None
+            assert delete_last_assistant_message(db, test_session_id) is None
+            assert db.query(ChatMessage).filter(ChatMessage.session_id == test_session_id).count() == 0
+        finally:
+            db.close()
+
+    # Test that /chat/edit/ itself runs only the edit statements before the model call
+    # (no separate read of the last turn), and an unchanged edit fewer still
+    def test_edit_endpoint_statement_count(self, client, test_session_id, fake_openai, endpoint_statements):
+        client.post("/chat/", json={"session_id": test_session_id, "message": "Tell me a joke"})
+
+        edited = endpoint_statements("/chat/edit/", test_session_id, "Tell me a story")
+        assert len(edited) <= 3, f"Edit should need at most 3 statements, got {len(edited)}: {edited}"
+
+        unchanged = endpoint_statements("/chat/edit/", test_session_id, "Tell me a story")
+        assert len(unchanged) <= 2, f"An unchanged edit should need at most 2 statements, got {len(unchanged)}: {unchanged}"
+        assert len(fake_openai.calls) == 2
@@ -0,0 +1,92 @@
+"""
+Test that the mic and stop scripts are event driven (no polling or always-on observers)
+"""
+
+import pytest
+import json
+import re
+import shutil
+import subprocess
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+JS_DIR = os.path.join(project_root, "js")
+JS_BENCH_DIR = os.path.join(tests_dir, "js")
+
+SCRIPTS = ["mic_recording.js", "stop_messages.js"]
+STREAM_EVENTS = {"chattie:stream-start", "chattie:stream-end"}
+# DOM events the scripts react to: user input, the recorder finishing and the page-level error handler
+USER_EVENTS = {"click", "input", "keydown", "stop", "unhandledrejection"}
+
+requires_node = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+def read_js(name):
+    with open(os.path.join(JS_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def subscribed_events(source):
+    """Event types passed to addEventListener, with string constants resolved"""
+    constants = dict(re.findall(r"const\s+(\w+)\s*=\s*'([^']*)'", source))
+    events = set()
+    for argument in re.findall(r"addEventListener\(\s*([^,\s]+)\s*,", source):
+        events.add(argument.strip("'\"") if argument[0] in "'\"" else constants.get(argument, argument))
+    return events
+
+
+# Test the event-driven mic and stop button scripts
+class TestEventDrivenScripts:
+
+    # Test that neither script polls the DOM with setInterval or an animation-frame loop
+    def test_scripts_do_not_poll(self):
+        for name in SCRIPTS:
+            source = read_js(name)
+            assert "setInterval(" not in source, f"{name} should not poll with setInterval"
+            assert "requestAnimationFrame(" not in source, f"{name} should not poll with requestAnimationFrame"
+
+    # Test that the scripts only subscribe to the stream events and to user input
+    def test_scripts_only_subscribe_to_stream_events(self):
+        subscribed = set()
+        for name in SCRIPTS:
+            source = read_js(name)
+            events = subscribed_events(source)
+            assert events <= USER_EVENTS | STREAM_EVENTS, f"{name} subscribes to {sorted(events - USER_EVENTS - STREAM_EVENTS)}"
+            assert set(re.findall(r"chattie:[\w-]+", source)) <= STREAM_EVENTS
+            subscribed |= events
+        assert STREAM_EVENTS <= subscribed
+
+    # Test that every streaming handler in the UI announces the end of its stream
+    def test_streaming_handlers_dispatch_stream_end(self):
+        with open(os.path.join(project_root, "main.py"), "r", encoding="utf-8") as f:
+            source = f.read()
+        handlers = re.findall(r"fn=(submit_and_respond_welcome|submit_and_respond_chat|retry_last_response)", source)
+        assert len(handlers) == 5
+        assert source.count(".then(fn=None, js=STREAM_END_JS") == len(handlers)
+        assert "chattie:stream-end" in read_js("edit_user_messages.js")
+
+    # Test that an idle page runs no timers and observers only run during a stream
+    @requires_node
+    def test_idle_page_does_no_dom_work(self):
+        result = subprocess.run(
+            ["node", os.path.join(JS_BENCH_DIR, "idle_work.js")],
+            cwd=JS_BENCH_DIR,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        assert result.returncode == 0, result.stderr
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+
+        assert report["idle"] == {"timer_callbacks": 0, "intervals": 0, "observers": 0}
+        assert report["streaming"]["stop_mode"] is True
+        assert report["streaming"]["observers"] > 0
+        assert report["ended"] == {"observers": 0, "stop_mode": False}
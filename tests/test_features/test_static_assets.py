@@ -0,0 +1,120 @@
+"""
+Test cases for the content-hashed frontend asset bundle
+"""
+
+import pytest
+import json
+import shutil
+import subprocess
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from main import BASE_API_URL
+from static_assets import build, load_manifest, page_weight, scope_css, ImmutableStaticFiles, IMMUTABLE_CACHE_CONTROL
+
+JS_CHECK_DIR = os.path.join(tests_dir, "js")
+
+# Runs js/chat_socket.js on the vendored minimal DOM after the session id was set,
+# as when the bundle loads after sessionIdReady, and prints the sockets it opened
+LATE_LOAD_CHECK = """
+const fs = require('fs');
+const vm = require('vm');
+const { createWindow } = require('./minidom');
+const { window } = createWindow();
+const opened = [];
+window.WebSocket = class { constructor(url) { opened.push(url); } close() {} };
+window.WebSocket.OPEN = 1;
+window.TextEncoder = TextEncoder;
+window.__SESSION_ID__ = 'session-1';
+vm.createContext(window);
+vm.runInContext(fs.readFileSync(process.argv[1], 'utf8').replace(/__API_BASE_URL__/g, 'http://backend'), window);
+console.log(JSON.stringify(opened));
+"""
+
+
+# Test the asset build step and how the bundle is served
+class TestStaticAssets:
+
+    # Test that the build writes content-hashed files and a manifest pointing at them
+    def test_build_writes_hashed_bundle(self, tmp_path):
+        manifest = build(str(tmp_path))
+
+        assert manifest == load_manifest(str(tmp_path))
+        assert manifest["css"].startswith("app.") and manifest["css"].endswith(".css")
+        assert manifest["js"].startswith("app.") and manifest["js"].endswith(".js")
+        assert (tmp_path / manifest["css"]).exists()
+        assert (tmp_path / manifest["js"]).exists()
+
+        # Same sources give the same names, so browsers keep their cached copy across deploys
+        assert build(str(tmp_path)) == manifest
+
+    # Test that the backend URL is read at runtime instead of being baked into the bundle
+    def test_bundle_does_not_embed_api_url(self, tmp_path):
+        manifest = build(str(tmp_path))
+        js = (tmp_path / manifest["js"]).read_text(encoding="utf-8")
+
+        assert BASE_API_URL not in js
+        assert "window.__API_BASE_URL__" in js
+
+    # Test that the bundle is smaller than the inlined assets and repeat visits skip it
+    def test_bundle_reduces_page_weight(self, tmp_path):
+        weight = page_weight(build(str(tmp_path)), str(tmp_path))
+        print(f"📦 Page weight: {json.dumps(weight)}")
+
+        assert weight["bundle_first_visit"]["gzip_bytes"] < weight["inline_every_visit"]["gzip_bytes"]
+        assert weight["bundle_repeat_visit"]["bytes"] < 1024
+
+    # Test that css rules keep Gradio's scoped copy and at-rules are not duplicated
+    def test_scope_css(self):
+        css = scope_css("a,b{color:red}@keyframes k{0%{opacity:0}100%{opacity:1}}")
+
+        assert css == (
+            "a,b{color:red}"
+            ".gradio-container .contain a,.gradio-container .contain b{color:red}"
+            "@keyframes k{0%{opacity:0}100%{opacity:1}}"
+        )
+
+    # Test that rules inside @media and @supports blocks are scoped too, and the block is kept once
+    def test_scope_css_in_grouping_at_rules(self):
+        css = scope_css("@media (max-width:600px){a{color:red}@supports (display:grid){b{display:grid}}}")
+
+        assert css == (
+            "@media (max-width:600px){"
+            "a{color:red}"
+            ".gradio-container .contain a{color:red}"
+            "@supports (display:grid){b{display:grid}.gradio-container .contain b{display:grid}}"
+            "}"
+        )
+
+    # Test that bundle files are served with long-lived immutable cache headers
+    def test_bundle_is_served_immutable(self, tmp_path):
+        manifest = build(str(tmp_path))
+        app = FastAPI()
+        app.mount("/bundle", ImmutableStaticFiles(directory=str(tmp_path)), name="bundle")
+
+        response = TestClient(app).get(f"/bundle/{manifest['css']}")
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    # Test that the socket script connects when it loads after the session id was announced
+    @pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+    def test_socket_connects_when_loaded_after_session_id(self):
+        result = subprocess.run(
+            ["node", "-e", LATE_LOAD_CHECK, os.path.join(project_root, "js", "chat_socket.js")],
+            cwd=JS_CHECK_DIR,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        assert result.returncode == 0, result.stderr
+        assert json.loads(result.stdout) == ["ws://backend/ws/chat/session-1"]
@@ -0,0 +1,165 @@
+"""
+Test cases for write-behind persistence of assistant messages
+"""
+
+import pytest
+import time
+import sys
+import os
+
+# Add project root and tests directory to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+tests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tests_dir not in sys.path:
+    sys.path.insert(0, tests_dir)
+
+from sqlalchemy import event
+from conftest import temp_db, test_session_id
+from database import ChatMessage
+from message_writer import MessageWriter
+
+
+def count_inserts(session_factory):
+    """Attach a listener that records every INSERT statement sent to the database"""
+    statements = []
+    engine = session_factory.kw["bind"]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT"):
+            statements.append(statement)
+
+    return statements
+
+
+# Test the bounded write-behind queue used for assistant replies
+class TestWriteBehind:
+
+    # Test that rows from several sessions are written with a single multi-row INSERT on flush
+    def test_flush_batches_rows_into_one_insert(self, temp_db):
+        TestSessionLocal, _ = temp_db
+        inserts = count_inserts(TestSessionLocal)
+        writer = MessageWriter(TestSessionLocal, max_queue=100, batch_size=100, flush_interval=60)
+
+        for i in range(10):
+            writer.enqueue(f"session-{i % 3}", "assistant", f"reply {i}")
+        assert writer.depth == 10
+
+        writer.flush()
+
+        assert writer.depth == 0
+        assert len(inserts) == 1, "Queued rows should be written with one multi-row INSERT"
+        db = TestSessionLocal()
+        try:
+            assert db.query(ChatMessage).count() == 10
+        finally:
+            db.close()
+        writer.close()
+
+    # Test that the background thread flushes once the batch size is reached
+    def test_background_flush_on_batch_size(self, temp_db):
+        TestSessionLocal, _ = temp_db
+        writer = MessageWriter(TestSessionLocal, max_queue=100, batch_size=5, flush_interval=60)
+
+        for i in range(5):
+            writer.enqueue("session", "assistant", f"reply {i}")
+
+        deadline = time.time() + 5
+        while writer.depth and time.time() < deadline:
+            time.sleep(0.01)
+        assert writer.depth == 0, "Batch should be flushed without waiting for the flush interval"
+        writer.close()
+
+    # Test that the background thread flushes a partial batch after the flush interval
+    def test_background_flush_on_interval(self, temp_db):
+        TestSessionLocal, _ = temp_db
+        writer = MessageWriter(TestSessionLocal, max_queue=100, batch_size=100, flush_interval=0.05)
+
+        writer.enqueue("session", "assistant", "only reply")
+
+        deadline = time.time() + 5
+        while writer.depth and time.time() < deadline:
+            time.sleep(0.01)
+        assert writer.depth == 0, "Partial batch should be flushed after the flush interval"
+        writer.close()
+
+    # Test that close() drains everything still queued
+    def test_close_drains_queue(self, temp_db, test_session_id):
+        TestSessionLocal, _ = temp_db
+        writer = MessageWriter(TestSessionLocal, max_queue=100, batch_size=100, flush_interval=60)
+
+        writer.enqueue(test_session_id, "assistant", "first")
+        writer.enqueue(test_session_id, "assistant", "second")
+        writer.close()
+
+        db = TestSessionLocal()
+        try:
+            contents = [
+                m.content for m in db.query(ChatMessage)
+                .filter(ChatMessage.session_id == test_session_id)
+                .order_by(ChatMessage.created_at)
+                .all()
+            ]
+        finally:
+            db.close()
+        assert contents == ["first", "second"]
+
+    # Test that a full queue falls back to a synchronous write instead of dropping the message
+    def test_full_queue_writes_synchronously(self, temp_db, test_session_id):
+        TestSessionLocal, _ = temp_db
+        writer = MessageWriter(TestSessionLocal, max_queue=1, batch_size=100, flush_interval=60)
+
+        writer.enqueue(test_session_id, "assistant", "queued")
+        writer.enqueue(test_session_id, "assistant", "overflow")
+
+        db = TestSessionLocal()
+        try:
+            saved = db.query(ChatMessage).filter(ChatMessage.session_id == test_session_id).all()
+            assert [m.content for m in saved] == ["overflow"]
+        finally:
+            db.close()
+        assert writer.depth == 1
+        writer.close()
+
+    # Test that a reader takes only its own session's queued rows, in its own transaction
+    def test_write_session_moves_only_that_session(self, temp_db, test_session_id):
+        TestSessionLocal, _ = temp_db
+        writer = MessageWriter(TestSessionLocal, max_queue=100, batch_size=100, flush_interval=60)
+        writer.enqueue(test_session_id, "assistant", "mine")
+        writer.enqueue("other-session", "assistant", "theirs")
+
+        db = TestSessionLocal()
+        try:
+            writer.write_session(test_session_id, db)
+            seen = [m.content for m in db.query(ChatMessage).all()]
+            db.commit()
+        finally:
+            db.close()
+
+        assert seen == ["mine"]
+        assert writer.depth == 1, "Other sessions' rows stay queued"
+        writer.close()
+
+    # Test that rows taken by a transaction that is rolled back are queued again
+    def test_write_session_rollback_requeues(self, temp_db, test_session_id):
+        TestSessionLocal, _ = temp_db
+        writer = MessageWriter(TestSessionLocal, max_queue=100, batch_size=100, flush_interval=60)
+        writer.enqueue(test_session_id, "assistant", "reply")
+
+        db = TestSessionLocal()
+        try:
+            writer.write_session(test_session_id, db)
+            assert writer.depth == 0
+            db.rollback()
+        finally:
+            db.close()
+
+        assert writer.depth == 1
+        writer.close()
+        db = TestSessionLocal()
+        try:
+            assert [m.content for m in db.query(ChatMessage).all()] == ["reply"]
+        finally:
+            db.close()
@@ -0,0 +1,156 @@
+"""
+Content-addressed cache for speech-to-text results.
+
+Transcripts are keyed by the model name and a SHA-256 of the audio bytes sent
+to Whisper (after normalization), so re-submitting the same clip does not
+cost another Whisper call. Entries live in an in-process LRU and, with
+TRANSCRIPTION_CACHE_DB=true, in the transcription_cache table so they survive
+restarts and are shared between workers. Both honour TRANSCRIPTION_CACHE_TTL.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from database import SessionLocal, TranscriptionCacheEntry, malaysia_now
+from env import TRANSCRIPTION_CACHE_SIZE, TRANSCRIPTION_CACHE_TTL, TRANSCRIPTION_CACHE_DB
+
+
+def cache_key(audio: bytes, model: str) -> str:
+    """Cache key for one clip transcribed with one model"""
+    return f"{model}:{hashlib.sha256(audio).hexdigest()}"
+
+
+class TranscriptionCache:
+    """LRU of transcripts with a TTL, optionally backed by the transcription_cache table"""
+
+    def __init__(self, max_entries: int = TRANSCRIPTION_CACHE_SIZE, ttl_seconds: int = TRANSCRIPTION_CACHE_TTL,
+                 persist: bool = TRANSCRIPTION_CACHE_DB, session_factory=SessionLocal):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.session_factory = session_factory
+
+        self._entries = OrderedDict()  # key -> (text, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.persist
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached transcript for key, or None (counted as a hit or a miss)"""
+        text = self._get_memory(key)
+        if text is None and self.persist:
+            text = self._get_db(key)
+            if text is not None:
+                self._put_memory(key, text)
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.inc("speech.cache.misses" if text is None else "speech.cache.hits")
+        return text
+
+    def put(self, key: str, text: str):
+        """Store a transcript (empty transcripts are not cached)"""
+        if not text:
+            return
+        self._put_memory(key, text)
+        if self.persist:
+            self._put_db(key, text)
+
+    def clear(self):
+        """Drop the in-memory entries and statistics (persisted rows are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            text, stored_at = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def _put_memory(self, key: str, text: str):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (text, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_db(self, key: str) -> Optional[str]:
+        db = self.session_factory()
+        try:
+            cutoff = malaysia_now() - timedelta(seconds=self.ttl_seconds)
+            return db.execute(
+                select(TranscriptionCacheEntry.text)
+                .where(TranscriptionCacheEntry.key == key, TranscriptionCacheEntry.created_at >= cutoff)
+            ).scalar_one_or_none()
+        except Exception as e:
+            print(f"⚠️ Transcription cache lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _put_db(self, key: str, text: str):
+        db = self.session_factory()
+        try:
+            # Replace an expired row for the same clip
+            db.execute(delete(TranscriptionCacheEntry).where(TranscriptionCacheEntry.key == key))
+            db.add(TranscriptionCacheEntry(key=key, text=text))
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same clip first
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Transcription cache write failed: {e}")
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        """Delete persisted entries older than the TTL, returning how many were removed"""
+        db = self.session_factory()
+        try:
+            cutoff = malaysia_now() - timedelta(seconds=self.ttl_seconds)
+            result = db.execute(delete(TranscriptionCacheEntry).where(TranscriptionCacheEntry.created_at < cutoff))
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+
+# Shared instance used by /speech-to-text/
+transcription_cache = TranscriptionCache()
+
+metrics.set_gauge("speech.cache.hit_rate", lambda: transcription_cache.hit_rate)
+metrics.set_gauge("speech.cache.entries", lambda: len(transcription_cache))
@@ -0,0 +1,229 @@
+"""
+Retries and hedging for chat completion requests, up to the first token.
+
+Until the first token has been sent to the client, a failed or stalled
+completion can be replaced without the user noticing. open_stream() starts
+the completion and reads it up to its first content chunk:
+
+  * Retryable errors (connection errors, timeouts, 429 rate limits, 5xx) are
+    tried again, at most UPSTREAM_MAX_ATTEMPTS times in all, after a
+    "full jitter" backoff: a random wait up to UPSTREAM_BACKOFF_BASE * 2**n
+    seconds (capped by UPSTREAM_BACKOFF_MAX), so clients that failed
+    together do not retry together. Errors such as an over-long context or
+    an exhausted quota are raised at once.
+  * With UPSTREAM_HEDGE=true, a second identical request is sent when no
+    first token has arrived after the p95 of recent first-token times
+    (UPSTREAM_HEDGE_DELAY until enough are known). Whichever produces a token
+    first is streamed; the other is closed. This costs about 5% more requests
+    and removes most of the slow tail.
+
+The first token is read in a reader thread, so a stop (the caller's
+stop_event) ends the wait, and the backoff, at once and closes the requests.
+Once a token has been streamed, errors are the caller's to handle as before.
+"""
+
+import queue
+import random
+import threading
+import time
+from collections import deque
+from itertools import chain
+from typing import Callable, Iterator, Optional
+
+import metrics
+from env import UPSTREAM_MAX_ATTEMPTS, UPSTREAM_BACKOFF_BASE, UPSTREAM_BACKOFF_MAX, UPSTREAM_HEDGE, UPSTREAM_HEDGE_DELAY
+
+# OpenAI SDK (and builtin) exceptions worth another try
+RETRYABLE_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ConnectionError", "TimeoutError",
+}
+RETRYABLE_HINTS = ("connection error", "timed out", "timeout", "rate_limit", "rate limit", "overloaded", "server error")
+FATAL_HINTS = ("insufficient_quota", "context_length_exceeded", "maximum context length")
+
+# Recent first-token times kept for the hedging threshold, and how many are needed to use them
+TTFT_WINDOW = 200
+TTFT_MIN_SAMPLES = 20
+
+# Seconds between checks of the caller's stop event while waiting for a first token
+STOP_POLL_INTERVAL = 0.05
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether another attempt may succeed where this one failed"""
+    message = str(error).lower()
+    if any(hint in message for hint in FATAL_HINTS):
+        return False
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS or any(hint in message for hint in RETRYABLE_HINTS)
+
+
+def has_content(event) -> bool:
+    choices = getattr(event, "choices", None)
+    return bool(choices and choices[0].delta and choices[0].delta.content)
+
+
+def close_stream(stream):
+    """Close an abandoned completion so its connection is released"""
+    try:
+        stream.close()
+    except Exception:
+        # e.g. a generator that is still running in its reader thread; it closes itself there
+        pass
+
+
+class _Racer:
+    """One request of an attempt, read up to its first token in its own thread"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stream = None
+        self.abandoned = False
+
+
+class UpstreamPolicy:
+    """Bounded retries with jittered backoff, and optional hedging, before the first token"""
+
+    def __init__(self, max_attempts: int = UPSTREAM_MAX_ATTEMPTS, backoff_base: float = UPSTREAM_BACKOFF_BASE,
+                 backoff_max: float = UPSTREAM_BACKOFF_MAX, hedge: bool = UPSTREAM_HEDGE,
+                 hedge_delay: float = UPSTREAM_HEDGE_DELAY):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self._ttfts = deque(maxlen=TTFT_WINDOW)
+        self._lock = threading.Lock()
+
+    def backoff(self, retry: int) -> float:
+        """Seconds to wait before retry number `retry` (0-based): full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    def hedge_after(self) -> float:
+        """Seconds without a first token before a hedge is sent: the p95 of recent first-token times"""
+        with self._lock:
+            samples = sorted(self._ttfts)
+        if len(samples) < TTFT_MIN_SAMPLES:
+            return self.hedge_delay
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def record_ttft(self, seconds: float):
+        with self._lock:
+            self._ttfts.append(seconds)
+        metrics.observe("upstream.ttft_seconds", seconds)
+
+    def open_stream(self, create: Callable[[], Iterator], stop_event: Optional[threading.Event] = None) -> Iterator:
+        """
+        Call create() and return its events once the first token has arrived (or the stream
+        ended without one). Raises the last error when no attempt succeeds.
+        """
+        start = time.perf_counter()
+        for attempt in range(self.max_attempts):
+            if attempt:
+                delay = self.backoff(attempt - 1)
+                metrics.inc("upstream.retries")
+                print(f"🔁 Upstream attempt {attempt + 1}/{self.max_attempts} in {delay * 1000:.0f} ms "
+                      f"after: {last_error}")
+                if stop_event is None:
+                    time.sleep(delay)
+                elif stop_event.wait(delay):
+                    # The caller's loop checks its stop event before it looks at an event
+                    return iter([None])
+            try:
+                events, stream = self._race(create, stop_event)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    metrics.inc("upstream.failures")
+                    raise
+                last_error = e
+                continue
+            if events is None:
+                # Stopped while waiting for the first token; the requests have been closed
+                return iter([None])
+            self.record_ttft(time.perf_counter() - start)
+            return chain(events, stream)
+
+    def _first_token(self, create: Callable[[], Iterator], racer: Optional[_Racer] = None):
+        """Read up to and including the first event with content: (events read, rest of the stream)"""
+        response = create()
+        if racer is not None:
+            racer.stream = response  # Closed through the object create() returned
+        stream = iter(response)
+        events = []
+        for event in stream:
+            events.append(event)
+            if has_content(event):
+                break
+        return events, stream
+
+    def _race(self, create: Callable[[], Iterator], stop_event: Optional[threading.Event] = None):
+        """
+        Read the request up to its first token in a reader thread and, with hedging, race it
+        against a second request once it is slow; the first to produce a token wins. Returns
+        (None, None) when stop_event is set before then.
+        """
+        results = queue.Queue()
+
+        def run(racer: _Racer):
+            try:
+                events, stream = self._first_token(create, racer)
+                results.put((racer, events, stream, None))
+            except Exception as e:
+                results.put((racer, None, None, e))
+            # The loser closes its own stream once it gets here
+            if racer.abandoned and racer.stream is not None:
+                close_stream(racer.stream)
+
+        def launch(name: str) -> _Racer:
+            racer = _Racer(name)
+            racers.append(racer)
+            threading.Thread(target=run, args=(racer,), name=f"upstream-{name}", daemon=True).start()
+            return racer
+
+        def abandon(winner: Optional[_Racer] = None):
+            for other in racers:
+                if other is not winner:
+                    other.abandoned = True
+                    if other.stream is not None:
+                        close_stream(other.stream)
+
+        racers = []
+        launch("primary")
+        hedge_at = time.monotonic() + self.hedge_after() if self.hedge else None
+        error = None
+        finished = 0
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                abandon()
+                metrics.inc("upstream.stopped_before_first_token")
+                return None, None
+            hedging_allowed = hedge_at is not None and len(racers) == 1 and error is None
+            timeout = STOP_POLL_INTERVAL if stop_event is not None else None
+            if hedging_allowed:
+                until_hedge = max(0.0, hedge_at - time.monotonic())
+                timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+            try:
+                racer, events, stream, failure = results.get(timeout=timeout)
+            except queue.Empty:
+                if hedging_allowed and time.monotonic() >= hedge_at:
+                    metrics.inc("upstream.hedges")
+                    print("🪃 No first token yet, sending a hedged request")
+                    launch("hedge")
+                continue
+            finished += 1
+            if failure is None:
+                abandon(racer)
+                if racer.name == "hedge":
+                    metrics.inc("upstream.hedge_wins")
+                return events, stream
+            error = failure
+            if finished == len(racers):
+                raise error
+
+
+# Shared policy used by the chat streams
+upstream = UpstreamPolicy()
+
+metrics.set_gauge("upstream.hedge_after_seconds", lambda: upstream.hedge_after() if upstream.hedge else None)